@@ -8,59 +8,178 @@ import logging
 import types
 from collections import deque
 
-from overton.elasticsearch import Polindex, Speech, Person, Kw
+from elasticsearch import helpers
+from twisted.internet import task
+
+from overton.elasticsearch import Polindex, Speech, Person, Kw, speech_id
 
 
 class PoliscrapPipeline:
+    """
+    Indexes scraped speeches in ElasticSearch, by bulks.
+    The id of a speech is derived from its URL: an already indexed URL is left unchanged, unless the item has
+    the "update" flag, in which case the indexed speech is replaced. Speeches indexed with random ids by previous
+    versions are found by URL (see resolve_legacy).
+    """
+    def __init__(self, bulk_size=500, flush_interval=5.0, stats=None, legacy_ids=True):
+        """
+        :param bulk_size: speeches are sent to ElasticSearch when bulk_size of them are waiting...
+        :param flush_interval: ...or every flush_interval seconds
+        :param stats: the crawler stats
+        :param legacy_ids: if True, speeches indexed with random ids (before ids were derived from URLs) are looked up
+        by URL, so that they are neither indexed twice nor left next to their update
+        """
+        self.bulk_size = bulk_size
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self.legacy_ids = legacy_ids
+        self.actions = []
+        self.flush_loop = None
+
     @classmethod
     def from_crawler(cls, crawler):
-        ext = cls()
+        ext = cls(bulk_size=crawler.settings.getint("ELASTICSEARCH_BULK_SIZE", 500),
+                  flush_interval=crawler.settings.getfloat("ELASTICSEARCH_FLUSH_INTERVAL", 5.0),
+                  stats=crawler.stats,
+                  legacy_ids=crawler.settings.getbool("ELASTICSEARCH_LEGACY_IDS", True))
         Polindex.connect(servers=crawler.settings.get('ELASTICSEARCH_SERVERS', 'localhost'),
                          port=crawler.settings.get("ELASTICSEARCH_PORT", 8881),
                          username=crawler.settings["ELASTICSEARCH_USERNAME"],
                          password=crawler.settings["ELASTICSEARCH_PASSWORD"])
         return ext
 
+    def open_spider(self, spider):
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider):
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush()
+        if self.actions:
+            logging.error("%d speeches could not be sent to ElasticSearch", len(self.actions))
+            self.inc_stats("failed", len(self.actions))
+
     def process_item(self, item, spider):
         if isinstance(item, types.GeneratorType) or isinstance(item, list):
             for each in item:
                 self.process_item(each, spider)
         else:
             self.index_item(item)
-            logging.debug('Item sent to Elastic Search %s' % item.get('url'))
+            logging.debug('Item queued for Elastic Search %s' % item.get('url'))
             return item
 
     def index_item(self, item):
-        s = Speech.search(index=item["index"], using=Polindex.es).query("match", url=item["url"])
-        s = s.doc_type(Speech)
-        results = s.execute()
-        if results.hits.total.value == 0 or "update" in item["flags"]:
-            if results.hits.total.value == 0:
-                speech = Speech()
+        self.actions.append(self.bulk_action(item))
+        if len(self.actions) >= self.bulk_size:
+            self.flush()
+
+    @staticmethod
+    def bulk_action(item):
+        """
+        :param item: the scraped speech
+        :return: the bulk action indexing the speech: create only, or index (whole document replaced) if the item
+        has the "update" flag
+        """
+        speech = Speech()
+        speech.url = item["url"]
+        speech.title = item["title"]
+        speech.published = item["published"]
+        speech.fulltext = item["fulltext"]
+        speech.description = item["description"]
+        speech.category = item["category"]
+        speech.circumstance = item["circumstance"]
+        speech.speaking = item["speaking"]
+        speech.keywords = [Kw(kw=k.strip()) for k in item["keywords"]]
+        q = deque(item["roles"])
+        speech.persons = []
+        for n in item["persons"]:
+            person = Person(name=n, role="")
+            if q:
+                person.role = q.popleft()
+            speech.persons.append(person)
+        # fields left empty by the new scrap are cleared, as index replaces the whole document
+        return {"_op_type": "index" if "update" in item["flags"] else "create", "_index": item["index"],
+                "_id": speech_id(item["url"]), "_source": speech.to_dict()}
+
+    @staticmethod
+    def _url(action):
+        return action.get("_source", {}).get("url")
+
+    def resolve_legacy(self, actions):
+        """
+        Looks for the speeches indexed before ids were derived from URLs (with random ids), in a single query per index.
+        The create of a speech already indexed with a random id is dropped; its index (update) deletes the old
+        documents
+        :param actions: the bulk actions
+        :return: the bulk actions to send
+        """
+        by_index = {}
+        for action in actions:
+            url = self._url(action)
+            if url:
+                by_index.setdefault(action["_index"], {})[url] = action["_id"]
+        legacy = {}
+        for index, ids in by_index.items():
+            query = {"query": {"bool": {"filter": [{"terms": {"url": list(ids)}}],
+                                        "must_not": [{"ids": {"values": list(ids.values())}}]}}}
+            for hit in helpers.scan(Polindex.es, index=index, query=query, _source=["url"]):
+                legacy.setdefault((index, hit["_source"]["url"]), []).append(hit["_id"])
+        if not legacy:
+            return actions
+        resolved = []
+        for action in actions:
+            old_ids = legacy.get((action["_index"], self._url(action)))
+            if not old_ids:
+                resolved.append(action)
+            elif action["_op_type"] == "index":
+                resolved.extend({"_op_type": "delete", "_index": action["_index"], "_id": old_id} for old_id in old_ids)
+                resolved.append(action)
             else:
-                speech = results[0]
-                logging.info("Updating existing Speech")
-                if results.hits.total.value > 1:
-                    logging.info("Deleting duplicates")
-                    for dup in results[1:]:
-                        dup.delete(index=item["index"], using=Polindex.es)
-            speech.url = item["url"]
-            speech.title = item["title"]
-            speech.published = item["published"]
-            speech.fulltext = item["fulltext"]
-            speech.description = item["description"]
-            speech.category = item["category"]
-            speech.circumstance = item["circumstance"]
-            speech.speaking = item["speaking"]
-            speech.keywords = [Kw(kw=k.strip()) for k in item["keywords"]]
-            q = deque(item["roles"])
-            speech.persons = []
-            for n in item["persons"]:
-                person = Person(name=n, role="")
-                if q:
-                    person.role = q.popleft()
-                speech.persons.append(person)
-            speech.save(index=item["index"], using=Polindex.es)
-            logging.info(f"Saved speech with url {item['url']}")
-        else:
-            logging.info(f"Already indexed {item['url']}")
+                logging.debug("Already indexed %s", self._url(action))
+                self.inc_stats("existing", 1)
+        return resolved
+
+    def flush(self):
+        """
+        Sends the waiting speeches to ElasticSearch. If ElasticSearch cannot be reached, the speeches not sent
+        are kept for the next flush
+        """
+        if not self.actions:
+            return
+        pending, self.actions = self.actions, []
+        saved = existing = failed = 0
+        # results do not come in the order of the actions when some are retried (429): they are matched by id
+        answered = set()
+        try:
+            actions = self.resolve_legacy(pending) if self.legacy_ids else pending
+            pending = actions
+            for ok, result in helpers.streaming_bulk(Polindex.es, actions, chunk_size=self.bulk_size, max_retries=3,
+                                                     raise_on_error=False):
+                op_type, info = next(iter(result.items()))
+                answered.add((op_type, info.get("_id")))
+                if ok:
+                    if op_type != "delete":
+                        saved += 1
+                elif info.get("status") == 409:
+                    # create of an already indexed speech
+                    existing += 1
+                elif op_type == "delete" and info.get("status") == 404:
+                    pass
+                else:
+                    failed += 1
+                    logging.error("Cannot index speech %s: %s", info.get("_id"),
+                                  info.get("error", info.get("exception")))
+        except Exception as e:
+            # also keeps the LoopingCall running
+            unanswered = [action for action in pending if (action["_op_type"], action["_id"]) not in answered]
+            logging.error("Cannot send %d speeches to ElasticSearch, will retry: %s", len(unanswered), e)
+            self.actions = unanswered + self.actions
+        logging.info("Saved %d speeches, %d already indexed, %d errors", saved, existing, failed)
+        self.inc_stats("saved", saved)
+        self.inc_stats("existing", existing)
+        self.inc_stats("failed", failed)
+
+    def inc_stats(self, name, count):
+        if self.stats:
+            self.stats.inc_value("elasticsearch/" + name, count)
@@ -97,3 +97,9 @@ ELASTICSEARCH_PASSWORD = os.environ.get("ELASTICSEARCH_PASSWORD")
 ELASTICSEARCH_SERVERS = [os.environ.get("ELASTICSEARCH_SERVER")]
 ELASTICSEARCH_PORT = os.environ.get("ELASTICSEARCH_PORT")
 
+# Speeches are indexed by bulks of ELASTICSEARCH_BULK_SIZE, or every ELASTICSEARCH_FLUSH_INTERVAL seconds
+ELASTICSEARCH_BULK_SIZE = int(os.environ.get("ELASTICSEARCH_BULK_SIZE", 500))
+ELASTICSEARCH_FLUSH_INTERVAL = float(os.environ.get("ELASTICSEARCH_FLUSH_INTERVAL", 5))
+# Look up by URL the speeches indexed with random ids by previous versions. May be disabled once the index only
+# holds speeches with URL-based ids
+ELASTICSEARCH_LEGACY_IDS = os.environ.get("ELASTICSEARCH_LEGACY_IDS", "yes") == "yes"
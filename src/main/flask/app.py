@@ -1,15 +1,20 @@
+import json
+import re
+import time
+import uuid
 from collections import Counter
 
-from flask import Flask, jsonify, request
-from worker.celery import make_celery
-from tasks import enhance_speech, enhance_hot, enhance_politics
+from celery import group, states
+from flask import Flask, Response, jsonify, request
+from worker.callbacks import allowed_hosts, check_callback
+from worker.celery import make_celery, celery_config
+from worker.serialization import decode_stored, stored_as_json
+from tasks import enhance_speech, enhance_hot, enhance_politics, enhance_live, enhance_batch, PIPELINES, TASK_STATUS, \
+    BATCHES
 
 app = Flask(__name__)
 app.config.from_object("config")
-app.config.update(CELERY_CONFIG={
-    "broker_url": app.config['CELERY_BACKEND'],
-    "result_backend": app.config['CELERY_BACKEND']
-})
+app.config.update(CELERY_CONFIG=celery_config(app.config))
 client = make_celery(app)
 
 @app.route('/transcript', methods=['POST'])
@@ -42,6 +47,78 @@ def politics_parse():
     task = enhance_politics.delay(speech)
     return jsonify({"id": task.id})
 
+@app.route('/live', methods=['POST'])
+def live_start():
+    """
+    Starts a live transcript job, fed with /live/<job_id>
+    :return: the job-id
+    """
+    return jsonify({"job": uuid.uuid4().hex})
+
+@app.route('/live/<job_id>', methods=['POST'])
+def live_append(job_id):
+    """
+    Enqueues new chunks of a live transcript. Input message shall be
+    {"transcript": [chunks], "seq": rank of the append (0, 1, ...), "final": true for the last append}
+    The result of the task holds the paragraphs that are new or changed since the previous append
+    :param job_id: the live job id
+    :return: the task-id
+    """
+    data = request.get_json()
+    task = enhance_live.delay(job_id, data.get("transcript", []), seq=data.get("seq"), final=data.get("final", False))
+    return jsonify({"id": task.id})
+
+
+def _read_documents():
+    """
+    Reads the documents of the request body, either a JSON array or NDJSON (one JSON document per line)
+    """
+    data = request.get_data(as_text=True).strip()
+    if data.startswith("["):
+        return json.loads(data)
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+
+@app.route('/batch/<pipeline>', methods=['POST'])
+def batch(pipeline):
+    """
+    Enqueues a batch of speeches for the pipeline (transcript, hot or politics).
+    The body is a JSON array of speeches or NDJSON (one speech per line). Speeches are sent to the workers by chunks
+    of chunk_size (query parameter, defaults to BATCH_CHUNK_SIZE): the result of each chunk task is the list
+    of its enhanced speeches, so that speech i of the batch is result i % chunk_size of task ids[i // chunk_size]
+    If the callback query parameter is set, {"batch": batch-id, "status": SUCCESS or FAILURE} is posted to this URL
+    once all chunks are processed. Its host shall be listed in BATCH_CALLBACK_HOSTS
+    :param pipeline: the pipeline, same as the endpoints for single speeches
+    :return: {"batch": batch-id, "ids": chunk task-ids, "chunk_size": chunk size, "count": number of speeches}
+    """
+    if pipeline not in PIPELINES:
+        return jsonify({"error": "Unknown pipeline %s" % pipeline}), 404
+    try:
+        speeches = _read_documents()
+    except ValueError as err:
+        return jsonify({"error": "Invalid JSON: %s" % err}), 400
+    if not speeches:
+        return jsonify({"error": "Empty batch"}), 400
+    chunk_size = max(1, request.args.get("chunk_size", app.config["BATCH_CHUNK_SIZE"], type=int))
+    batch_id = str(uuid.uuid4())
+    callback = request.args.get("callback")
+    if callback:
+        try:
+            check_callback(callback, allowed_hosts(app.config["BATCH_CALLBACK_HOSTS"]))
+        except ValueError as err:
+            return jsonify({"error": str(err)}), 400
+    # chunks of a batch with a callback count themselves when finished, the last one sends the callback
+    options = {"batch_id": batch_id} if callback else {}
+    chunks = [enhance_batch.s(pipeline, speeches[start:start + chunk_size], **options)
+              for start in range(0, len(speeches), chunk_size)]
+    if callback:
+        BATCHES.start(batch_id, len(chunks), callback)
+    result = group(chunks).apply_async(task_id=batch_id)
+    # keeps the list of chunks in the backend, so that the batch can be restored from its id
+    result.save()
+    return jsonify({"batch": result.id, "ids": [chunk.id for chunk in result.results],
+                    "chunk_size": chunk_size, "count": len(speeches)})
+
 
 @app.route('/result/<task_id>')
 def task_result(task_id):
@@ -65,6 +142,79 @@ def task_result(task_id):
         return jsonify(task.info) if task else jsonify(None)
 
 
+# status of a result stored as JSON by the backend, read without decoding the whole result
+STATUS_RE = re.compile(rb'^\{"status":\s*"(\w+)"')
+# state of a stored result whose status cannot be read from its head
+UNKNOWN_STATE = "UNKNOWN"
+
+
+def _message_state(message):
+    match = STATUS_RE.match(message[:64])
+    return match.group(1).decode() if match else decode_stored(message)["status"]
+
+
+def _task_messages(task_id, timeout):
+    """
+    Follows the state of a task, listening to the messages published by the Redis backend when it stores a state
+    :param task_id: the Id of the task
+    :param timeout: max time to wait (in seconds)
+    :return: generator of (state, stored message or None) for each state change, until the task is finished
+    or the timeout expires
+    """
+    backend = client.backend
+    key = backend.get_key_for_task(task_id)
+    pubsub = backend.client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(key)
+    try:
+        # read after subscribing, so that a state stored in between is not missed
+        message = backend.get(key)
+        deadline = time.monotonic() + timeout
+        state = None
+        while True:
+            new_state = _message_state(message) if message else states.PENDING
+            if new_state != state:
+                state = new_state
+                yield state, message
+            remaining = deadline - time.monotonic()
+            if state in states.READY_STATES or remaining <= 0:
+                return
+            published = pubsub.get_message(timeout=remaining)
+            if published and published["type"] == "message":
+                message = published["data"]
+    finally:
+        pubsub.close()
+
+
+@app.route('/wait/<task_id>')
+def task_wait(task_id):
+    """
+    Waits for the end of a task (long polling), or streams its state changes as server-sent events if the request
+    accepts text/event-stream. The wait lasts at most timeout seconds (query parameter, defaults to WAIT_TIMEOUT).
+    When the task is finished, the stored message is returned: as is if it was stored as JSON (without decoding the
+    result), else converted to JSON: {"status": ..., "result": ..., "traceback": ..., ...}. Unlike /result,
+    the result is not removed.
+    :param task_id: the Id of the task
+    :return: the stored message, or {"status": value} with HTTP code 202 if the task is not finished yet
+    """
+    if not hasattr(client.backend, "get_key_for_task") or not hasattr(client.backend, "client"):
+        return jsonify({"error": "Waiting for a task requires a Redis result backend"}), 501
+    timeout = min(request.args.get("timeout", app.config["WAIT_TIMEOUT"], type=float), app.config["WAIT_TIMEOUT"])
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        def events():
+            for state, message in _task_messages(task_id, timeout):
+                if state in states.READY_STATES:
+                    yield b"event: result\ndata: " + stored_as_json(message) + b"\n\n"
+                else:
+                    yield ("event: status\ndata: %s\n\n" % json.dumps({"status": state})).encode()
+        return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+    state, message = states.PENDING, None
+    for state, message in _task_messages(task_id, timeout):
+        pass
+    if state in states.READY_STATES:
+        return Response(stored_as_json(message), mimetype="application/json")
+    return jsonify({"status": state}), 202
+
+
 @app.route('/status/<task_id>')
 def task_status(task_id):
     """
@@ -80,25 +230,77 @@ def task_status(task_id):
     return jsonify({"status":task.state if task else "FAIL"})
 
 
-@app.route('/batch_status', methods=['POST'])
-def batch_status():
+def _task_states(task_ids):
     """
-    Same as status, but for a list of IDs.
-    INput message shall be { "ids": [id1, id2, ...] } where ids are task-ids
-    The returned global status will be PENDING unless all tasks are SUCCESSful
-    :return: json message with {"status": global status, "progress": progress-message, "details": counts by status }
+    Gets the states of a list of tasks, from the statuses stored by the workers (see TaskStatusStore) in a single
+    MGET. Results are only read for the tasks without a stored status
+    :param task_ids: list of task-ids
+    :return: the list of states
     """
-    speech = request.get_json()
-    status_counts = Counter()
-    task_id_list = speech["ids"]
-    for task_id in task_id_list:
+    try:
+        statuses = TASK_STATUS.get_many(task_ids)
+    except Exception as err:
+        app.logger.error("Error getting task statuses, falling back to task results: %s", err)
+        statuses = [None] * len(task_ids)
+    unknown = [i for i, status in enumerate(statuses) if status is None]
+    if unknown:
+        for i, status in zip(unknown, _result_states([task_ids[i] for i in unknown])):
+            statuses[i] = status
+    return statuses
+
+
+def _result_states(task_ids):
+    """
+    Gets the states of a list of tasks from their results. With a Redis backend, only the head of each JSON result
+    is read (GETRANGE): the state of a result not stored as JSON is UNKNOWN, as it would have to be fetched and
+    decoded in full
+    :param task_ids: list of task-ids
+    :return: the list of states
+    """
+    backend = client.backend
+    if hasattr(backend, "client") and hasattr(backend, "get_key_for_task"):
+        try:
+            keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+            pipe = backend.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.getrange(key, 0, 63)
+            heads = pipe.execute()
+            return [_message_state(head) if head and STATUS_RE.match(head) else
+                    UNKNOWN_STATE if head else states.PENDING
+                    for head in heads]
+        except Exception as err:
+            app.logger.error("Error getting batch status from backend, falling back to one request per task: %s",
+                             err)
+    task_states = []
+    for task_id in task_ids:
         try:
             task = client.AsyncResult(task_id)
             status = task.state
         except Exception as err:
             app.logger.error("Error getting task status from worker: task_id=%s - %s", task_id, err)
             status = "ERROR"
-        status_counts[status] += 1
+        task_states.append(status)
+    return task_states
+
+
+@app.route('/batch_status', methods=['POST'])
+def batch_status():
+    """
+    Same as status, but for a list of IDs.
+    INput message shall be { "ids": [id1, id2, ...] } where ids are task-ids, or { "batch": batch-id } for the chunks
+    of a batch (see /batch/<pipeline>)
+    The returned global status will be PENDING unless all tasks are SUCCESSful
+    :return: json message with {"status": global status, "progress": progress-message, "details": counts by status }
+    """
+    speech = request.get_json()
+    if "batch" in speech:
+        batch_result = client.GroupResult.restore(speech["batch"])
+        if batch_result is None:
+            return jsonify({"error": "Unknown batch %s" % speech["batch"]}), 404
+        task_id_list = [chunk.id for chunk in batch_result.results]
+    else:
+        task_id_list = speech["ids"]
+    status_counts = Counter(_task_states(task_id_list))
     if status_counts["SUCCESS"] == len(task_id_list):
         global_status = "SUCCESS"
     else:
@@ -15,3 +15,58 @@ ORGS_LIST = os.environ.get("ORGS_LIST")
 ENABLE_DEEP_PSO = os.environ.get("ENABLE_DEEP_PSO", "yes") == "yes"
 ENABLE_DEEP_SENTENCE_BUILDER = os.environ.get("ENABLE_DEEP_SENTENCE_BUILDER", "yes") == "yes"
 ENABLE_DEEP_CATEGORIZER = os.environ.get("ENABLE_DEEP_CATEGORIZER", "yes") == "yes"
+# Inference backend of deep PSO and sentence builder: "torch", "int8" (quantized, faster on CPU) or "onnx"
+# (ONNX Runtime, requires optimum[onnxruntime]). See scripts/benchmark_backends.py for accuracy and latency
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+
+# SQLite file caching extracted terms and categories per text, shared by all workers (no cache if not set)
+TERMS_CACHE = os.environ.get("TERMS_CACHE")
+
+# Live transcript jobs are forgotten after this delay (in seconds) without any new chunk
+LIVE_JOB_TTL = int(os.environ.get("LIVE_JOB_TTL", 6 * 3600))
+
+# Micro-batching of PSO and sentence builder calls across concurrent tasks. Only useful if the worker runs several
+# tasks at once, e.g. `celery -A tasks.client worker --pool=threads --concurrency=8`. Tools that cannot process several
+# inputs at once (e.g. Howler's SentenceBuilder) are not thread-safe: they are called by one task at a time, and only
+# the PSO classifier gains from the threads. Without MICRO_BATCHING, do not run the worker with --pool=threads
+MICRO_BATCHING = os.environ.get("MICRO_BATCHING", "no") == "yes"
+# Max number of sentences (or texts) per batch, and max time to wait for other tasks before running a batch
+MICRO_BATCH_SIZE = int(os.environ.get("MICRO_BATCH_SIZE", 64))
+MICRO_BATCH_WAIT_MS = int(os.environ.get("MICRO_BATCH_WAIT_MS", 20))
+
+# Load and warm up resources when the worker starts instead of in its first task
+WORKER_EAGER_LOAD = os.environ.get("WORKER_EAGER_LOAD", "yes") == "yes"
+# Max time (in seconds) for a worker process to load its resources
+WORKER_BOOT_TIMEOUT = int(os.environ.get("WORKER_BOOT_TIMEOUT", 600))
+
+# Multi-process mode (`celery -A tasks.client worker --pool=prefork --concurrency=N`): models are loaded once in the
+# parent process and shared copy-on-write by the N worker processes
+WORKER_PRELOAD_MODELS = os.environ.get("WORKER_PRELOAD_MODELS", "no") == "yes"
+# Torch threads in each worker process, with WORKER_PRELOAD_MODELS only (the thread count is left unchanged otherwise).
+# Keep concurrency * threads below the number of cores
+TORCH_THREADS_PER_CHILD = int(os.environ.get("TORCH_THREADS_PER_CHILD", 1))
+
+# Cache of PSO labels per sentence: max number of sentences kept in memory by each worker process (0 disables it),
+# and optional second level shared by all workers in Redis (CELERY_BACKEND)
+PSO_CACHE_SIZE = int(os.environ.get("PSO_CACHE_SIZE", 100000))
+PSO_CACHE_REDIS = os.environ.get("PSO_CACHE_REDIS", "no") == "yes"
+PSO_CACHE_TTL = int(os.environ.get("PSO_CACHE_TTL", 30 * 24 * 3600))
+
+# Number of speeches per task for batches (/batch/<pipeline>)
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 20))
+
+# Hosts to which batch completion callbacks may be posted (comma-separated, *.domain for sub-domains).
+# Callbacks are refused if empty
+BATCH_CALLBACK_HOSTS = os.environ.get("BATCH_CALLBACK_HOSTS", "")
+# Timeout (in seconds) of a callback request, and number of retries on connection or server errors
+BATCH_CALLBACK_TIMEOUT = float(os.environ.get("BATCH_CALLBACK_TIMEOUT", 10))
+BATCH_CALLBACK_RETRIES = int(os.environ.get("BATCH_CALLBACK_RETRIES", 3))
+
+# Max time (in seconds) a client may wait for the end of a task with /wait/<task_id>
+WAIT_TIMEOUT = float(os.environ.get("WAIT_TIMEOUT", 60))
+
+# Serialization of task arguments and results: json or msgpack, optionally compressed with gzip or zstd
+CELERY_SERIALIZER = os.environ.get("CELERY_SERIALIZER", "json")
+CELERY_COMPRESSION = os.environ.get("CELERY_COMPRESSION")
+# Results are removed from the backend after this delay (in seconds), even if they were never fetched
+RESULT_EXPIRES = int(os.environ.get("RESULT_EXPIRES", 24 * 3600))
@@ -2,57 +2,271 @@
 Definition of Celery task to enhance a speech
 """
 
+import gc
+import logging
+import os
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from celery import states
+from celery.signals import worker_init, worker_process_init, task_prerun, task_postrun, task_retry
 from flask import Flask
 from howler import SentenceBuilder, Semantizer, Howler, Namer, TextTiler
 from howler.category import OrgRepository
 from howler.deep import Pso
 
+from overton.cache import PersistentCache
+from worker.backend import apply_backend
+from worker.batching import batched_pso, batched_sentence_builder
+from worker.callbacks import allowed_hosts, check_callback, post_json
+from worker.cache import CachedExtractor, CachedPso, model_version
+from worker.live import LiveJobStore, OutOfOrder
+from worker.pso import batch_pso, warm_up_pso
+from worker.pipelines import transcript_live_pipeline
 from worker.speech import enhance, hot_parse, politics_parse
-from worker.celery import make_celery
+from worker.status import BatchProgress, TaskStatusStore
+from worker.celery import make_celery, celery_config
 from worker.utils import Tools
 
 import nltk
 
 nltk.download("punkt")  # to be moved into Howler ?
 
+logger = logging.getLogger(__name__)
+
 flask_app = Flask(__name__)
 flask_app.config.from_object("config")
-flask_app.config.update(CELERY_CONFIG={
-    "broker_url": flask_app.config['CELERY_BACKEND'],
-    "result_backend": flask_app.config['CELERY_BACKEND']
-})
+flask_app.config.update(CELERY_CONFIG=dict(
+    celery_config(flask_app.config),
+    # worker processes load and warm up their resources before accepting tasks
+    worker_proc_alive_timeout=flask_app.config["WORKER_BOOT_TIMEOUT"]
+))
 
 client = make_celery(flask_app)
+LIVE_JOBS = LiveJobStore(flask_app.config["CELERY_BACKEND"], ttl=flask_app.config["LIVE_JOB_TTL"])
+TASK_STATUS = TaskStatusStore(flask_app.config["CELERY_BACKEND"], ttl=flask_app.config["RESULT_EXPIRES"])
+BATCHES = BatchProgress(flask_app.config["CELERY_BACKEND"], ttl=flask_app.config["RESULT_EXPIRES"])
 
 PUNCT = None
 PSO = None
 CATEGORIZER = None
 NAMER = None
 TOOLS = None
+_LOAD_LOCK = threading.Lock()
+# used to trigger the lazy initializations of models
+WARM_UP_TEXT = "bonjour à tous Emmanuel Macron nous parle du pouvoir d'achat des Français et de la réforme des retraites"
+
+
+def _micro_batching():
+    return {"max_batch_size": flask_app.config["MICRO_BATCH_SIZE"],
+            "max_wait": flask_app.config["MICRO_BATCH_WAIT_MS"] / 1000}
+
+
+def _load_sentence_builder():
+    punct = apply_backend(SentenceBuilder(), flask_app.config["INFERENCE_BACKEND"])
+    if flask_app.config["MICRO_BATCHING"]:
+        punct = batched_sentence_builder(punct, **_micro_batching())
+    return punct
+
+
+def _load_pso():
+    pso = apply_backend(Pso(), flask_app.config["INFERENCE_BACKEND"])
+    # Howler's Pso classifies one sentence at a time. Batches are checked at warm-up, after any fork
+    pso = batch_pso(pso)
+    version = model_version(pso, flask_app.config["INFERENCE_BACKEND"])
+    if flask_app.config["MICRO_BATCHING"]:
+        pso = batched_pso(pso, **_micro_batching())
+    if flask_app.config["PSO_CACHE_SIZE"]:
+        redis_url = flask_app.config["CELERY_BACKEND"] if flask_app.config["PSO_CACHE_REDIS"] else None
+        pso = CachedPso(pso, version, maxsize=flask_app.config["PSO_CACHE_SIZE"], redis_url=redis_url,
+                        ttl=flask_app.config["PSO_CACHE_TTL"])
+    return pso
+
+
+def _load_categorizer():
+    org_repo = None
+    if flask_app.config["ORGS_LIST"]:
+        org_repo = OrgRepository(flask_app.config["ORGS_LIST"], delimiter=";")
+    categorizer = Howler("fr",
+                         categorisation_file=flask_app.config["CATEGORIES_JSON"],
+                         stop_list_file=flask_app.config["KILL_LIST"],
+                         known_orgs_repo=org_repo)
+    categorizer.config(compound_score_ratio=0.0, simple_word_min_score=0.0,
+                       semantizer=Semantizer() if flask_app.config["ENABLE_DEEP_CATEGORIZER"] else None,
+                       similarity_threshold=0.56)
+    if flask_app.config["TERMS_CACHE"]:
+        deep = "deep" if flask_app.config["ENABLE_DEEP_CATEGORIZER"] else "plain"
+        cache = PersistentCache(flask_app.config["TERMS_CACHE"],
+                                namespace=str(categorizer.classification_version()) + "/" + deep)
+        categorizer = CachedExtractor(categorizer, cache)
+    return categorizer
+
+
+# resource name -> (loader, warm-up function)
+RESOURCES = {
+    "sentence_builder": (_load_sentence_builder, lambda punct: punct.rebuild_sentences(WARM_UP_TEXT)),
+    # bypasses the result cache, if any
+    "pso": (_load_pso, lambda pso: warm_up_pso(pso, WARM_UP_TEXT)),
+    "howler": (_load_categorizer, lambda howler: howler.extract_persons(WARM_UP_TEXT)),
+    "namer": (Namer, lambda namer: namer.parse("Emmanuel Macron")),
+    "text_tiler": (lambda: TextTiler("fr"), None),
+}
+
+
+def _enabled_resources():
+    names = list(RESOURCES)
+    if not flask_app.config["ENABLE_DEEP_SENTENCE_BUILDER"]:
+        names.remove("sentence_builder")
+    if not flask_app.config["ENABLE_DEEP_PSO"]:
+        names.remove("pso")
+    return names
+
+
+def _timed(action, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    logger.info("%s in %.1fs", action, time.perf_counter() - start)
+    return result
+
+
 # Lazy loading of resources, to avoid initializing them when importing the package,
 # but still have resource loaded once.
 def _lazy_load():
+    if TOOLS:
+        return TOOLS
+    with _LOAD_LOCK:    # tasks may run in parallel threads
+        return _load()
+
+
+def _load():
+    """
+    Loads the resources in parallel threads (they are independent), and builds the tools
+    """
     global PUNCT, PSO, CATEGORIZER, NAMER, TOOLS
-    if flask_app.config["ENABLE_DEEP_SENTENCE_BUILDER"] and not PUNCT:
-        PUNCT = SentenceBuilder()
-    if flask_app.config["ENABLE_DEEP_PSO"] and not PSO:
-        PSO = Pso()
-    if not CATEGORIZER:
-        org_repo = None
-        if flask_app.config["ORGS_LIST"]:
-            org_repo = OrgRepository(flask_app.config["ORGS_LIST"], delimiter=";")
-        CATEGORIZER = Howler("fr",
-                             categorisation_file=flask_app.config["CATEGORIES_JSON"],
-                             stop_list_file=flask_app.config["KILL_LIST"],
-                             known_orgs_repo=org_repo)
-        CATEGORIZER.config(compound_score_ratio=0.0, simple_word_min_score=0.0,
-                           semantizer=Semantizer() if flask_app.config["ENABLE_DEEP_CATEGORIZER"] else None,
-                           similarity_threshold=0.56)
-    if not NAMER:
-        NAMER = Namer()
-    TOOLS = Tools(sentence_builder=PUNCT, pso=PSO, namer=NAMER, howler=CATEGORIZER, text_tiler=TextTiler("fr"))
+    if TOOLS:
+        return TOOLS
+    names = _enabled_resources()
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        futures = {name: executor.submit(_timed, "Loaded " + name, RESOURCES[name][0]) for name in names}
+        resources = {name: future.result() for name, future in futures.items()}
+    PUNCT = resources.get("sentence_builder")
+    PSO = resources.get("pso")
+    CATEGORIZER = resources["howler"]
+    NAMER = resources["namer"]
+    TOOLS = Tools(sentence_builder=PUNCT, pso=PSO, namer=NAMER, howler=CATEGORIZER,
+                  text_tiler=resources["text_tiler"])
     return TOOLS
 
+
+def _warm_up(tools):
+    """
+    Runs a dummy inference on each model, in parallel threads, so that the first task does not pay for
+    the lazy initializations (kernels, caches...)
+    """
+    def warm_up(name):
+        try:
+            _timed("Warmed up " + name, RESOURCES[name][1], getattr(tools, name))
+        except Exception as e:
+            logger.warning("Warm-up of %s failed: %s", name, e)
+
+    names = [name for name in _enabled_resources() if RESOURCES[name][1]]
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        list(executor.map(warm_up, names))
+
+
+def _forks(worker):
+    # True if the worker runs tasks in forked processes (Celery's default prefork pool)
+    pool = getattr(worker, "pool_cls", "prefork")
+    return "prefork" in (pool if isinstance(pool, str) else pool.__module__)
+
+
+@worker_init.connect
+def _boot(sender=None, **kwargs):
+    """
+    Loads the resources when the worker starts, before it consumes any task.
+    With a prefork pool, models are only warmed up in the worker processes: thread pools of torch and tokenizers
+    do not survive a fork. Resources are then loaded in the parent process only if WORKER_PRELOAD_MODELS is set,
+    so that the worker processes share the models' memory instead of loading one copy each.
+    """
+    start = time.perf_counter()
+    if _forks(sender):
+        if not flask_app.config["WORKER_PRELOAD_MODELS"]:
+            return
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        logger.info("Preloading models before forking worker processes")
+        _lazy_load()
+        # moves loaded objects out of the collector's reach: collections in the children would otherwise write to
+        # (and thus copy) every page holding a model object
+        gc.collect()
+        gc.freeze()
+    elif flask_app.config["WORKER_EAGER_LOAD"]:
+        _warm_up(_lazy_load())
+    else:
+        return
+    logger.info("Worker ready in %.1fs", time.perf_counter() - start)
+
+
+@worker_process_init.connect
+def _init_process(**kwargs):
+    """
+    With models preloaded by the parent process, limits the threads used by torch in each worker process, so that
+    N processes do not oversubscribe the cores. Then loads (unless already loaded by the parent process) and warms up
+    the resources
+    """
+    if flask_app.config["WORKER_PRELOAD_MODELS"]:
+        try:
+            import torch
+            torch.set_num_threads(flask_app.config["TORCH_THREADS_PER_CHILD"])
+        except ImportError:
+            pass
+    if flask_app.config["WORKER_EAGER_LOAD"] or flask_app.config["WORKER_PRELOAD_MODELS"]:
+        start = time.perf_counter()
+        _warm_up(_lazy_load())
+        logger.info("Worker process ready in %.1fs", time.perf_counter() - start)
+
+
+def _store_status(task_id, status):
+    # a status that cannot be stored shall not fail the task: /batch_status then reads the result instead
+    try:
+        TASK_STATUS.set(task_id, status)
+    except Exception as e:
+        logger.warning("Cannot store status %s of task %s: %s", status, task_id, e)
+
+
+@task_prerun.connect
+def _task_started(task_id=None, **kwargs):
+    _store_status(task_id, states.STARTED)
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, kwargs=None, state=None, **extra):
+    if state:
+        _store_status(task_id, state)
+    batch_id = (kwargs or {}).get("batch_id")
+    if batch_id and task is not None and task.name == enhance_batch.name and state in states.READY_STATES:
+        _batch_chunk_done(batch_id, state != states.SUCCESS)
+
+
+def _batch_chunk_done(batch_id, failed):
+    # the worker that finishes the last chunk of a batch sends its callback
+    try:
+        finished = BATCHES.chunk_done(batch_id, failed)
+    except Exception as e:
+        logger.error("Cannot count the chunks of batch %s, its callback will not be sent: %s", batch_id, e)
+        return
+    if finished:
+        callback, status = finished
+        notify_batch.delay(callback, batch_id, status)
+
+
+@task_retry.connect
+def _task_retried(request=None, **kwargs):
+    if request is not None:
+        _store_status(request.id, states.RETRY)
+
+
 @client.task
 def enhance_hot(speech_json):
     """
@@ -64,6 +278,32 @@ def enhance_hot(speech_json):
     parsed = hot_parse(speech_json, tools=TOOLS)
     return parsed
 
+@client.task(bind=True, max_retries=120)
+def enhance_live(self, job_id, chunks, seq=None, final=False):
+    """
+    Appends transcript chunks to a live job and parses the part of the transcript that is not frozen yet
+    :param job_id: the live job id
+    :param chunks: the new transcript chunks
+    :param seq: rank of the append in the job, starting at 0. Appends are processed in this order
+    :param final: True for the last append of the job
+    :return: {"id": job_id, "paragraphs": new or changed paragraphs, "final": final}
+    """
+    _lazy_load()
+
+    def update(state):
+        return transcript_live_pipeline(state, chunks, TOOLS, final=final)
+
+    try:
+        paragraphs = LIVE_JOBS.append(job_id, seq, update, final=final)
+    except OutOfOrder:
+        # a previous append is not processed yet
+        raise self.retry(countdown=1)
+    if paragraphs is None:
+        # already processed
+        paragraphs = []
+    return {"id": job_id, "paragraphs": paragraphs, "final": final}
+
+
 @client.task
 def enhance_politics(speech_json):
     """
@@ -88,3 +328,54 @@ def enhance_speech(speech_json):
     parsed = enhance(
         speech_json, punct=PUNCT, pso=PSO, categorizer=CATEGORIZER, namer=NAMER)
     return parsed
+
+
+# processing of one speech by pipeline name, for batches
+PIPELINES = {
+    "transcript": lambda speech: enhance(speech, punct=PUNCT, pso=PSO, categorizer=CATEGORIZER, namer=NAMER),
+    "hot": lambda speech: hot_parse(speech, tools=TOOLS),
+    "politics": lambda speech: politics_parse(speech, tools=TOOLS),
+}
+
+
+@client.task
+def enhance_batch(pipeline, speeches, batch_id=None):
+    """
+    Enhances a chunk of the speeches of a batch, all with the same pipeline
+    :param pipeline: "transcript", "hot" or "politics", same as the endpoints for single speeches
+    :param speeches: list of speeches
+    :param batch_id: the id of a batch with a completion callback (see BatchProgress), None otherwise
+    :return: the list of results, in the same order. A speech that cannot be processed gets {"error": message}
+    """
+    _lazy_load()
+    process = PIPELINES[pipeline]
+    results = []
+    for speech in speeches:
+        try:
+            results.append(process(speech))
+        except Exception as e:
+            logger.exception("Cannot process speech in %s batch", pipeline)
+            results.append({"error": str(e)})
+    return results
+
+
+@client.task(bind=True, max_retries=flask_app.config["BATCH_CALLBACK_RETRIES"])
+def notify_batch(self, url, batch_id, status="SUCCESS"):
+    """
+    Posts {"batch": batch-id, "status": status} to the callback URL of a batch, once all its chunks are processed.
+    Connection and server errors are retried a few times, then logged
+    :param url: the callback URL, checked against BATCH_CALLBACK_HOSTS
+    :param batch_id: the batch id
+    :param status: SUCCESS, or FAILURE if a chunk task failed
+    """
+    try:
+        check_callback(url, allowed_hosts(flask_app.config["BATCH_CALLBACK_HOSTS"]))
+        post_json(url, {"batch": batch_id, "status": status}, timeout=flask_app.config["BATCH_CALLBACK_TIMEOUT"])
+    except ValueError as e:
+        logger.error("Cannot notify end of batch %s: %s", batch_id, e)
+    except (urllib.error.URLError, OSError) as e:
+        retry = not isinstance(e, urllib.error.HTTPError) or e.code >= 500
+        if retry and self.request.retries < self.max_retries:
+            logger.warning("Cannot notify end of batch %s to %s, will retry: %s", batch_id, url, e)
+            raise self.retry(countdown=10 * 2 ** self.request.retries)
+        logger.error("Cannot notify end of batch %s to %s: %s", batch_id, url, e)
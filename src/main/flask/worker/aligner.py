@@ -1,9 +1,17 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
 from howler.deep import SentenceBuilder
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
 
+def _unpunctuated(text):
+    return SentenceBuilder.depunctuate(text).replace(" ", "")
+
+
 def align_sentences(transcript, sentences, max_distance=2000):
     """
     Aligns sentences with verbatims found in the speech. Adds appx start and duration for each sentence
@@ -19,17 +27,18 @@ def align_sentences(transcript, sentences, max_distance=2000):
     # character from the sentences
     # weakness: if transcript parts are lost, the algorithm stops aligning
 
-    text_block = ""
-    char_index = []
-
-    # create an index of sentences per character position in the (unpunctuated) text
-    for sentence_id, s in enumerate(sentences):
-        unpunctuated = SentenceBuilder.depunctuate(s["text"])
-        sentence_chars = unpunctuated.replace(" ", "")
-        # map chars position range to the current sentence id
-        char_index.extend([sentence_id for _ in sentence_chars])
-        text_block += sentence_chars
+    # create an index of sentences start offsets in the (unpunctuated) text
+    sentence_blocks = []
+    sentence_offsets = array("l")
+    text_length = 0
+    for s in sentences:
+        sentence_chars = _unpunctuated(s["text"])
+        sentence_offsets.append(text_length)
+        sentence_blocks.append(sentence_chars)
+        text_length += len(sentence_chars)
+    text_block = "".join(sentence_blocks)
     timestamped_sentence = [False] * len(sentences)
+    transcript_blocks = [_unpunctuated(chunk["text"]) for chunk in transcript]
 
     start_prev_chunk = transcript[0].get("start", 0)
     duration_prev_chunk = 0
@@ -40,13 +49,13 @@ def align_sentences(transcript, sentences, max_distance=2000):
     # Now match the transcript items simply by looking at character blocks.
     while chunk_id < transcript_length:
         chunk = transcript[chunk_id]
-        transcript_block = SentenceBuilder.depunctuate(chunk["text"]).replace(" ", "")
+        transcript_block = transcript_blocks[chunk_id]
         if text_block[pos_in_text:pos_in_text+len(transcript_block)] == transcript_block:
-            if pos_in_text >= len(char_index):
+            if pos_in_text >= text_length:
                 # we're too far in the buffer for some reason, probably at the end of the transcript - give up
                 alignment_ok = False
                 break
-            sentence_id = char_index[pos_in_text]
+            sentence_id = bisect_right(sentence_offsets, pos_in_text) - 1
             if not timestamped_sentence[sentence_id]:
                 timestamped_sentence[sentence_id] = True
                 sentences[sentence_id]["start"] = start_prev_chunk
@@ -61,13 +70,11 @@ def align_sentences(transcript, sentences, max_distance=2000):
             # we're lost... try to catchup
             logger.warning("bad alignment between sentences and transcript. Some timestamps will be wrong")
             for n in range(chunk_id+1, min(chunk_id+10, transcript_length-1)):
-                candidate = transcript[n]
-                candidate_block = SentenceBuilder.depunctuate(candidate["text"]).replace(" ", "")
-                pos = text_block.find(candidate_block, pos_in_text)
-                # verify that we're not matching a chunk miles away and that the next chunk is coherent
-                candidate_next_block = SentenceBuilder.depunctuate(transcript[n+1]["text"]).replace(" ", "")
-                if pos > 0 and pos - pos_in_text < max_distance and \
-                        text_block[pos+len(candidate_block):].startswith(candidate_next_block):
+                candidate_block = transcript_blocks[n]
+                # only search within max_distance, so that each catch-up attempt has a bounded cost
+                pos = text_block.find(candidate_block, pos_in_text, pos_in_text + max_distance - 1 + len(candidate_block))
+                # verify that the next chunk is coherent
+                if pos > 0 and text_block.startswith(transcript_blocks[n+1], pos+len(candidate_block)):
                     logger.info(f"Catch up: forward {chunk_id} to {n}")
                     pos_in_text = pos
                     chunk_id = n
@@ -75,7 +82,16 @@ def align_sentences(transcript, sentences, max_distance=2000):
             else:
                 alignment_ok = False
                 break
-    # Catchup for sentences that were found inside a transcript chunk and thus not timestamped
+    num_sentences, aligned_sentences = _fill_missing_timestamps(sentences)
+    return alignment_ok, num_sentences, aligned_sentences
+
+
+def _fill_missing_timestamps(sentences):
+    """
+    Catchup for sentences that were found inside a transcript chunk and thus not timestamped:
+    they get the timestamp of the previous sentence
+    :return: the number of sentences and the number of sentences that were timestamped
+    """
     num_sentences = 0
     aligned_sentences = 0
     start_prev_sentence = 0
@@ -89,8 +105,203 @@ def align_sentences(transcript, sentences, max_distance=2000):
             aligned_sentences += 1
             start_prev_sentence = s["start"]
             duration_prev_sentence = s["duration"]
+    return num_sentences, aligned_sentences
 
-    return alignment_ok, num_sentences, aligned_sentences
+
+def align_sentences_fuzzy(transcript, sentences, anchor_size=3, band=8):
+    """
+    Aligns sentences with a noisy transcript (lost, added or misrecognized words).
+    Words are first aligned on anchors - n-grams found exactly once in both texts, kept in order - then the words
+    between two anchors are aligned with an edit distance restricted to a band around the diagonal,
+    so that the cost stays proportional to the length of the texts.
+    Each sentence starts with the transcript chunk of its first aligned word and ends with the chunk of its last one.
+
+    :param transcript: timestamped text elements that made to the (rebuilt) sentences
+    :param sentences: the list of rebuilt sentences from the input text
+    :param anchor_size: number of words of the anchors
+    :param band: max drift (in words) from the diagonal between two anchors
+    :return: True if all sentences were aligned, the number of sentences and the number of aligned sentences
+    """
+    transcript_words, word_chunk = _words(transcript)
+    sentence_words, word_sentence = _words(sentences)
+    first_chunk = {}
+    last_chunk = {}
+    for t, s in _align_words(transcript_words, sentence_words, anchor_size, band):
+        sentence_id = word_sentence[s]
+        first_chunk.setdefault(sentence_id, word_chunk[t])
+        last_chunk[sentence_id] = word_chunk[t]
+    for sentence_id, sentence in enumerate(sentences):
+        if sentence_id in first_chunk:
+            first = transcript[first_chunk[sentence_id]]
+            last = transcript[last_chunk[sentence_id]]
+            sentence["start"] = first["start"]
+            sentence["duration"] = max(last["start"] + last["duration"] - first["start"], 0)
+        else:   # don't keep timestamps from a previous alignment
+            sentence.pop("start", None)
+            sentence.pop("duration", None)
+    num_sentences, aligned_sentences = _fill_missing_timestamps(sentences)
+    return aligned_sentences == num_sentences, num_sentences, aligned_sentences
+
+
+def _words(items):
+    """
+    :param items: list of dicts with a "text" field
+    :return: the list of depunctuated words of all items, and the index of the item each word comes from
+    """
+    words = []
+    origin = []
+    for i, item in enumerate(items):
+        for word in SentenceBuilder.depunctuate(item["text"]).split():
+            words.append(word)
+            origin.append(i)
+    return words, origin
+
+
+def _align_words(a, b, anchor_size, band):
+    """
+    Aligns two lists of words
+    :return: list of (position in a, position in b) couples, increasing on both sides
+    """
+    pairs = []
+    last_a = last_b = -1
+    for pos_a, pos_b in _anchors(a, b, anchor_size):
+        overlap = max(last_a - pos_a, last_b - pos_b) + 1
+        if overlap > 0 and last_a - pos_a != last_b - pos_b:
+            continue    # overlaps the previous anchor, but on another diagonal
+        if overlap <= 0:
+            pairs.extend((last_a + 1 + i, last_b + 1 + j)
+                         for i, j in _banded_alignment(a[last_a + 1:pos_a], b[last_b + 1:pos_b], band))
+        pairs.extend((pos_a + k, pos_b + k) for k in range(max(overlap, 0), anchor_size))
+        last_a = pos_a + anchor_size - 1
+        last_b = pos_b + anchor_size - 1
+    pairs.extend((last_a + 1 + i, last_b + 1 + j) for i, j in _banded_alignment(a[last_a + 1:], b[last_b + 1:], band))
+    return pairs
+
+
+def _anchors(a, b, size):
+    """
+    Finds the n-grams that occur exactly once in each list, and keeps the longest chain of them
+    that is in the same order in both lists
+    :return: list of (position in a, position in b) of the n-grams
+    """
+    def unique_ngrams(words):
+        positions = {}
+        for i in range(len(words) - size + 1):
+            ngram = tuple(words[i:i + size])
+            positions[ngram] = None if ngram in positions else i
+        return positions
+    in_b = unique_ngrams(b)
+    candidates = [(pos_a, in_b[ngram]) for ngram, pos_a in unique_ngrams(a).items()
+                  if pos_a is not None and in_b.get(ngram) is not None]
+    candidates.sort()
+    # longest increasing subsequence on positions in b (patience sorting)
+    tails = []
+    tail_ids = []
+    previous = [-1] * len(candidates)
+    for i, (_, pos_b) in enumerate(candidates):
+        k = bisect_left(tails, pos_b)
+        if k > 0:
+            previous[i] = tail_ids[k - 1]
+        if k == len(tails):
+            tails.append(pos_b)
+            tail_ids.append(i)
+        else:
+            tails[k] = pos_b
+            tail_ids[k] = i
+    chain = []
+    i = tail_ids[-1] if tail_ids else -1
+    while i >= 0:
+        chain.append(candidates[i])
+        i = previous[i]
+    chain.reverse()
+    return chain
+
+
+def _banded_alignment(a, b, band):
+    """
+    Edit-distance alignment of two lists of words, restricted to a band around the diagonal: the cost is
+    O((len(a) + len(b)) * band)
+    :return: list of (position in a, position in b) of the matched or substituted words
+    """
+    m, n = len(a), len(b)
+    if not m or not n:
+        return []
+    # row i covers the columns around the diagonal, from the center of row i to the center of row i+1
+    lows = [max(0, (i * n) // m - band) for i in range(m + 1)]
+    highs = [min(n, -(-(i + 1) * n // m) + band) for i in range(m + 1)]
+    costs = []
+    moves = []
+    for i in range(m + 1):
+        low, high = lows[i], highs[i]
+        row_costs = [0] * (high - low + 1)
+        row_moves = [0] * (high - low + 1)
+        for j in range(low, high + 1):
+            if i == 0:
+                cost, move = j, 2
+            else:
+                prev_low, prev_high = lows[i - 1], highs[i - 1]
+                prev_costs = costs[i - 1]
+                cost, move = math.inf, 1
+                if prev_low <= j - 1 <= prev_high:  # match or substitution
+                    cost = prev_costs[j - 1 - prev_low] + (a[i - 1] != b[j - 1])
+                    move = 0
+                if prev_low <= j <= prev_high and prev_costs[j - prev_low] + 1 < cost:     # a[i-1] not in b
+                    cost, move = prev_costs[j - prev_low] + 1, 1
+            if j > low and row_costs[j - 1 - low] + 1 < cost:   # b[j-1] not in a
+                cost, move = row_costs[j - 1 - low] + 1, 2
+            row_costs[j - low] = cost
+            row_moves[j - low] = move
+        costs.append(row_costs)
+        moves.append(row_moves)
+    pairs = []
+    i, j = m, n
+    while i > 0 and j > 0:
+        move = moves[i][j - lows[i]]
+        if move == 0:
+            i, j = i - 1, j - 1
+            pairs.append((i, j))
+        elif move == 1:
+            i -= 1
+        else:
+            j -= 1
+    pairs.reverse()
+    return pairs
+
+
+def split_transcript(transcript, length):
+    """
+    Splits the transcript after a number of unpunctuated characters, as counted by align_sentences.
+    A chunk that straddles the limit is cut between words, both parts keeping the chunk timestamps.
+    :param transcript: timestamped transcript
+    :param length: number of unpunctuated characters (without spaces) of the first part
+    :return: the transcript chunks before and after the limit
+    """
+    consumed = 0
+    for i, chunk in enumerate(transcript):
+        chunk_length = len(_unpunctuated(chunk["text"]))
+        if consumed + chunk_length <= length:
+            consumed += chunk_length
+            continue
+        words = chunk["text"].split()
+        k = 0
+        while k < len(words) and consumed < length:
+            consumed += len(_unpunctuated(words[k]))
+            k += 1
+        before = transcript[:i]
+        after = transcript[i+1:]
+        if k > 0:
+            before.append(dict(chunk, text=" ".join(words[:k])))
+        if k < len(words):
+            after.insert(0, dict(chunk, text=" ".join(words[k:])))
+        return before, after
+    return list(transcript), []
+
+
+def unpunctuated_length(text):
+    """
+    :return: the number of characters of the text, as counted by the aligners
+    """
+    return len(_unpunctuated(text))
 
 
 def align_paragraphs(transcript, paragraphs):
@@ -103,6 +314,18 @@ def align_paragraphs(transcript, paragraphs):
     para_struct = []
     for para in paragraphs:
         para_struct.append({"text": " ".join(para)})
-    align_ok, num_para, aligned_para = align_sentences(transcript, para_struct, max_distance=5000)
+    align_ok, num_para, aligned_para = align_with_fallback(transcript, para_struct, max_distance=5000)
     return align_ok, num_para, para_struct
 
+
+def align_with_fallback(transcript, sentences, max_distance=2000):
+    """
+    Aligns sentences with the exact algorithm, and falls back to the fuzzy one if some chunks could not be matched
+    :return: same as align_sentences
+    """
+    result = align_sentences(transcript, sentences, max_distance=max_distance)
+    if not result[0]:
+        logger.info("Exact alignment failed, trying fuzzy alignment")
+        result = align_sentences_fuzzy(transcript, sentences)
+    return result
+
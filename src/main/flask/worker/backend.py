@@ -0,0 +1,30 @@
+"""
+Inference backends for the deep-learning models used by the worker.
+Howler models are loaded by Howler with full-precision torch: their transformers pipeline (the `nlp` attribute)
+is converted after loading, with overton.backends (shared with overton.nlp, and copied in the worker image).
+"""
+import logging
+
+from overton.backends import BACKENDS, convert_model
+
+logger = logging.getLogger(__name__)
+
+
+def apply_backend(tool, backend):
+    """
+    Switches the transformers pipeline of a tool (Pso, SentenceBuilder) to another inference backend
+    :param tool: the tool, with its pipeline in the `nlp` attribute
+    :param backend: "torch" (no change), "int8" (dynamic INT8 quantization) or "onnx" (ONNX Runtime)
+    :return: the tool
+    """
+    if backend not in BACKENDS:
+        raise ValueError("Unknown inference backend %s, expected one of %s" % (backend, ", ".join(BACKENDS)))
+    if backend == "torch":
+        return tool
+    nlp = getattr(tool, "nlp", None)
+    if nlp is None or not hasattr(nlp, "model"):
+        logger.warning("%s has no transformers pipeline, keeping torch backend", type(tool).__name__)
+        return tool
+    nlp.model = convert_model(nlp.model, backend)
+    logger.info("%s uses %s inference backend", type(tool).__name__, backend)
+    return tool
@@ -0,0 +1,200 @@
+"""
+Micro-batching of model calls across tasks.
+When the worker runs several tasks at once (--pool=threads), the inputs they send to the deep-learning models
+are collected during a short time window and processed as a single batch, by a single thread.
+"""
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    def __init__(self, items):
+        self.items = items
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Runs a batch function on the inputs submitted by several threads.
+    A batch starts with the first pending request, and is completed with requests arriving within max_wait seconds,
+    up to max_batch_size inputs.
+    The batch function is always called from the same thread.
+    """
+    def __init__(self, batch_fn, max_batch_size=64, max_wait=0.02, name="batcher"):
+        """
+        :param batch_fn: function taking a list of inputs and returning the list of their results
+        :param max_batch_size: max number of inputs in a batch (a bigger single request is processed as is)
+        :param max_wait: max time (in seconds) to wait for other requests once a batch is started
+        :param name: name of the batching thread
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._start()
+
+    def _start(self):
+        # threads do not survive a fork: a batcher created before forking worker processes is started again in each
+        # process on its first use
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self._queue,), name=self.name, daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, items):
+        """
+        Submits inputs and waits for their results
+        :param items: list of inputs
+        :return: list of results, in the same order
+        """
+        if not items:
+            return []
+        if self._pid != os.getpid():
+            self._start()
+        request = _Request(list(items))
+        self._queue.put(request)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.results
+
+    def _collect(self, requests):
+        batch = [requests.get()]
+        size = len(batch[0].items)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.items)
+        return batch
+
+    def _run(self, requests):
+        while True:
+            batch = self._collect(requests)
+            items = [item for request in batch for item in request.items]
+            try:
+                results = self.batch_fn(items)
+                start = 0
+                for request in batch:
+                    request.results = results[start:start + len(request.items)]
+                    start += len(request.items)
+            except Exception as e:
+                logger.warning("Batch of %d inputs failed: %s", len(items), e)
+                for request in batch:
+                    request.error = e
+            finally:
+                self.batches += 1
+                self.items += len(items)
+                for request in batch:
+                    request.done.set()
+
+
+class BatchedPso:
+    """
+    PSO classifier whose calls are batched across tasks
+    """
+    def __init__(self, pso, **kwargs):
+        """
+        :param pso: the PSO classifier, with a classify_batch method
+        :param kwargs: MicroBatcher parameters
+        """
+        self.pso = pso
+        self.batcher = MicroBatcher(pso.classify_batch, name="pso-batcher", **kwargs)
+
+    def classify(self, text):
+        return self.batcher.submit([text])[0]
+
+    def classify_batch(self, texts, batch_size=None):
+        return self.batcher.submit(texts)
+
+
+class BatchedSentenceBuilder:
+    """
+    Sentence builder whose calls are batched across tasks
+    """
+    def __init__(self, sentence_builder, **kwargs):
+        """
+        :param sentence_builder: the sentence builder, with a rebuild_sentences_batch method
+        :param kwargs: MicroBatcher parameters
+        """
+        self.sentence_builder = sentence_builder
+        self.batcher = MicroBatcher(sentence_builder.rebuild_sentences_batch, name="sentence-builder-batcher",
+                                    **kwargs)
+
+    def rebuild_sentences(self, text):
+        return self.batcher.submit([text])[0]
+
+    def __getattr__(self, name):
+        return getattr(self.sentence_builder, name)
+
+
+class SerializedTool:
+    """
+    Tool called by one task at a time. For tools that cannot process several inputs at once: their models are not
+    thread-safe (the fast tokenizers of transformers pipelines fail with "Already borrowed")
+    """
+    def __init__(self, tool):
+        """
+        :param tool: the tool, whose methods are called under a lock
+        """
+        self.tool = tool
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.tool, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+        return call
+
+
+def batched_pso(pso, **kwargs):
+    """
+    Batches the calls to a PSO classifier across tasks, if it can process several sentences at once.
+    Otherwise the classifier is called by one task at a time
+    :param pso: the PSO classifier
+    :param kwargs: MicroBatcher parameters
+    :return: a BatchedPso, or a SerializedTool if the classifier has no classify_batch method
+    """
+    if not hasattr(pso, "classify_batch"):
+        logger.info("%s has no classify_batch, PSO calls are not batched but serialized", type(pso).__name__)
+        return SerializedTool(pso)
+    return BatchedPso(pso, **kwargs)
+
+
+def batched_sentence_builder(sentence_builder, **kwargs):
+    """
+    Batches the calls to a sentence builder across tasks, if it can process several texts at once.
+    Otherwise the builder is called by one task at a time
+    :param sentence_builder: the sentence builder
+    :param kwargs: MicroBatcher parameters
+    :return: a BatchedSentenceBuilder, or a SerializedTool if the builder has no rebuild_sentences_batch method
+    """
+    if not hasattr(sentence_builder, "rebuild_sentences_batch"):
+        logger.info("%s has no rebuild_sentences_batch, sentence builder calls are not batched but serialized",
+                    type(sentence_builder).__name__)
+        return SerializedTool(sentence_builder)
+    return BatchedSentenceBuilder(sentence_builder, **kwargs)
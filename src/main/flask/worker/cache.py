@@ -0,0 +1,182 @@
+"""
+Caches of the worker. The SQLite cache shared by the workers is overton.cache.PersistentCache (copied in the worker
+image, see Dockerfile)
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+
+from overton.cache import LRUCache, PersistentCache
+
+logger = logging.getLogger(__name__)
+
+
+class CachedExtractor:
+    """
+    Wraps the term extractor (Howler) so that the terms and categories of an already processed text
+    are read from a persistent cache instead of being computed again.
+    Other methods are delegated to the wrapped extractor.
+    """
+    def __init__(self, extractor, cache: PersistentCache):
+        self.extractor = extractor
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, text):
+        key = hashlib.sha1(text.encode("utf8")).hexdigest()
+        terms = self.cache.get(key)
+        if terms is None:
+            self.misses += 1
+            terms = self.extractor(text)
+            try:
+                self.cache.put(key, terms)
+            except (TypeError, ValueError) as e:
+                logger.warning("Cannot store extracted terms in cache: %s", e)
+        else:
+            self.hits += 1
+        return terms
+
+    def __getattr__(self, name):
+        return getattr(self.extractor, name)
+
+
+def model_version(tool, backend="torch"):
+    """
+    Identifies the model of a tool, so that cached results of different models (or backends) never mix
+    :param tool: the tool (e.g. Pso), with its transformers pipeline in the `nlp` attribute
+    :param backend: the inference backend
+    :return: a version string, e.g. "mazancourt/politics-sentence-classifier@<revision>/int8"
+    """
+    config = getattr(getattr(getattr(tool, "nlp", None), "model", None), "config", None)
+    name = getattr(config, "name_or_path", None) or type(tool).__name__
+    revision = getattr(config, "_commit_hash", None)
+    return "%s@%s/%s" % (name, revision, backend) if revision else "%s/%s" % (name, backend)
+
+
+class CachedPso:
+    """
+    Wraps the PSO classifier so that the label of an already classified sentence is read from a cache:
+    an in-process LRU cache, then an optional Redis cache shared by all workers.
+    Keys are hashes of the model version and of the normalized sentence.
+    """
+    PREFIX = "overton:pso:"
+
+    def __init__(self, pso, version, maxsize=100000, redis_url=None, ttl=30 * 24 * 3600, log_every=10000):
+        """
+        :param pso: the PSO classifier
+        :param version: model version, see model_version()
+        :param maxsize: max number of sentences in the in-process cache
+        :param redis_url: URL of the Redis server (no shared cache if None)
+        :param ttl: Redis entries expire after ttl seconds
+        :param log_every: cache statistics are logged every log_every sentences
+        """
+        self.pso = pso
+        self.version = version
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.log_every = log_every
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url)
+        self._lru = LRUCache(maxsize)
+        # guards the counters (the LRU cache has its own lock)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text):
+        text = unicodedata.normalize("NFC", text)
+        return re.sub(r"\s+", " ", text).strip()
+
+    def key(self, text):
+        return hashlib.sha1((self.version + "\n" + self.normalize(text)).encode("utf8")).hexdigest()
+
+    def classify(self, text):
+        return self.classify_batch([text])[0]
+
+    def classify_batch(self, texts, batch_size=32):
+        """
+        Classifies a list of texts, running the classifier on cache misses only
+        :param texts: list of texts to classify
+        :param batch_size: max number of texts per forward pass
+        :return: list of (label, score) couples, in the same order as the input texts
+        """
+        keys = [self.key(text) for text in texts]
+        counts = Counter(keys)
+        results = {}
+        for key in counts:
+            result = self._lru.get(key)
+            if result is not None:
+                results[key] = result
+        with self._lock:
+            self.hits += sum(counts[key] for key in results)
+        if self.redis and len(results) < len(counts):
+            shared = self._redis_get([key for key in counts if key not in results])
+            with self._lock:
+                self.redis_hits += sum(counts[key] for key in shared)
+            results.update(shared)
+            self._remember(shared)
+        to_classify = OrderedDict()
+        for key, text in zip(keys, texts):
+            if key not in results:
+                to_classify.setdefault(key, text)
+        if to_classify:
+            with self._lock:
+                self.misses += sum(counts[key] for key in to_classify)
+            if hasattr(self.pso, "classify_batch"):
+                outputs = self.pso.classify_batch(list(to_classify.values()), batch_size=batch_size)
+            else:
+                outputs = [self.pso.classify(text) for text in to_classify.values()]
+            computed = {key: (label, score) for key, (label, score) in zip(to_classify, outputs)}
+            results.update(computed)
+            self._remember(computed)
+            if self.redis:
+                self._redis_put(computed)
+        self._log_stats(len(keys))
+        return [results[key] for key in keys]
+
+    def _remember(self, results):
+        for key, result in results.items():
+            self._lru.put(key, result)
+
+    def _redis_get(self, keys):
+        try:
+            values = self.redis.mget([self.PREFIX + key for key in keys])
+        except Exception as e:
+            logger.warning("PSO cache: cannot read from Redis: %s", e)
+            return {}
+        return {key: tuple(json.loads(value)) for key, value in zip(keys, values) if value is not None}
+
+    def _redis_put(self, results):
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, (label, score) in results.items():
+                pipe.set(self.PREFIX + key, json.dumps([label, score]), ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("PSO cache: cannot write to Redis: %s", e)
+
+    def _log_stats(self, count):
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+        if self.log_every and lookups // self.log_every != (lookups - count) // self.log_every:
+            logger.info("PSO cache: %s", self.stats())
+
+    def stats(self):
+        with self._lock:
+            hits, redis_hits, misses = self.hits, self.redis_hits, self.misses
+        lookups = hits + redis_hits + misses
+        return {"hits": hits, "redis_hits": redis_hits, "misses": misses,
+                "size": len(self._lru), "maxsize": self.maxsize,
+                "hit_rate": (hits + redis_hits) / lookups if lookups else 0.0}
+
+    def __getattr__(self, name):
+        return getattr(self.pso, name)
@@ -0,0 +1,54 @@
+"""
+Callbacks (webhooks) posted by the workers to URLs given by the clients
+"""
+import json
+import urllib.parse
+import urllib.request
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # a redirect could lead to a host which is not allowed
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_OPENER = urllib.request.build_opener(_NoRedirect)
+
+
+def allowed_hosts(value):
+    """
+    :param value: comma-separated list of hosts, e.g. "crm.example.org, *.example.com"
+    :return: the list of hosts, lowercase
+    """
+    return [host.strip().lower() for host in (value or "").split(",") if host.strip()]
+
+
+def check_callback(url, hosts):
+    """
+    Checks that a callback URL is http(s) and targets an allowed host
+    :param url: the callback URL
+    :param hosts: the allowed hosts (see allowed_hosts): a host, or *.domain for all the sub-domains of a domain
+    :raise ValueError: if the URL is not allowed
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ("http", "https"):
+        raise ValueError("Callback URL shall be http or https: %s" % url)
+    host = (parsed.hostname or "").lower()
+    for allowed in hosts:
+        if host == allowed or (allowed.startswith("*.") and host.endswith(allowed[1:])):
+            return
+    raise ValueError("Callback host is not allowed: %s" % (host or url))
+
+
+def post_json(url, data, timeout=10):
+    """
+    Posts a JSON message, without following redirects
+    :param url: the URL
+    :param data: the message
+    :param timeout: connection and read timeout, in seconds
+    :raise urllib.error.URLError: on connection errors and HTTP errors (including redirects)
+    """
+    request = urllib.request.Request(url, data=json.dumps(data).encode("utf8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    with _OPENER.open(request, timeout=timeout) as response:
+        response.read()
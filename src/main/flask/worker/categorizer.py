@@ -1,5 +1,4 @@
 import logging
-import re
 from collections import defaultdict
 from operator import itemgetter
 
@@ -7,6 +6,8 @@ import math
 from howler import helper_get_subsequences
 from nltk import word_tokenize
 
+from worker.matcher import TermMatcher
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,22 +24,16 @@ def categorize_sentences(sentences, fulltext, categorizer, legacy=True):
     terms = categorizer(fulltext)
     logger.info("Mapping terms to sentences")
     if terms:
-        lookup_term_re = {}
-        for term in terms:
-            lookup_term_re[term] = re.compile(r"\b" + re.escape(term) + r"\b", re.IGNORECASE)
+        matcher = TermMatcher(terms)
+        subterms = build_subterm_index(terms)
         for sent in sentences:
             if legacy:
                 sent["categories"] = {}
-            sentence_terms = []
-            for term in terms:
-                if re.search(lookup_term_re[term], sent["text"]):
-                    sentence_terms.append(term)
+            sentence_terms = matcher.find(sent["text"])
             # remove sub-terms, except those from the classification
-            all_subsequences = []
+            all_subsequences = set()
             for term in sentence_terms:
-                all_subsequences.extend(helper_get_subsequences(term))
-                if " " in term:
-                    all_subsequences.extend(word_tokenize(term))
+                all_subsequences.update(subterms[term])
             sentence_terms = [t for t in sentence_terms if t not in all_subsequences or terms[t]["match"] == "direct"]
             # Now compute the best category for the sentence
             sentence_categories = defaultdict(float)
@@ -75,5 +70,20 @@ def categorize_sentences(sentences, fulltext, categorizer, legacy=True):
         logger.warning("No terms found")
 
 
+def build_subterm_index(terms):
+    """
+    Computes the sub-terms of each extracted term, once for the whole document
+    :param terms: the extracted terms
+    :return: a dict mapping each term to the set of extracted terms it contains
+    """
+    index = {}
+    for term in terms:
+        contained = set(helper_get_subsequences(term))
+        if " " in term:
+            contained.update(word_tokenize(term))
+        index[term] = contained.intersection(terms)
+    return index
+
+
 def categorize_paragraphs(paragraphs, fulltext, extractor):
     categorize_sentences(paragraphs, fulltext, extractor, legacy=False)
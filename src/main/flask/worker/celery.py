@@ -1,5 +1,29 @@
 from celery import Celery
 
+from worker.serialization import register_serializers, serializer_name
+
+
+def celery_config(config):
+    """
+    Celery configuration shared by the web application and the workers
+    :param config: the Flask configuration
+    :return: the Celery configuration
+    """
+    serializer = serializer_name(config["CELERY_SERIALIZER"], config["CELERY_COMPRESSION"])
+    # all serializers are accepted, so that clients and workers with different settings still understand each other's
+    # task messages. Stored results carry no content type: /result decodes them with result_serializer, /wait and
+    # /batch_status recognize their format (see decode_stored)
+    accepted = register_serializers()
+    return {
+        "broker_url": config['CELERY_BACKEND'],
+        "result_backend": config['CELERY_BACKEND'],
+        "task_serializer": serializer,
+        "result_serializer": serializer,
+        "accept_content": accepted,
+        "result_accept_content": accepted,
+        "result_expires": config["RESULT_EXPIRES"],
+    }
+
 
 def make_celery(app):
     celery = Celery(app.import_name)
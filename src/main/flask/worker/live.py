@@ -0,0 +1,65 @@
+"""
+State of live transcript jobs, kept in Redis between two appends of transcript chunks
+"""
+import json
+
+import redis
+
+
+class OutOfOrder(Exception):
+    """
+    An append to a live job arrived before the previous ones were processed
+    """
+
+
+class LiveJobStore:
+    """
+    Stores the state of incremental (live) transcript jobs. The state is a JSON-serializable dict.
+    """
+    PREFIX = "overton:live:"
+
+    def __init__(self, redis_url, ttl=6 * 3600):
+        """
+        :param redis_url: URL of the Redis server (usually the Celery backend)
+        :param ttl: jobs without any append for ttl seconds are forgotten
+        """
+        self.redis = redis.Redis.from_url(redis_url)
+        self.ttl = ttl
+
+    def load(self, job_id) -> dict:
+        data = self.redis.get(self.PREFIX + job_id)
+        return json.loads(data) if data else {}
+
+    def save(self, job_id, state: dict):
+        self.redis.set(self.PREFIX + job_id, json.dumps(state), ex=self.ttl)
+
+    def delete(self, job_id):
+        self.redis.delete(self.PREFIX + job_id)
+
+    def lock(self, job_id, timeout=600):
+        """
+        Lock on the job, so that two appends to the same job are never processed at the same time
+        """
+        return self.redis.lock(self.PREFIX + job_id + ":lock", timeout=timeout)
+
+    def append(self, job_id, seq, update, final=False):
+        """
+        Processes an append to a job under the job lock, in the order of the appends
+        :param job_id: the live job id
+        :param seq: rank of the append in the job, starting at 0, or None to process appends as they arrive
+        :param update: function updating the job state (dict) by side effect, and returning the result of the append
+        :param final: True for the last append of the job: the state is then reduced to the rank of the append
+        :return: the result of update, or None if this append was already processed
+        :raise OutOfOrder: if a previous append is not processed yet
+        """
+        with self.lock(job_id):
+            state = self.load(job_id)
+            expected = state.get("seq", 0)
+            if seq is not None and seq > expected:
+                raise OutOfOrder("append %d of job %s received before append %d" % (seq, job_id, expected))
+            if seq is not None and seq < expected:
+                return None
+            result = update(state)
+            # a final job keeps its rank only, so that a repeated final append is recognized
+            self.save(job_id, {"seq": expected + 1} if final else dict(state, seq=expected + 1))
+        return result
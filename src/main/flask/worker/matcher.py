@@ -0,0 +1,95 @@
+"""
+Multi-term matching: finds which terms of a (large) list occur in a text with a single scan of the text
+"""
+from collections import deque
+
+
+def _fold(text):
+    """
+    Lowercase text, keeping one character per input character so that offsets are preserved
+    """
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _is_word_char(c):
+    return c.isalnum() or c == "_"
+
+
+def _is_boundary(text, pos):
+    """
+    Same as regex \\b: True if pos lies between a word character and a non-word one (or text limits)
+    """
+    before = pos > 0 and _is_word_char(text[pos - 1])
+    after = pos < len(text) and _is_word_char(text[pos])
+    return before != after
+
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton built from a list of terms.
+    A term is found in a text under the same conditions as re.search(r"\\b" + re.escape(term) + r"\\b", text,
+    re.IGNORECASE): case-insensitive and delimited by word boundaries.
+    """
+    def __init__(self, terms):
+        """
+        :param terms: the terms to look for (any iterable, e.g. the dict of extracted terms)
+        """
+        self.rank = {}
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for term in terms:
+            if term in self.rank:
+                continue
+            self.rank[term] = len(self.rank)
+            key = _fold(term)
+            if key:
+                self._add(key, term)
+        self._build_failure_links()
+
+    def _add(self, key, term):
+        state = 0
+        for c in key:
+            next_state = self.goto[state].get(c)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][c] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((len(key), term))
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and c not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(c, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """
+        Finds the terms occurring in the text
+        :param text: the text to scan
+        :return: the list of terms found, in the order they were given to the matcher
+        """
+        found = set()
+        goto = self.goto
+        fail = self.fail
+        state = 0
+        for i, c in enumerate(_fold(text)):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for length, term in self.output[state]:
+                if term not in found and _is_boundary(text, i - length + 1) and _is_boundary(text, i + 1):
+                    found.add(term)
+        return sorted(found, key=self.rank.get)
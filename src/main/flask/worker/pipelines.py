@@ -12,7 +12,7 @@ from speechlib import Zone
 
 #from icecream import ic
 
-from worker.aligner import align_sentences, align_paragraphs
+from worker.aligner import align_with_fallback, align_paragraphs, split_transcript, unpunctuated_length
 from worker.categorizer import categorize_sentences, categorize_paragraphs
 from worker.tag_persons import tag_person_names, attribute_paragraphs, collect_orgs
 from worker.utils import Tools
@@ -38,23 +38,40 @@ def repunctuate(text, punct):
     return sentences
 
 
-def qualify_sentences(sentences, pso):
+def qualify_sentences(sentences, pso, batch_size=32):
     """
     Apply PSO categorizer to each sentence
+    Sentences are sent by batches when the categorizer supports it (see Pso.classify_batch, worker.pso.batch_pso)
     :param sentences: list of sentences
     :param pso: PSO categorizer
+    :param batch_size: number of sentences per batch
     :return: the sentences enhanced with a "type" field
     """
     logger.info("Qualify sentence type")
+    to_classify = []
     for sent in sentences:
-        if len(sent) < 2000 and pso:
+        if len(sent["text"]) < 2000 and pso:
+            to_classify.append(sent)
+        else:
+            sent["type"] = "na"
+    if not to_classify:
+        return
+    results = None
+    if hasattr(pso, "classify_batch"):
+        try:
+            results = pso.classify_batch([sent["text"] for sent in to_classify], batch_size=batch_size)
+        except RuntimeError as e:
+            logger.warning("Caught runtime error while categorizing sentences by batch, retrying one by one: %s", e)
+    if results is not None:
+        for sent, (label, _) in zip(to_classify, results):
+            sent["type"] = label
+    else:
+        for sent in to_classify:
             try:
                 sent["type"] = pso.classify(sent["text"])[0]
             except RuntimeError as e:
-                logger.warning("Caught runtime error while categorizing sentence : ", e)
+                logger.warning("Caught runtime error while categorizing sentence : %s", e)
                 sent["type"] = "other"
-        else:
-            sent["type"] = "na"
 
 
 def tile_sentences(sentences):
@@ -124,7 +141,7 @@ def transcript_pipeline(speech, pso, punct, categorizer, namer) -> dict:
             filtered_transcript.append(chunk)
     fulltext = "\n".join([t["text"] for t in filtered_transcript])
     sentences = repunctuate(fulltext, punct)
-    align_sentences(filtered_transcript, sentences)
+    align_with_fallback(filtered_transcript, sentences)
     tile_sentences(sentences)
     qualify_sentences(sentences, pso)
     categorize_sentences(sentences, fulltext, categorizer)
@@ -159,6 +176,40 @@ def transcript_hot_pipeline(speech, tools:Tools, zone:Zone) -> dict:
     return speech
 
 
+def transcript_live_pipeline(state: dict, chunks: list, tools: Tools, final=False) -> list:
+    """
+    Incremental version of transcript_hot_pipeline, for transcripts received chunk by chunk (live events)
+    Only the tail of the transcript - the chunks that are not part of a frozen paragraph - is repunctuated, tiled and
+    aligned. Then all paragraphs of the tail but the last one, which may be unfinished, are frozen and never computed
+    again.
+    :param state: the job state, updated by side effect. Empty for the first chunks
+    :param chunks: the new transcript chunks
+    :param tools: the parsing tools
+    :param final: True if the transcript is complete: all paragraphs are frozen
+    :return: the newly frozen paragraphs and the current unfinished one, with their "chunk_id" and a "frozen" flag
+    """
+    tail = state.setdefault("tail", [])
+    frozen = state.setdefault("frozen", 0)
+    for chunk in chunks:
+        if not re.match(r"\[\w+?]", chunk["text"]):  # discard elements like "[Music]"
+            tail.append(chunk)
+    if not tail:
+        return []
+    fulltext = "\n".join([t["text"] for t in tail])
+    sentences = repunctuate(fulltext, tools.sentence_builder)
+    paragraphs = tools.text_tiler.tile_text("\n\n".join([s["text"] for s in sentences]))
+    align_ok, num_para, para = align_paragraphs(tail, paragraphs)
+    num_frozen = len(para) if final else len(para) - 1
+    for i, p in enumerate(para):
+        p["chunk_id"] = frozen + i
+        p["frozen"] = i < num_frozen
+    if num_frozen > 0:
+        frozen_length = sum(unpunctuated_length(p["text"]) for p in para[:num_frozen])
+        state["tail"] = split_transcript(tail, frozen_length)[1]
+        state["frozen"] = frozen + num_frozen
+    return para
+
+
 def create_parse_slot(field, speech):
     if "_parsed" not in speech:
         speech["_parsed"] = {}
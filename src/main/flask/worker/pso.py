@@ -0,0 +1,90 @@
+"""
+Batched classification for the PSO classifier of Howler, which only classifies one sentence at a time
+"""
+import logging
+
+from overton.backends import classify_batch
+
+logger = logging.getLogger(__name__)
+
+# tasks of the transformers pipelines that return one {"label", "score"} per text
+CLASSIFICATION_TASKS = ("text-classification", "sentiment-analysis")
+
+
+class PipelinePso:
+    """
+    Adds classify_batch to a PSO classifier whose classify() is a plain call to its transformers text classification
+    pipeline (the `nlp` attribute), as Howler's Pso. Sentences are sent to the pipeline by batches, as
+    overton.nlp.Pso.classify_batch does, unless check() found that the batches differ from classify().
+    Other methods are delegated to the wrapped classifier.
+    """
+    def __init__(self, pso):
+        self.pso = pso
+        self.nlp = pso.nlp
+        self.batched = True
+
+    def classify(self, text):
+        return self.pso.classify(text)
+
+    def classify_batch(self, texts, batch_size=32):
+        """
+        :param texts: list of texts to classify
+        :param batch_size: max number of texts per forward pass
+        :return: list of (label, score) couples, in the same order as the input texts
+        """
+        if not self.batched:
+            return [self.pso.classify(text) for text in texts]
+        return classify_batch(self.nlp, texts, batch_size=batch_size)
+
+    def check(self, text):
+        """
+        Classifies a text both ways, and falls back to one by one classification if the results differ, i.e. if
+        the classify() of the wrapped classifier does more than calling its pipeline.
+        Runs inference: call it in the process that runs the tasks (see tasks._warm_up), not before a fork
+        :param text: a sample text
+        :return: True if batches are used
+        """
+        expected = self.pso.classify(text)
+        found = classify_batch(self.nlp, [text])[0]
+        if expected[0] != found[0] or abs(expected[1] - found[1]) > 1e-3:
+            logger.warning("%s does not match its pipeline (%s vs %s), sentences are classified one by one",
+                           type(self.pso).__name__, expected, found)
+            self.batched = False
+        return self.batched
+
+    def __getattr__(self, name):
+        return getattr(self.pso, name)
+
+
+def batch_pso(pso):
+    """
+    Gives batched classification to a PSO classifier, if it does not have it already and classifies with a
+    transformers text classification pipeline. Does not run any inference
+    :param pso: the PSO classifier
+    :return: the classifier, or a PipelinePso wrapping it
+    """
+    if hasattr(pso, "classify_batch"):
+        return pso
+    nlp = getattr(pso, "nlp", None)
+    if getattr(nlp, "tokenizer", None) is None or getattr(nlp, "task", None) not in CLASSIFICATION_TASKS:
+        logger.info("%s has no text classification pipeline, sentences are classified one by one",
+                    type(pso).__name__)
+        return pso
+    return PipelinePso(pso)
+
+
+def warm_up_pso(pso, text):
+    """
+    Classifies a text with the PSO classifier, bypassing its wrappers (cache, micro-batching), and checks
+    the batches of a PipelinePso against its classify()
+    :param pso: the PSO classifier, possibly wrapped
+    :param text: a sample text
+    """
+    inner = pso
+    # wrappers delegate unknown attributes: only look at their own
+    while not isinstance(inner, PipelinePso) and "pso" in getattr(inner, "__dict__", {}):
+        inner = inner.pso
+    if isinstance(inner, PipelinePso):
+        inner.check(text)
+    else:
+        inner.classify(text)
@@ -0,0 +1,124 @@
+"""
+Compressed variants of the json and msgpack serializers, registered in kombu as "<serializer>-<compression>",
+e.g. "msgpack-zstd". Compression applies to task arguments as well as to results stored in the backend.
+"""
+import gzip
+import json
+import threading
+
+from kombu.serialization import dumps, loads, register
+
+SERIALIZERS = ("json", "msgpack")
+
+
+def _compressors():
+    compressors = {"gzip": (gzip.compress, gzip.decompress)}
+    try:
+        import zstandard
+    except ImportError:
+        return compressors
+    # zstandard (de)compressors are not thread-safe: one pair per thread (worker --pool=threads, Flask threads)
+    local = threading.local()
+
+    def compress(data):
+        if not hasattr(local, "compressor"):
+            local.compressor = zstandard.ZstdCompressor()
+        return local.compressor.compress(data)
+
+    def decompress(data):
+        if not hasattr(local, "decompressor"):
+            local.decompressor = zstandard.ZstdDecompressor()
+        return local.decompressor.decompress(data)
+
+    compressors["zstd"] = (compress, decompress)
+    return compressors
+
+
+COMPRESSORS = _compressors()
+# first bytes of compressed payloads
+MAGIC_NUMBERS = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+
+
+def _register(serializer, compression):
+    compress, decompress = COMPRESSORS[compression]
+    content_type, content_encoding, _ = dumps(None, serializer=serializer)
+
+    def encode(data):
+        _, _, payload = dumps(data, serializer=serializer)
+        return compress(payload.encode("utf8") if isinstance(payload, str) else payload)
+
+    def decode(payload):
+        # the compressed content type was accepted: the inner serializer is accepted as well
+        return loads(decompress(payload), content_type, content_encoding, force=True)
+
+    register(serializer + "-" + compression, encode, decode,
+             content_type="application/x-%s-%s" % (serializer, compression), content_encoding="binary")
+
+
+def register_serializers():
+    """
+    Registers the compressed variants of the serializers available
+    :return: the names of all usable serializers, compressed or not
+    """
+    names = []
+    for serializer in SERIALIZERS:
+        try:
+            dumps(None, serializer=serializer)
+        except Exception:
+            continue    # msgpack not installed
+        names.append(serializer)
+        for compression in COMPRESSORS:
+            _register(serializer, compression)
+            names.append(serializer + "-" + compression)
+    return names
+
+
+def serializer_name(serializer, compression=None):
+    """
+    :param serializer: json or msgpack
+    :param compression: None, gzip or zstd
+    :return: the name of the registered serializer
+    """
+    if serializer not in SERIALIZERS:
+        raise ValueError("Unknown serializer %s, expected one of %s" % (serializer, ", ".join(SERIALIZERS)))
+    if not compression:
+        return serializer
+    if compression not in COMPRESSORS:
+        raise ValueError("Compression %s is not available (zstd requires the zstandard package)" % compression)
+    return serializer + "-" + compression
+
+
+def _stored_payload(payload):
+    """
+    :return: the payload decompressed if needed, and its content type and encoding
+    """
+    for magic, compression in MAGIC_NUMBERS.items():
+        if payload.startswith(magic):
+            payload = COMPRESSORS[compression][1](payload)
+            break
+    # results are dicts: "{" in JSON, a map (0x80-0x8f, 0xde or 0xdf) in msgpack
+    if payload[:1] == b"{":
+        return payload, "application/json", "utf-8"
+    return payload, "application/x-msgpack", "binary"
+
+
+def decode_stored(payload):
+    """
+    Decodes a result stored in the backend. The backend stores the serialized result only, without its content type:
+    the serializer is recognized from the payload, so that results stored by workers with other settings are read too
+    :param payload: the stored result
+    :return: the decoded result
+    """
+    data, content_type, content_encoding = _stored_payload(payload)
+    return loads(data, content_type, content_encoding, force=True)
+
+
+def stored_as_json(payload):
+    """
+    :param payload: a result stored in the backend, by any serializer
+    :return: the result as JSON: the payload itself if it is stored as JSON, else the payload converted to JSON
+    """
+    data, content_type, content_encoding = _stored_payload(payload)
+    if content_type == "application/json":
+        return data
+    return json.dumps(loads(data, content_type, content_encoding, force=True)).encode("utf8")
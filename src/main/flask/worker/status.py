@@ -0,0 +1,82 @@
+"""
+Status of the tasks, kept in Redis apart from their results
+"""
+import redis
+
+
+class TaskStatusStore:
+    """
+    Stores the status (STARTED, SUCCESS, FAILURE...) of each task under its own small key, so that the progress of
+    a batch is read without transferring and decoding the results of its tasks, which may be large and compressed.
+    """
+    PREFIX = "overton:status:"
+
+    def __init__(self, redis_url, ttl=24 * 3600):
+        """
+        :param redis_url: URL of the Redis server (usually the Celery backend)
+        :param ttl: statuses are forgotten after ttl seconds, as results are (RESULT_EXPIRES)
+        """
+        self.redis = redis.Redis.from_url(redis_url)
+        self.ttl = ttl
+
+    def set(self, task_id, status):
+        self.redis.set(self.PREFIX + task_id, status, ex=self.ttl)
+
+    def get_many(self, task_ids):
+        """
+        :param task_ids: list of task-ids
+        :return: the list of statuses, None for the tasks without a stored status (not started yet, or run by a
+        worker that does not store statuses)
+        """
+        if not task_ids:
+            return []
+        values = self.redis.mget([self.PREFIX + task_id for task_id in task_ids])
+        return [value.decode() if value is not None else None for value in values]
+
+
+class BatchProgress:
+    """
+    Counts the finished chunks of the batches that have a completion callback, so that the callback is sent by the
+    worker that finishes the last chunk, without reading the results of the other chunks.
+    """
+    PREFIX = "overton:batch:"
+
+    def __init__(self, redis_url, ttl=24 * 3600):
+        """
+        :param redis_url: URL of the Redis server (usually the Celery backend)
+        :param ttl: batches are forgotten after ttl seconds, as results are (RESULT_EXPIRES)
+        """
+        self.redis = redis.Redis.from_url(redis_url)
+        self.ttl = ttl
+
+    def start(self, batch_id, chunks, callback):
+        """
+        :param batch_id: the batch id
+        :param chunks: number of chunk tasks of the batch
+        :param callback: the URL to notify once all chunks are finished
+        """
+        key = self.PREFIX + batch_id
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={"chunks": chunks, "callback": callback, "done": 0, "failed": 0})
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def chunk_done(self, batch_id, failed=False):
+        """
+        Counts a finished chunk
+        :param batch_id: the batch id
+        :param failed: True if the chunk task failed
+        :return: (callback, "SUCCESS" or "FAILURE") if it was the last chunk of the batch, else None
+        """
+        key = self.PREFIX + batch_id
+        pipe = self.redis.pipeline()
+        pipe.hincrby(key, "done", 1)
+        pipe.hincrby(key, "failed", int(failed))
+        pipe.hmget(key, "chunks", "callback")
+        done, failures, (chunks, callback) = pipe.execute()
+        if chunks is None or done == int(chunks):
+            # last chunk, or unknown batch (expired, or started without callback): the counts are not needed anymore
+            self.redis.delete(key)
+        if chunks is None or done != int(chunks):
+            return None
+        return callback.decode(), "FAILURE" if failures else "SUCCESS"
@@ -0,0 +1,122 @@
+"""
+Inference backends of the transformers models and batched classification, shared by overton.nlp and the Celery worker
+(which receives a copy of this module only, see Dockerfile). Only standard library imports at module level.
+"""
+import hashlib
+import os
+import re
+from pathlib import Path
+
+# "torch" (full precision), "int8" (dynamically quantized torch model) or "onnx" (ONNX Runtime, needs optimum)
+BACKENDS = ("torch", "int8", "onnx")
+ONNX_CACHE = Path(os.environ.get("ONNX_CACHE", Path.home() / ".cache" / "overton" / "onnx"))
+
+
+def inference_backend(backend=None):
+    """
+    :param backend: the backend name, defaults to the INFERENCE_BACKEND environment variable, then to "torch"
+    :return: the checked backend name
+    """
+    backend = backend or os.environ.get("INFERENCE_BACKEND") or "torch"
+    if backend not in BACKENDS:
+        raise ValueError("Unknown inference backend %s, expected one of %s" % (backend, ", ".join(BACKENDS)))
+    return backend
+
+
+def quantize(model):
+    """
+    Dynamic INT8 quantization of the linear layers of a torch model (weights are quantized once,
+    activations on the fly), for faster inference on CPU
+    """
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def onnx_cache_dir(model_name):
+    """
+    Directory of the ONNX export of a model, always inside ONNX_CACHE: the name of a model loaded from a local
+    directory may be an absolute path
+    :param model_name: the model name on the HuggingFace hub, or the path of the model directory
+    :return: the export directory
+    """
+    base = re.sub(r"[^\w.-]", "_", Path(model_name).name).strip(".") or "model"
+    return ONNX_CACHE / ("%s-%s" % (base, hashlib.sha1(str(model_name).encode("utf8")).hexdigest()[:12]))
+
+
+def onnx_model(model_type, model_name):
+    """
+    Loads the ONNX Runtime version of a model, exported once then loaded from ONNX_CACHE
+    :param model_type: name of the transformers model class, e.g. AutoModelForTokenClassification or
+    CamembertForSequenceClassification: its task (ForTokenClassification...) selects the ONNX Runtime class
+    :param model_name: the model name on the HuggingFace hub, or the path of the model directory
+    :return: a model usable in a transformers pipeline
+    """
+    try:
+        import optimum.onnxruntime
+    except ImportError:
+        raise ImportError("onnx inference backend requires optimum: pip install optimum[onnxruntime]")
+    task = re.search(r"For\w+$", model_type)
+    ort_class = getattr(optimum.onnxruntime, "ORTModel" + task.group(0), None) if task else None
+    if ort_class is None:
+        raise ValueError("No ONNX Runtime equivalent for " + model_type)
+    export_dir = onnx_cache_dir(model_name)
+    if (export_dir / "model.onnx").exists():
+        return ort_class.from_pretrained(export_dir)
+    model = ort_class.from_pretrained(model_name, export=True)
+    model.save_pretrained(export_dir)
+    return model
+
+
+def load_model(model_class, model_name, backend=None):
+    """
+    Loads a transformers model for the selected inference backend
+    :param model_class: AutoModelForSequenceClassification or AutoModelForTokenClassification
+    :param model_name: the model name on the HuggingFace hub
+    :param backend: see inference_backend()
+    :return: a model usable in a transformers pipeline
+    """
+    backend = inference_backend(backend)
+    if backend == "onnx":
+        return onnx_model(model_class.__name__, model_name)
+    model = model_class.from_pretrained(model_name)
+    if backend == "int8":
+        model = quantize(model)
+    return model
+
+
+def convert_model(model, backend):
+    """
+    Converts a loaded torch model to another inference backend
+    :param model: the torch model
+    :param backend: see inference_backend()
+    :return: the converted model
+    """
+    backend = inference_backend(backend)
+    if backend == "int8":
+        return quantize(model)
+    if backend == "onnx":
+        return onnx_model(type(model).__name__, model.config.name_or_path)
+    return model
+
+
+def classify_batch(nlp, texts, batch_size=32):
+    """
+    Classifies a list of texts in batches with a text classification pipeline.
+    Texts are sorted by token length so that each batch is padded to the length of its longest member only.
+
+    :param nlp: the transformers pipeline, with its tokenizer
+    :param texts: list of texts to classify
+    :param batch_size: max number of texts per forward pass
+    :return: list of (label, score) couples, in the same order as the input texts
+    """
+    if not texts:
+        return []
+    lengths = [len(ids) for ids in nlp.tokenizer(list(texts), truncation=True)["input_ids"]]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    results = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        outputs = nlp([texts[i] for i in bucket], batch_size=len(bucket), truncation=True)
+        for i, output in zip(bucket, outputs):
+            results[i] = (output["label"], output["score"])
+    return results
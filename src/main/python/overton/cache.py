@@ -0,0 +1,138 @@
+"""
+Caches for costly NLP computations
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+
+class LRUCache:
+    """
+    Least-recently-used cache of bounded size, counting hits, misses and evictions.
+    Thread-safe.
+    """
+    _MISSING = object()
+
+    def __init__(self, maxsize=2048):
+        """
+        :param maxsize: max number of items in cache. 0 disables the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get an item from the cache and mark it as recently used
+        :param key: the item key
+        :param default: value returned on cache miss
+        :return: the cached value or default
+        """
+        with self._lock:
+            value = self._data.get(key, self._MISSING)
+            if value is self._MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Store an item, evicting the least recently used one if the cache is full
+        :param key: the item key
+        :param value: the value to store
+        :return: None
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """
+        Usage statistics of the cache
+        :return: a dict with hits, misses, evictions, size, maxsize and hit_rate
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._data), "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class PersistentCache:
+    """
+    Key-value store in a SQLite file, that several processes may read and write concurrently.
+    Keys are grouped by namespace, so that results computed with different resources never mix.
+    Values shall be JSON-serializable.
+    """
+    def __init__(self, path, namespace=""):
+        """
+        :param path: the SQLite file (created if needed)
+        :param namespace: identifies the resources the values depend on
+        """
+        self.path = str(path)
+        self.namespace = namespace
+        self._local = threading.local()
+        self._connect().execute("CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value TEXT, "
+                                "PRIMARY KEY (namespace, key)) WITHOUT ROWID")
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections shall neither be shared between threads nor survive a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str, default=None):
+        row = self._connect().execute("SELECT value FROM cache WHERE namespace = ? AND key = ?",
+                                      (self.namespace, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_many(self, keys: List[str]) -> Dict:
+        """
+        :param keys: the keys to look for
+        :return: a dict with the keys found in cache and their values
+        """
+        found = {}
+        conn = self._connect()
+        # stay below SQLite max number of variables
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            query = "SELECT key, value FROM cache WHERE namespace = ? AND key IN (%s)" % ",".join("?" * len(chunk))
+            for key, value in conn.execute(query, [self.namespace] + chunk):
+                found[key] = json.loads(value)
+        return found
+
+    def put(self, key: str, value) -> None:
+        self.put_many({key: value})
+
+    def put_many(self, items: Dict) -> None:
+        if not items:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO cache (namespace, key, value) VALUES (?, ?, ?)",
+                             [(self.namespace, k, json.dumps(v)) for k, v in items.items()])
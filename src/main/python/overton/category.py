@@ -4,21 +4,39 @@ Categorization of phrases in the Overton Classification.
 Uses both Spacy matcher to locate entries from the classification and
 word2vec-like resources to semantically match extracted terms to classification entries (using Word Mover Distance)
 """
-import functools
+import hashlib
 import json
 import importlib.resources as pkg_resources
 import math
+import os
 import re
+import unicodedata
 from operator import itemgetter
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict
 from collections import Counter
 
+import numpy as np
 from gensim.models import KeyedVectors
 from nltk import word_tokenize
 import spacy
 from spacy.attrs import LEMMA
 from spacy.matcher import PhraseMatcher
 
+from overton.cache import LRUCache, PersistentCache
+
+
+def load_embeddings(model_file: str) -> KeyedVectors:
+    """
+    Loads word embeddings. Files in gensim native format (.kv, see scripts/convert_embeddings.py) are memory-mapped
+    read-only, so that all processes of a host share the same page-cached vectors.
+    Other files are parsed as word2vec binaries.
+    :param model_file: path to the embeddings
+    :return: the embeddings
+    """
+    if model_file.endswith(".kv"):
+        return KeyedVectors.load(model_file, mmap="r")
+    return KeyedVectors.load_word2vec_format(model_file, binary=True, unicode_errors="ignore")
+
 
 class Entry:
     """
@@ -68,6 +86,7 @@ class ClassificationTree:
     """
     def __init__(self, categories_file):
         self.entries = []
+        self.version = None
         self._load_entries(categories_file)
         self.folders = {}
         for entry in self.entries:
@@ -85,6 +104,8 @@ class ClassificationTree:
             from . import models
             with pkg_resources.open_text(models, "categories.json") as cat:
                 categories = json.load(cat)
+        # the version identifies the content of the classification, whatever file it comes from
+        self.version = hashlib.sha1(json.dumps(categories, sort_keys=True).encode("utf8")).hexdigest()[:12]
         self._load_each_entry(categories, [])
 
     def _load_each_entry(self, node, path):
@@ -98,9 +119,10 @@ class ClassificationTree:
 class KillList:
     """
     List of terms to remove from vector comparison (too noisy)
+    Terms are kept in a frozenset, for constant time lookups of exact lines
     """
     def __init__(self, pathname):
-        self.kill = []
+        kill = set()
         self.kill_re = re.compile(r"\b(?:est|sont)\b", re.IGNORECASE | re.UNICODE)
 
         if pathname:
@@ -110,22 +132,121 @@ class KillList:
                     if line.startswith("#") or len(line) == 0:
                         continue
                     else:
-                        self.kill.append(line)
+                        kill.add(line)
+        self.kill = frozenset(kill)
 
     def __contains__(self, item):
-        return item in self.kill or re.search(self.kill_re, item)
+        return item in self.kill or self.kill_re.search(item) is not None
+
+
+class EntryIndex:
+    """
+    Normalized mean vectors of the classification entries, stacked in a matrix.
+    Used to select the few entries closest to a term (cosine similarity of mean vectors) before computing
+    the exact, but expensive, Word Mover Distance on those candidates only.
+    """
+    def __init__(self, model: KeyedVectors, entries: List[Entry]):
+        self.model = model
+        self.entries = [e for e in entries if not e.has_oov]
+        if self.entries:
+            self.matrix = np.vstack([self.vector(e.tokens) for e in self.entries])
+        else:
+            self.matrix = np.zeros((0, model.vector_size), dtype=np.float32)
+
+    def vector(self, tokens: List[str]) -> np.ndarray:
+        """
+        Normalized mean vector of the in-vocabulary tokens
+        :param tokens: token list
+        :return: the vector (null vector if all tokens are OOV)
+        """
+        keys = [t for t in tokens if t in self.model.key_to_index]
+        if not keys:
+            return np.zeros(self.model.vector_size, dtype=np.float32)
+        mean = np.mean([self.model[t] for t in keys], axis=0)
+        norm = np.linalg.norm(mean)
+        return mean / norm if norm > 0 else mean
+
+    def candidates(self, tokens: List[str], k: Optional[int]) -> List[Entry]:
+        """
+        Get the k entries whose mean vector is the closest to the tokens' one
+        :param tokens: token list
+        :param k: number of candidates. All entries are returned if None or 0
+        :return: the candidate entries, in classification order
+        """
+        if not k or k >= len(self.entries):
+            return self.entries
+        scores = self.matrix @ self.vector(tokens)
+        top = np.sort(np.argpartition(-scores, k)[:k])
+        return [self.entries[i] for i in top]
+
+    def candidates_many(self, token_lists: List[List[str]], k: Optional[int]) -> List[List[Entry]]:
+        """
+        Same as candidates(), for several terms at once: all similarities are computed with a single matrix product
+        :param token_lists: list of token lists
+        :param k: number of candidates per term. All entries are returned if None or 0
+        :return: the candidate entries of each term, in classification order
+        """
+        if not k or k >= len(self.entries):
+            return [self.entries for _ in token_lists]
+        if not token_lists:
+            return []
+        terms = np.vstack([self.vector(tokens) for tokens in token_lists])
+        scores = terms @ self.matrix.T
+        top = np.sort(np.argpartition(-scores, k, axis=1)[:, :k], axis=1)
+        return [[self.entries[i] for i in row] for row in top]
 
 
 class Categorizer:
-    def __init__(self, model_file, categories_file=None, kill_list_file=None):
+    def __init__(self, model_file, categories_file=None, kill_list_file=None, n_candidates=50, cache_size=None,
+                 persistent_cache=None):
+        """
+        :param model_file: word embeddings (word2vec binary or memory-mappable .kv format)
+        :param categories_file: the classification (defaults to the packaged one)
+        :param kill_list_file: terms that shall not be categorized
+        :param n_candidates: number of entries preselected with vectors before computing Word Mover Distances.
+        Keep it well above 15 (the ambiguity threshold). None means that the distance is computed with every entry.
+        :param cache_size: size of the direct match and term caches (defaults to $CATEGORIZER_CACHE_SIZE or 2048)
+        :param persistent_cache: SQLite file storing the closest entries of each term, shared between processes
+        and runs (defaults to $CATEGORIZER_PERSISTENT_CACHE, no persistent cache if not set)
+        """
+        if cache_size is None:
+            cache_size = int(os.environ.get("CATEGORIZER_CACHE_SIZE", 2048))
+        self.direct_match_cache = LRUCache(cache_size)
+        self.scores_cache = LRUCache(cache_size)
         self.parser = spacy.load('fr_core_news_sm', exclude=["ner"])
-        self.model = KeyedVectors.load_word2vec_format(model_file, binary=True, unicode_errors="ignore")
+        self.model = load_embeddings(model_file)
+        self.model_id = os.path.basename(model_file)
         self.kill_list = KillList(kill_list_file)
+        self.n_candidates = n_candidates
+        persistent_cache = persistent_cache or os.environ.get("CATEGORIZER_PERSISTENT_CACHE")
+        self.persistent_cache = PersistentCache(persistent_cache) if persistent_cache else None
+        self.load_classification(categories_file)
+
+    def load_classification(self, categories_file=None):
+        """
+        (Re)loads the classification. Cached results of a previous classification won't be used anymore.
+        :param categories_file: the classification (defaults to the packaged one)
+        :return: None
+        """
         self.classification = ClassificationTree(categories_file)
         self._mark_oov()
+        self.index = EntryIndex(self.model, self.classification.entries)
+        self.entries_by_id = {str(e): e for e in self.classification.entries}
+        if self.persistent_cache:
+            self.persistent_cache.namespace = self.model_id + "/" + self.classification.version
         self.matcher = PhraseMatcher(self.parser.vocab, attr=LEMMA)
         self._build_matchers()
 
+    def classification_version(self) -> str:
+        return self.classification.version
+
+    def cache_stats(self) -> dict:
+        """
+        Usage statistics of the caches
+        :return: a dict of stats (see LRUCache.stats) for each cache
+        """
+        return {"direct_match": self.direct_match_cache.stats(), "categorize_scores": self.scores_cache.stats()}
+
     def _build_matchers(self):
         """
         Creates SpaCy matchers from the categories entries
@@ -157,13 +278,21 @@ class Categorizer:
         """
         return len([t for t in tokens if t not in self.model.key_to_index]) == len(tokens)
 
-    @functools.lru_cache(maxsize=2048)
     def direct_match(self, text: str) -> Tuple:
         """
         evaluates a direct match with the classification (using Spacy Matchers)
         :param text:
         :return: dict of folders associated with match count and a dict of matches
         """
+        key = (self.classification.version, text)
+        cached = self.direct_match_cache.get(key)
+        if cached is None:
+            cached = self._direct_match(text)
+            self.direct_match_cache.put(key, cached)
+        # callers update the results: don't let them alter the cached ones
+        return Counter(cached[0]), dict(cached[1])
+
+    def _direct_match(self, text: str) -> Tuple:
         counter = Counter()
         matches = {}
         doc = self.parser(text)
@@ -174,7 +303,6 @@ class Categorizer:
             matches[term] = cat
         return counter, matches
 
-    @functools.lru_cache(maxsize=2048)
     def categorize_scores(self, form: str, n_results=5) -> List:
         """
         Gets the semantically closest categories from the input form, using word embeddings
@@ -182,25 +310,104 @@ class Categorizer:
         :param n_results: max number of results
         :return: A list of couples [category, distance], sorted by distance
         """
+        key = (self.classification.version, form, n_results)
+        cached = self.scores_cache.get(key)
+        if cached is None:
+            cached = self._categorize_scores(form, n_results)
+            self.scores_cache.put(key, cached)
+        return list(cached)
+
+    def _categorize_scores(self, form: str, n_results: int) -> List:
         if form in self.kill_list:
             return []
         else:
             tokens = word_tokenize(form, language="french")
             if self.all_oov(tokens):
                 return []
-            match = [(term, self.model.wmdistance(tokens, term.tokens))
-                     for term in self.classification.entries if not term.has_oov]
-            best = [m for m in match if m[1] < 1]
-            top = []
-            if best:
-                best.sort(key=itemgetter(1))
-                if best[0][1] < 0.1:
-                    top = [best[0]]
-                elif len(best) > 15:  # too ambiguous
-                    top = []
-                else:
-                    top = best
-            return top[0:min(len(top), n_results)]
+            return self._select(self._nearest_many({form: tokens})[form], n_results)
+
+    def categorize_many(self, terms: List[str], n_results=5) -> Dict[str, List]:
+        """
+        Same as categorize_scores(), for a list of terms. Candidate entries of all terms are selected at once.
+        :param terms: the input texts
+        :param n_results: max number of results per term
+        :return: A dict mapping each term to its list of couples [category, distance], sorted by distance
+        """
+        results = {}
+        tokenized = {}
+        for term in terms:
+            if term in results or term in tokenized:
+                continue
+            cached = self.scores_cache.get((self.classification.version, term, n_results))
+            if cached is not None:
+                results[term] = list(cached)
+                continue
+            tokens = word_tokenize(term, language="french") if term not in self.kill_list else []
+            if not tokens or self.all_oov(tokens):
+                results[term] = []
+            else:
+                tokenized[term] = tokens
+        nearest = self._nearest_many(tokenized)
+        for term in tokenized:
+            results[term] = self._select(nearest[term], n_results)
+            self.scores_cache.put((self.classification.version, term, n_results), list(results[term]))
+        return results
+
+    def _nearest_many(self, tokenized: Dict[str, List[str]]) -> Dict[str, List[Tuple[Entry, float]]]:
+        """
+        Closest entries of each term, read from the persistent cache when available
+        :param tokenized: dict of terms with their tokens
+        :return: dict of terms with their closest entries and distances
+        """
+        nearest = {}
+        keys = {term: self.normalize_term(term) for term in tokenized}
+        if self.persistent_cache:
+            stored = self.persistent_cache.get_many(list(set(keys.values())))
+            for term, key in keys.items():
+                if key in stored and all(e in self.entries_by_id for e, _ in stored[key]):
+                    nearest[term] = [(self.entries_by_id[e], d) for e, d in stored[key]]
+        missing = [term for term in tokenized if term not in nearest]
+        candidates = self.index.candidates_many([tokenized[term] for term in missing], self.n_candidates)
+        for term, entries in zip(missing, candidates):
+            nearest[term] = self._distances(tokenized[term], entries)
+        if self.persistent_cache:
+            self.persistent_cache.put_many({keys[term]: [(str(e), d) for e, d in nearest[term]] for term in missing})
+        return nearest
+
+    @staticmethod
+    def normalize_term(term: str) -> str:
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", term)).strip()
+
+    @staticmethod
+    def _select(best: List[Tuple[Entry, float]], n_results: int) -> List:
+        """
+        Applies the decision thresholds on sorted entries: keep an (almost) exact match alone,
+        discard ambiguous terms (matching too many entries)
+        """
+        top = []
+        if best:
+            if best[0][1] < 0.1:
+                top = [best[0]]
+            elif len(best) > 15:  # too ambiguous
+                top = []
+            else:
+                top = best
+        return top[0:min(len(top), n_results)]
+
+    def nearest_entries(self, tokens: List[str], max_distance=1.0) -> List[Tuple[Entry, float]]:
+        """
+        Computes the Word Mover Distance between the tokens and the closest entries of the classification
+        :param tokens: the tokenized term
+        :param max_distance: entries farther than this distance are discarded
+        :return: A list of couples (entry, distance), sorted by distance
+        """
+        return self._distances(tokens, self.index.candidates(tokens, self.n_candidates), max_distance)
+
+    def _distances(self, tokens: List[str], entries: List[Entry], max_distance=1.0) -> List[Tuple[Entry, float]]:
+        match = [(entry, self.model.wmdistance(tokens, entry.tokens)) for entry in entries]
+        best = [m for m in match if m[1] < max_distance]
+        best.sort(key=itemgetter(1))
+        return best
 
     def find_category(self, phrase: str) -> Optional[Entry]:
         """
@@ -224,8 +431,9 @@ class Categorizer:
         :return: a (sorted) list of couples (category, score) and a dict of matching terms
         """
         categories, matches = self.direct_match(text)
+        scores = self.categorize_many(terms, n_results=n_cat_per_term)
         for term in terms:
-            entries = self.categorize_scores(term, n_results=n_cat_per_term)
+            entries = scores[term]
             if term not in matches:
                 matches[term] = None
             for e in entries:
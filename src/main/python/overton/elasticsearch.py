@@ -1,3 +1,4 @@
+import hashlib
 import os
 
 from elasticsearch import Elasticsearch
@@ -50,6 +51,16 @@ class Speech(Document):
     speaking = Keyword()
 
 
+def speech_id(url):
+    """
+    Id of the document of a speech, derived from its URL so that the same URL is always indexed in the same document
+
+    :param url: the URL of the speech
+    :return: the document id
+    """
+    return hashlib.sha1(url.encode("utf8")).hexdigest()
+
+
 class Polindex:
     # ElasticSearch connection
     es = None
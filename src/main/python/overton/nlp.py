@@ -3,40 +3,73 @@ import unicodedata
 
 from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline, AutoModelForTokenClassification
 
+from overton.backends import BACKENDS, ONNX_CACHE, inference_backend, quantize  # noqa: F401
+from overton.backends import load_model, classify_batch
+
 
 class Pso:
     """
     Classifier for sequences. Classifies as "problem", "solution" or "other"
     """
 
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+        :param backend: inference backend, see inference_backend()
+        """
         model_name = "mazancourt/politics-sentence-classifier"
-        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        self.backend = inference_backend(backend)
+        model = load_model(AutoModelForSequenceClassification, model_name, self.backend)
         tokenizer = AutoTokenizer.from_pretrained(model_name)
 
+        self.tokenizer = tokenizer
         self.nlp = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
 
     def classify(self, text):
         outputs = self.nlp(text)
         return outputs[0]["label"], outputs[0]["score"]
-      
+
+    def classify_batch(self, texts, batch_size=32):
+        """
+        Classifies a list of texts in batches, see overton.backends.classify_batch
+
+        :param texts: list of texts to classify
+        :param batch_size: max number of texts per forward pass
+        :return: list of (label, score) couples, in the same order as the input texts
+        """
+        return classify_batch(self.nlp, texts, batch_size=batch_size)
+
 
 class Punct:
 
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+        :param backend: inference backend, see inference_backend()
+        """
         model_name = "oliverguhr/fullstop-punctuation-multilang-large"
+        self.backend = inference_backend(backend)
         tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForTokenClassification.from_pretrained(model_name)
+        model = load_model(AutoModelForTokenClassification, model_name, self.backend)
         self.nlp = pipeline("ner", tokenizer=tokenizer, model=model, aggregation_strategy="simple")
         # Max input size for model seems to be 2200, so 2000 is a good choice
         self.MAX_SIZE = 2000
-
-    def rebuild_sentences(self, text):
+        # Overlap between consecutive windows in windowed mode
+        self.OVERLAP = 200
+
+    def rebuild_sentences(self, text, windowed=False, batch_size=8):
+        """
+        Restores punctuation and splits the text in sentences
+        :param text: the unpunctuated text
+        :param windowed: if True, cut the text in overlapping windows up front and process them as batches,
+        instead of computing each chunk from the last sentence boundary of the previous one
+        :param batch_size: number of windows per forward pass (windowed mode only)
+        :return: the list of sentences
+        """
         sentences = []
         if not text:
             return sentences
-        text = re.sub(r"\s+", " ", text)
-        text = re.sub(r"^\s+", "", text)
+        text = self._normalize(text)
+        if windowed:
+            return self._rebuild_sentences_windowed(text, batch_size)
         start = 0
         text_length = len(text)
         while start < text_length:
@@ -47,7 +80,8 @@ class Punct:
                 break
             else:
                 sents, i = self._rebuild_sentences(text[start:end])
-                if i == 0 or len(sents) <= 1:
+                # keep all sentences if the chunk has no boundary or ends exactly on one
+                if i == 0 or i >= end - start or len(sents) <= 1:
                     sentences.extend(sents)
                     start = end
                 else:
@@ -55,9 +89,85 @@ class Punct:
                     start += i+1
         return sentences
 
+    def rebuild_sentences_batch(self, texts, batch_size=8):
+        """
+        Restores punctuation and splits several texts in sentences, in windowed mode. The windows of all texts
+        are processed together, which keeps batches full when texts are short.
+        :param texts: list of unpunctuated texts
+        :param batch_size: number of windows per forward pass
+        :return: the list of sentences of each text
+        """
+        texts = [self._normalize(text) if text else "" for text in texts]
+        windows = [self.windows(text) if text else [] for text in texts]
+        inputs = [text[start:end] for text, text_windows in zip(texts, windows) for start, end in text_windows]
+        predictions = iter(self.nlp(inputs, batch_size=batch_size) if inputs else [])
+        results = []
+        for text, text_windows in zip(texts, windows):
+            text_predictions = [next(predictions) for _ in text_windows]
+            if text:
+                results.append(self._assemble_sentences(text, self.stitch(text_windows, text_predictions))[0])
+            else:
+                results.append([])
+        return results
+
+    @staticmethod
+    def _normalize(text):
+        text = re.sub(r"\s+", " ", text)
+        return re.sub(r"^\s+", "", text)
+
     def _rebuild_sentences(self, text):
-        results = self.nlp(text)
-        sentence = ""
+        return self._assemble_sentences(text, self.nlp(text))
+
+    def _rebuild_sentences_windowed(self, text, batch_size):
+        windows = self.windows(text)
+        predictions = self.nlp([text[start:end] for start, end in windows], batch_size=batch_size)
+        return self._assemble_sentences(text, self.stitch(windows, predictions))[0]
+
+    def windows(self, text):
+        """
+        Cuts the text in windows of about MAX_SIZE characters, each one overlapping the previous one
+        by about OVERLAP characters. Windows start and end on word boundaries.
+        :param text: the normalized text (single spaces)
+        :return: list of (start, end) offsets
+        """
+        windows = []
+        start = 0
+        while True:
+            end = self._find_word_boundary(start, text)
+            if end == 0:
+                windows.append((start, len(text)))
+                return windows
+            windows.append((start, end))
+            pos = text.rfind(" ", start, end - self.OVERLAP)
+            start = pos + 1 if pos > start else end
+
+    @staticmethod
+    def stitch(windows, predictions):
+        """
+        Merges the predictions of overlapping windows into a single list of items with offsets in the whole text.
+        In each overlap, the first window is trusted up to the middle of the overlap and the next one after it,
+        so that every item is predicted with context on both sides.
+        :param windows: list of (start, end) offsets, as returned by windows()
+        :param predictions: list of pipeline outputs, one per window
+        :return: the list of items, with start/end offsets in the whole text
+        """
+        items = []
+        last_end = 0
+        for w, ((start, end), results) in enumerate(zip(windows, predictions)):
+            cut = (windows[w+1][0] + end) // 2 if w + 1 < len(windows) else None
+            for item in results:
+                item_start = item["start"] + start
+                item_end = item["end"] + start
+                if cut is not None and item_start >= cut:
+                    break
+                if item_end <= last_end:
+                    continue
+                items.append(dict(item, start=max(item_start, last_end), end=item_end))
+                last_end = item_end
+        return items
+
+    @staticmethod
+    def _assemble_sentences(text, results):
         # restore punctuation from text
         sentences = []
         sentence = ""
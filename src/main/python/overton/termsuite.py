@@ -0,0 +1,375 @@
+"""
+Pool of long-lived TermSuite processes (see src/main/ts/TermSuiteDaemon.java), so that term extraction does not pay
+for a JVM start-up on each text.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import select
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class TermSuiteError(Exception):
+    pass
+
+
+class TermSuiteDaemon:
+    """
+    A TermSuite process, driven over stdin/stdout.
+    Request: "EXTRACT <n>" followed by n bytes of UTF-8 text, or "EXTRACT_BATCH <k>" followed by k documents,
+    each one as a line "<n>" then n bytes of text.
+    Response: "OK", the TSV lines (JSON lines for EXTRACT_BATCH), then "." - or "ERROR <message>", instead of "OK"
+    or after the output lines.
+    Empty lines are ignored. A process which does not answer in time, or does not follow the protocol, is killed.
+    """
+    def __init__(self, command, stderr=subprocess.DEVNULL, timeout=600, start_timeout=120):
+        """
+        :param command: the command starting the daemon (e.g. ["ts_daemon.sh"])
+        :param stderr: where TermSuite logs go (file object), ignored by default
+        :param timeout: max time (in seconds) to send a request and read its response
+        :param start_timeout: max time (in seconds) to wait for the daemon to be ready
+        """
+        self.timeout = timeout
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr)
+        os.set_blocking(self.process.stdin.fileno(), False)
+        self._buffer = b""
+        try:
+            ready = self._readline(time.monotonic() + start_timeout)
+        except TermSuiteError:
+            self.kill()
+            raise
+        if ready.strip() != b"READY":
+            self.close()
+            raise TermSuiteError("TermSuite daemon did not start: %r" % ready)
+
+    def extract(self, text):
+        """
+        :param text: the text
+        :return: the lines of the TSV output of TermSuite
+        """
+        data = text.encode("utf8")
+        return self._request(b"EXTRACT %d\n" % len(data) + data)
+
+    def extract_batch(self, texts):
+        """
+        :param texts: list of texts, extracted as a single corpus
+        :return: the JSON output of TermSuite, with the occurrences of the terms (see parse_json)
+        """
+        request = [b"EXTRACT_BATCH %d\n" % len(texts)]
+        for text in texts:
+            data = text.encode("utf8")
+            request.append(b"%d\n" % len(data))
+            request.append(data)
+        lines = self._request(b"".join(request))
+        try:
+            return json.loads("\n".join(lines)) if lines else {}
+        except ValueError as e:
+            raise TermSuiteError("Invalid JSON output of TermSuite: %s" % e)
+
+    def _request(self, request):
+        deadline = time.monotonic() + self.timeout
+        error = None
+        try:
+            self._write(request, deadline)
+            lines = []
+            ok = False
+            while True:
+                line = self._readline(deadline)
+                if not line:
+                    raise TermSuiteError("TermSuite daemon exited with code %s" % self._terminated())
+                line = line.decode("utf8").rstrip("\n")
+                if not line:
+                    continue
+                if line.startswith("ERROR"):
+                    # TermSuite failed, the daemon is ready for the next request
+                    error = line
+                    break
+                if not ok:
+                    if line != "OK":
+                        raise TermSuiteError("Unexpected response from TermSuite daemon: %r" % line)
+                    ok = True
+                elif line == ".":
+                    return lines
+                else:
+                    lines.append(line)
+        except (BrokenPipeError, ValueError, OSError) as e:
+            self.kill()
+            raise TermSuiteError("TermSuite daemon died: %s" % e)
+        except TermSuiteError:
+            # the daemon is in an unknown state (timeout, partial response...): it is replaced
+            if self.alive():
+                self.kill()
+            raise
+        raise TermSuiteError(error)
+
+    def _write(self, data, deadline):
+        fd = self.process.stdin.fileno()
+        view = memoryview(data)
+        while view:
+            self._wait(fd, deadline, write=True)
+            try:
+                view = view[os.write(fd, view):]
+            except BlockingIOError:
+                pass
+
+    def _readline(self, deadline):
+        # reads the raw pipe, so that select() is never fooled by data kept in a Python buffer
+        fd = self.process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            self._wait(fd, deadline)
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                # end of output
+                line, self._buffer = self._buffer, b""
+                return line
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line + b"\n"
+
+    def _wait(self, fd, deadline, write=False):
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            ready = select.select([], [fd], [], remaining)[1] if write else select.select([fd], [], [], remaining)[0]
+            if ready:
+                return
+        self.kill()
+        raise TermSuiteError("TermSuite daemon did not answer within %s s" % self.timeout)
+
+    def _terminated(self):
+        # output is closed: the process is exiting
+        try:
+            return self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.kill()
+            return self.process.returncode
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.kill()
+
+
+class TermSuitePool:
+    """
+    At most `size` TermSuite daemons, started on demand. Extractions beyond `size` wait for a free daemon.
+    Daemons which die or time out are replaced by new ones. Thread-safe.
+    """
+    def __init__(self, command, size=2, stderr=subprocess.DEVNULL, timeout=600):
+        """
+        :param command: the command starting a daemon (e.g. ["ts_daemon.sh"])
+        :param size: max number of daemons, i.e. of concurrent extractions
+        :param stderr: where TermSuite logs go
+        :param timeout: max time (in seconds) of an extraction, after which the daemon is killed and replaced
+        """
+        self.command = command
+        self.size = size
+        self.stderr = stderr
+        self.timeout = timeout
+        self._slots = threading.Semaphore(size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._daemons = []
+        atexit.register(self.close)
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            daemon = TermSuiteDaemon(self.command, stderr=self.stderr, timeout=self.timeout)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._daemons.append(daemon)
+        return daemon
+
+    def _release(self, daemon):
+        if daemon.alive():
+            self._idle.put(daemon)
+        else:
+            # a new daemon will be started when needed
+            with self._lock:
+                self._daemons.remove(daemon)
+        self._slots.release()
+
+    def extract_tsv(self, text):
+        """
+        Extracts the terms of a text
+        :param text: the text
+        :return: the lines of the TSV output of TermSuite, including the header line (starting with #)
+        """
+        daemon = self._acquire()
+        try:
+            return daemon.extract(text)
+        finally:
+            self._release(daemon)
+
+    def extract(self, text):
+        """
+        Extracts the terms of a text
+        :param text: the text
+        :return: the list of terms, as dicts of TSV fields (pilot, lemma, spec, freq...)
+        """
+        return parse_tsv(self.extract_tsv(text))
+
+    def extract_batch_json(self, texts):
+        """
+        Extracts the terms of several texts with a single TermSuite run on the corpus of all texts
+        :param texts: list of texts
+        :return: the JSON output of TermSuite, for the whole corpus
+        """
+        daemon = self._acquire()
+        try:
+            return daemon.extract_batch(texts)
+        finally:
+            self._release(daemon)
+
+    def extract_batch(self, texts):
+        """
+        Extracts the terms of several texts with a single TermSuite run on the corpus of all texts
+        :param texts: list of texts
+        :return: for each text, the list of its terms (see terms_by_document)
+        """
+        return terms_by_document(texts, *parse_json(self.extract_batch_json(texts)))
+
+    def close(self):
+        with self._lock:
+            for daemon in self._daemons:
+                daemon.close()
+            self._daemons = []
+
+
+def run_termsuite(command, texts, work_dir=None, output="tsv"):
+    """
+    Forks TermSuite on a corpus made of the texts, without daemon
+    :param command: the TermSuite command (e.g. ts_wrapper.sh), called with the corpus directory and the output file
+    :param texts: list of texts
+    :param work_dir: where the corpus is written, defaults to /dev/shm if available
+    :param output: "tsv" or "json", the format of the output file (all.tsv or all.json)
+    :return: the lines of the TSV output of TermSuite, or its JSON output (see parse_json)
+    """
+    if work_dir is None and os.path.isdir("/dev/shm"):
+        work_dir = "/dev/shm"
+    with tempfile.TemporaryDirectory(prefix="ts", dir=work_dir) as temp:
+        corpus = Path(temp)
+        corpus_fr = corpus / "fr"
+        corpus_fr.mkdir()
+        for i, text in enumerate(texts):
+            (corpus_fr / ("doc-%06d.txt" % i)).write_text(text, encoding="utf8")
+        ts_output = corpus / ("all." + output)
+        process = subprocess.run([str(command), corpus.as_posix(), ts_output.as_posix()], capture_output=True)
+        if process.returncode != 0:
+            raise TermSuiteError("TermSuite failed with code %d: %s" % (process.returncode, process.stderr))
+        if output == "json":
+            return json.loads(ts_output.read_text(encoding="utf8")) if ts_output.exists() else {}
+        if not ts_output.exists():
+            return []
+        return ts_output.read_text(encoding="utf8").splitlines()
+
+
+def _tokens(text):
+    return tuple(re.findall(r"\w+", text.lower()))
+
+
+def _document(source):
+    # rank of a document from its file name in the corpus written by run_termsuite or TermSuiteDaemon
+    match = re.search(r"doc-(\d+)\.txt$", str(source))
+    return int(match.group(1)) if match else None
+
+
+def terms_by_document(texts, terms, occurrences=None):
+    """
+    Finds the terms extracted from a corpus in each of its documents, from the occurrences found by TermSuite
+    (whatever their inflection). Without occurrences, a term occurs in a document if the tokens of its pilot form
+    (lowercase) occur in sequence in the document: other inflected forms are missed
+    :param texts: the documents of the corpus
+    :param terms: the terms extracted from the corpus (see parse_json or parse_tsv), with a "pilot" field
+    :param occurrences: for each term (same order), a Counter of its occurrences by document rank (see parse_json)
+    :return: for each document, the list of its terms with their TermSuite fields (spec, freq... computed on the
+    corpus) and doc_freq, the number of occurrences in the document
+    """
+    if occurrences is not None:
+        return [[dict(term, doc_freq=occurrences[i][doc]) for i, term in enumerate(terms) if occurrences[i][doc]]
+                for doc in range(len(texts))]
+    term_tokens = [_tokens(term.get("pilot", "")) for term in terms]
+    lengths = set(len(tokens) for tokens in term_tokens if tokens)
+    results = []
+    for text in texts:
+        tokens = _tokens(text)
+        ngrams = Counter(tokens[i:i + n] for n in lengths for i in range(len(tokens) - n + 1))
+        results.append([dict(term, doc_freq=ngrams[term_tokens[i]])
+                        for i, term in enumerate(terms) if term_tokens[i] and ngrams[term_tokens[i]]])
+    return results
+
+
+# names of the TSV columns (--tsv-properties) for the properties of the JSON output
+JSON_PROPERTIES = {"specificity": "spec", "frequency": "freq"}
+
+
+def parse_json(data):
+    """
+    Parses TermSuite JSON output: "terms" with their "key" and "props", "occurrences" of terms ("tid") in
+    "input_sources" ("file")
+    :param data: the JSON output
+    :return: (terms, occurrences): the list of terms, as dicts of their properties (pilot, lemma, spec, freq...),
+    and for each term a Counter of its occurrences by document rank - occurrences is None if the output has none
+    """
+    terms = []
+    ranks = {}
+    for term in data.get("terms", []):
+        ranks[term.get("key")] = len(terms)
+        terms.append({JSON_PROPERTIES.get(name, name): value for name, value in term.get("props", {}).items()})
+    if not data.get("occurrences"):
+        logger.warning("No occurrences in TermSuite output, terms are found in documents by their pilot form")
+        return terms, None
+    sources = {str(source_id): _document(path) for source_id, path in data.get("input_sources", {}).items()}
+    occurrences = [Counter() for _ in terms]
+    for occurrence in data["occurrences"]:
+        rank = ranks.get(occurrence.get("tid"))
+        document = sources.get(str(occurrence.get("file")))
+        if rank is not None and document is not None:
+            occurrences[rank][document] += 1
+    return terms, occurrences
+
+
+def parse_tsv(lines):
+    """
+    Parses TermSuite TSV output
+    :param lines: the lines of the output, starting with the header line
+    :return: the list of terms, as dicts of fields named from the header (first column, the rank, is dropped)
+    """
+    fields = []
+    terms = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#") and not fields:
+            fields = line.split("\t")
+        else:
+            terms.append({fields[i] if i < len(fields) else str(i): value
+                          for i, value in enumerate(line.split("\t")) if i > 0})
+    return terms
@@ -0,0 +1,74 @@
+# Accuracy vs latency of the inference backends of Pso and Punct, on the annotated sentences of data/train-pso.csv
+# Pso: accuracy against the annotation. Punct: sentence boundaries agreement with the torch backend, on the
+# sentences of the file concatenated without punctuation.
+# SYNOPSIS: benchmark_backends.py [data/train-pso.csv] [backend ...]
+import csv
+import re
+import sys
+import time
+
+from overton.nlp import BACKENDS, Pso, Punct
+
+
+def read_sentences(filename):
+    with open(filename, encoding="utf8") as f:
+        return [(row["Text"], row["target"]) for row in csv.DictReader(f) if row["Text"]]
+
+
+def depunctuate(text):
+    return re.sub(r"[.?!,;:]", "", text).lower()
+
+
+def boundaries(sentences):
+    # offsets of sentence ends in the text without punctuation and spaces
+    offsets = set()
+    length = 0
+    for sentence in sentences:
+        length += len(re.sub(r"\s", "", depunctuate(sentence)))
+        offsets.add(length)
+    return offsets
+
+
+def benchmark_pso(backend, sentences):
+    pso = Pso(backend)
+    texts = [text for text, _ in sentences]
+    pso.classify_batch(texts[:8])    # warm-up
+    start = time.perf_counter()
+    results = pso.classify_batch(texts)
+    elapsed = time.perf_counter() - start
+    accuracy = sum(label == target for (label, _), (_, target) in zip(results, sentences)) / len(sentences)
+    print("%-6s Pso:   accuracy=%.4f  %.2f ms/sentence" % (backend, accuracy, 1000 * elapsed / len(sentences)))
+
+
+def benchmark_punct(backend, text, reference):
+    punct = Punct(backend)
+    punct.rebuild_sentences(text[:500], windowed=True)    # warm-up
+    start = time.perf_counter()
+    sentences = punct.rebuild_sentences(text, windowed=True)
+    elapsed = time.perf_counter() - start
+    found = boundaries(sentences)
+    if reference is None:
+        reference = found
+    common = len(found & reference)
+    precision = common / len(found) if found else 1.0
+    recall = common / len(reference) if reference else 1.0
+    print("%-6s Punct: boundaries precision=%.4f recall=%.4f (vs torch)  %.2f ms/1000 chars" %
+          (backend, precision, recall, 1000 * elapsed / len(text) * 1000))
+    return reference
+
+
+if __name__ == '__main__':
+    data_file = sys.argv[1] if len(sys.argv) > 1 else "data/train-pso.csv"
+    backends = sys.argv[2:] or list(BACKENDS)
+    if "torch" in backends:
+        backends.remove("torch")
+    backends.insert(0, "torch")     # reference for Punct
+    annotated = read_sentences(data_file)
+    full_text = " ".join(depunctuate(text) for text, _ in annotated)
+    torch_boundaries = None
+    for name in backends:
+        try:
+            benchmark_pso(name, annotated)
+            torch_boundaries = benchmark_punct(name, full_text, torch_boundaries)
+        except ImportError as e:
+            print("%-6s skipped: %s" % (name, e))
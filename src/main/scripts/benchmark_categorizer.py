@@ -0,0 +1,57 @@
+# Measures recall and speed of the vector-based candidate selection of the Categorizer against the brute-force
+# Word Mover Distance computation over all entries of the classification.
+# SYNOPSIS: benchmark_categorizer.py terms.txt [n_candidates ...]
+#   terms.txt: one term per line, or a TermSuite tsv output (form in 3rd column)
+import os
+import sys
+import time
+
+import dotenv
+from nltk import word_tokenize
+
+from overton.category import Categorizer
+
+dotenv.load_dotenv()
+
+
+def read_terms(filename):
+    terms = []
+    with open(filename, encoding="utf8") as f:
+        for line in f.readlines():
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.rstrip("\n").split("\t")
+            terms.append(fields[2] if len(fields) > 2 else fields[0])
+    return terms
+
+
+def nearest(categorizer, tokenized, n_candidates):
+    categorizer.n_candidates = n_candidates
+    start = time.time()
+    results = [categorizer.nearest_entries(tokens) for tokens in tokenized]
+    return results, time.time() - start
+
+
+def benchmark(categorizer, terms, candidate_sizes):
+    tokenized = [word_tokenize(t, language="french") for t in terms]
+    tokenized = [tokens for tokens in tokenized if not categorizer.all_oov(tokens)]
+    reference, elapsed = nearest(categorizer, tokenized, None)
+    print("brute force: %d terms in %.2fs" % (len(tokenized), elapsed))
+    for k in candidate_sizes:
+        results, elapsed = nearest(categorizer, tokenized, k)
+        expected = found = same_top = 0
+        for ref, res in zip(reference, results):
+            ref_entries = set(id(e) for e, _ in ref)
+            expected += len(ref_entries)
+            found += len(ref_entries.intersection(id(e) for e, _ in res))
+            same_top += (not ref and not res) or (ref and res and ref[0][0] is res[0][0])
+        recall = found / expected if expected else 1.0
+        print("k=%d: recall=%.4f top-1 agreement=%.4f in %.2fs" % (k, recall, same_top / len(tokenized), elapsed))
+
+
+if __name__ == '__main__':
+    sizes = [int(k) for k in sys.argv[2:]] or [10, 25, 50, 100, 200]
+    cat = Categorizer(model_file=os.environ.get("WORD_EMBEDDINGS"),
+                      categories_file=os.environ.get("CATEGORIES_JSON"),
+                      kill_list_file=os.environ.get("KILL_LIST"))
+    benchmark(cat, read_terms(sys.argv[1]), sizes)
@@ -0,0 +1,41 @@
+# Micro-benchmark of KillList lookups for different list sizes, compared to a plain list scan
+# SYNOPSIS: benchmark_kill_list.py [size ...]
+import random
+import re
+import string
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+from overton.category import KillList
+
+
+def random_word(rnd):
+    return "".join(rnd.choice(string.ascii_lowercase + "éèàç") for _ in range(rnd.randint(3, 12)))
+
+
+def list_lookup(kill, kill_re, item):
+    # lookup as performed before KillList used a frozenset
+    return item in kill or re.search(kill_re, item)
+
+
+def benchmark(sizes, lookups=10000):
+    rnd = random.Random(0)
+    for size in sizes:
+        words = [random_word(rnd) for _ in range(size)]
+        with tempfile.TemporaryDirectory() as temp:
+            kill_file = Path(temp) / "kill-list.txt"
+            kill_file.write_text("\n".join(words), encoding="utf8")
+            kill_list = KillList(kill_file)
+        # half of the lookups are hits
+        queries = [rnd.choice(words) if i % 2 else random_word(rnd) for i in range(lookups)]
+        kill_re = re.compile(r"\b(?:est|sont)\b", re.IGNORECASE | re.UNICODE)
+        baseline = timeit.timeit(lambda: [list_lookup(words, kill_re, q) for q in queries], number=1)
+        current = timeit.timeit(lambda: [q in kill_list for q in queries], number=1)
+        print("size=%6d list: %7.3f µs/lookup  KillList: %7.3f µs/lookup" %
+              (size, 1e6 * baseline / lookups, 1e6 * current / lookups))
+
+
+if __name__ == '__main__':
+    benchmark([int(s) for s in sys.argv[1:]] or [100, 760, 5000, 50000])
@@ -0,0 +1,54 @@
+# Converts word2vec binary embeddings (e.g. frWac) to gensim native format, which Categorizer memory-maps
+# instead of parsing the whole file at startup.
+# SYNOPSIS: convert_embeddings.py source.bin target.kv [--categories categories.json] [--corpus file_or_dir ...]
+#   When --corpus is given, the vocabulary is pruned to the tokens of the corpus and of the classification
+import argparse
+from pathlib import Path
+
+from gensim.models import KeyedVectors
+from nltk import word_tokenize
+from tqdm import tqdm
+
+from overton.category import ClassificationTree
+
+
+def corpus_vocabulary(paths):
+    vocabulary = set()
+    for path in paths:
+        path = Path(path)
+        files = path.glob("**/*.txt") if path.is_dir() else [path]
+        for file in tqdm(list(files), desc="vocabulary", unit="file"):
+            with open(file, encoding="utf8") as f:
+                for line in f:
+                    tokens = word_tokenize(line, language="french")
+                    vocabulary.update(tokens)
+                    vocabulary.update(t.lower() for t in tokens)
+    return vocabulary
+
+
+def convert(source, target, categories=None, corpus=None):
+    model = KeyedVectors.load_word2vec_format(source, binary=True, unicode_errors="ignore")
+    print("Loaded %d vectors from %s" % (len(model.key_to_index), source))
+    if corpus:
+        vocabulary = corpus_vocabulary(corpus)
+        for entry in ClassificationTree(categories).entries:
+            vocabulary.update(entry.tokens)
+        keys = [k for k in model.index_to_key if k in vocabulary]   # keep frequency order
+        pruned = KeyedVectors(model.vector_size, dtype=model.vectors.dtype)
+        pruned.add_vectors(keys, model[keys])
+        model = pruned
+        print("Pruned vocabulary to %d vectors" % len(keys))
+    model.save(target)
+    print("Saved to %s" % target)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converts word2vec binary embeddings to memory-mappable format")
+    parser.add_argument("source", help="word2vec binary file")
+    parser.add_argument("target", help="output file, shall end with .kv")
+    parser.add_argument("--categories", help="classification file (defaults to the packaged one)")
+    parser.add_argument("--corpus", nargs="*", help="text files or directories used to prune the vocabulary")
+    args = parser.parse_args()
+    if not args.target.endswith(".kv"):
+        parser.error("target file name shall end with .kv")
+    convert(args.source, args.target, args.categories, args.corpus)
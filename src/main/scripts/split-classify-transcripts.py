@@ -11,6 +11,7 @@ from tqdm import tqdm
 
 from overton.nlp import Punct, Pso
 from overton.category import Categorizer
+from overton.termsuite import TermSuitePool, TermSuiteError
 
 dotenv.load_dotenv()
 
@@ -22,32 +23,52 @@ categorizer = Categorizer(model_file=os.environ.get("WORD_EMBEDDINGS"),
 logger = logging.getLogger(__name__)
 
 TS_CMD = "./ts_wrapper.sh"
+PSO_BATCH_SIZE = int(os.environ.get("PSO_BATCH_SIZE", 32))
+# TermSuite daemons (e.g. src/main/ts/ts_daemon.sh) used instead of forking TS_CMD for each transcript
+TS_POOL = TermSuitePool([os.environ["TS_DAEMON"]], size=int(os.environ.get("TS_POOL_SIZE", 2)),
+                        timeout=float(os.environ.get("TS_TIMEOUT", 600))) if os.environ.get("TS_DAEMON") else None
 
 
-def termsuite_extract(fulltext, corpus_path, video_id):
-    ts_corpus = corpus_path / video_id
-    ts_corpus_fr = ts_corpus / "fr"
-    ts_corpus_fr.mkdir(exist_ok=True, parents=True)
-    with open(ts_corpus_fr / "all.txt", "w", encoding="utf8") as all_corpus:
-        all_corpus.write(fulltext)
-    ts_output = ts_corpus / "all.tsv"
-    if not ts_output.exists():
-        ts = [TS_CMD, ts_corpus.absolute().as_posix(), ts_output.absolute().as_posix() ]
-        p = subprocess.run(ts, capture_output=True)
-        if p.returncode != 0:
-            logger.warning("TermSuite failed: command %s returned %s", p.args, p.stderr)
+def termsuite_extract(fulltext, corpus_path, video_id, pool=TS_POOL):
+    """
+    Extracts terms with TermSuite
+    :param fulltext: the text
+    :param corpus_path: work directory, where TermSuite output is kept (unused with a pool)
+    :param video_id: the id of the text in the work directory
+    :param pool: pool of TermSuite daemons (TermSuitePool), if None TermSuite is forked
+    :return: the list of specific terms
+    """
+    lines = []
+    if pool:
+        try:
+            lines = pool.extract_tsv(fulltext)
+        except TermSuiteError as e:
+            logger.warning("TermSuite failed for %s: %s", video_id, e)
+    else:
+        ts_corpus = corpus_path / video_id
+        ts_corpus_fr = ts_corpus / "fr"
+        ts_corpus_fr.mkdir(exist_ok=True, parents=True)
+        with open(ts_corpus_fr / "all.txt", "w", encoding="utf8") as all_corpus:
+            all_corpus.write(fulltext)
+        ts_output = ts_corpus / "all.tsv"
+        if not ts_output.exists():
+            ts = [TS_CMD, ts_corpus.absolute().as_posix(), ts_output.absolute().as_posix() ]
+            p = subprocess.run(ts, capture_output=True)
+            if p.returncode != 0:
+                logger.warning("TermSuite failed: command %s returned %s", p.args, p.stderr)
+        if ts_output.exists():
+            with open(ts_output, "r", encoding="utf8") as ts:
+                lines = ts.readlines()
     # find terms associated with a category
     terms = []
-    if ts_output.exists():
-        with open(ts_output, "r", encoding="utf8") as ts:
-            for line in ts.readlines():
-                if line.startswith("#"):
-                    continue
-                fields = line.split("\t")
-                term = fields[2]
-                spec = float(fields[4])
-                if spec > 1:
-                    terms.append(term)
+    for line in lines:
+        if line.startswith("#") or not line.strip():
+            continue
+        fields = line.split("\t")
+        term = fields[2]
+        spec = float(fields[4])
+        if spec > 1:
+            terms.append(term)
     return terms
 
 
@@ -75,19 +96,15 @@ def process_json(data, corpus_path):
                 for chunk in transcript:
                     if not re.match(r"\[\w+?]", chunk["text"]):
                         text.append(chunk["text"])
-                    if has_sentences:   # transcript already split in sentences
-                        s = chunk["text"]
-                        sent = {"text": s, "type": PSO.classify(s)[0]}
-                        d["sentences"].append(sent)
-                    fulltext = "\n".join([s["text"] for s in d["sentences"]])
-                if not has_sentences:
-                    raw_text = " ".join(text)
-                    for sentence in tqdm(PUNCT.rebuild_sentences(raw_text), desc="classify", unit="sentence"):
-                        sent = {}
-                        sent["text"] = sentence
-                        sent["type"] = PSO.classify(sentence)[0]
-                        d["sentences"].append(sent)
-                        fulltext += sentence + "\n"
+                if has_sentences:   # transcript already split in sentences
+                    sentences = [chunk["text"] for chunk in transcript]
+                else:
+                    sentences = PUNCT.rebuild_sentences(" ".join(text))
+                tqdm.write("classify %d sentences" % len(sentences))
+                types = PSO.classify_batch(sentences, batch_size=PSO_BATCH_SIZE)
+                for sentence, (label, _) in zip(sentences, types):
+                    d["sentences"].append({"text": sentence, "type": label})
+                fulltext = "\n".join([s["text"] for s in d["sentences"]])
             terms = termsuite_extract(fulltext, corpus_path, video_id)
             if terms:
                 for sent in tqdm(d["sentences"], desc="tag", unit="sentence"):
@@ -118,6 +135,7 @@ def process_jsons(source_path, target_path, ts_temp_dir):
         with open(source, "r", encoding="utf8") as t:
             data = json.loads(t.read())
         data = process_json(data, corpus_path=corpus)
+        logger.info("Categorizer cache usage: %s", categorizer.cache_stats())
 
         with open(target_path / file, "w", encoding="utf8") as out:
             json.dump(data, out)
@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 from google.cloud import storage
 from hedwige_es.schema import YT, HedwigeIndex
 from datetime import date, timedelta
-from worker.aligner import align_sentences
+from worker.aligner import align_sentences, align_sentences_fuzzy
 
 load_dotenv()
 
@@ -56,10 +56,14 @@ with open("update-timestamps.csv", "w") as upd:
                     filtered_transcript = [t for t in video["transcript"] if not re.match(r"\[\w+]", t["text"])]
                     video_sentences = video["sentences"]
                     ok, aligned, total = align_sentences(filtered_transcript, video_sentences)
+                    fuzzy = False
+                    if not ok:
+                        ok, aligned, total = align_sentences_fuzzy(filtered_transcript, video_sentences)
+                        fuzzy = True
                     if ok:
                         timestamped_sentences[video_id] = video_sentences
                         logger.info(f"Video {video_id} from {yt.candidat} is correctly aligned")
-                        writer.writerow(["CORRECT", video_id, id_to_blob[video_id].name])
+                        writer.writerow(["FUZZY" if fuzzy else "CORRECT", video_id, id_to_blob[video_id].name])
                     else:
                         misaligned_sentences[video_id] = video
                         logger.warning(f"{video_id} has transcription errors")
@@ -0,0 +1,165 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.security.Permission;
+import java.util.ArrayList;
+import java.util.Comparator;
+import java.util.List;
+import java.util.stream.Stream;
+
+import fr.univnantes.termsuite.tools.TerminologyExtractorCLI;
+
+/**
+ * Long-lived TermSuite extractor: runs the TermSuite command line extractor for each request within the same JVM,
+ * so that JVM start-up and class loading are paid once.
+ * <p>
+ * Protocol on stdin/stdout, UTF-8. The daemon writes "READY" once started, then for each request:
+ * <ul>
+ *     <li>request: "EXTRACT &lt;n&gt;" followed by n bytes of text, or "EXTRACT_BATCH &lt;k&gt;" followed by k
+ *     documents, each one as a line "&lt;n&gt;" then n bytes of text. All documents are extracted as one corpus</li>
+ *     <li>response: "OK", the lines of the TSV output (of the JSON output, with the occurrences of the terms, for
+ *     EXTRACT_BATCH), an empty line, then "." - or "ERROR &lt;message&gt;", either instead of "OK" or after
+ *     the output lines if TermSuite fails</li>
+ * </ul>
+ * TermSuite writes its output directly to stdout (/dev/stdout, Linux only), its logs go to stderr. The corpus
+ * is written to the work directory, as TermSuite reads it from files.
+ * <p>
+ * System.exit() of TermSuite is trapped with a security manager, which no longer exists from JDK 24 on:
+ * run it with JDK 11 to 23 (see ts_daemon.sh, Dockerfile-ts pins JDK 11).
+ * <p>
+ * Usage: java -cp termsuite-core.jar:. TermSuiteDaemon &lt;TreeTagger home&gt; [work dir, defaults to /dev/shm]
+ */
+public class TermSuiteDaemon {
+
+    /** The output of TermSuite goes to the file descriptor of stdout, bypassing System.out */
+    static final Path STDOUT = Paths.get("/dev/stdout");
+
+    /** Thrown instead of exiting the JVM when TermSuite calls System.exit() */
+    static class ExitTrappedException extends SecurityException {
+        final int status;
+
+        ExitTrappedException(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    public static void main(String[] args) throws IOException {
+        if (args.length < 1) {
+            System.err.println("Usage: TermSuiteDaemon <TreeTagger home> [work dir]");
+            System.exit(1);
+        }
+        String treeTagger = args[0];
+        Path workDir = Paths.get(args.length > 1 ? args[1] : "/dev/shm");
+        if (!Files.isDirectory(workDir)) {
+            workDir = Paths.get(System.getProperty("java.io.tmpdir"));
+        }
+        PrintStream protocol = new PrintStream(new BufferedOutputStream(new FileOutputStream(FileDescriptor.out)),
+                false, "UTF-8");
+        // TermSuite logs shall not mix with responses
+        System.setOut(System.err);
+        trapExit();
+        DataInputStream in = new DataInputStream(new BufferedInputStream(System.in));
+        respond(protocol, "READY");
+        String command;
+        while ((command = readLine(in)) != null) {
+            List<byte[]> documents = new ArrayList<>();
+            boolean batch = command.startsWith("EXTRACT_BATCH ");
+            if (command.startsWith("EXTRACT ")) {
+                documents.add(readDocument(in, command.substring(8)));
+            } else if (batch) {
+                int count = Integer.parseInt(command.substring(14).trim());
+                for (int i = 0; i < count; i++) {
+                    documents.add(readDocument(in, readLine(in)));
+                }
+            } else {
+                respond(protocol, "ERROR unknown command " + command);
+                continue;
+            }
+            Path corpus = Files.createTempDirectory(workDir, "ts");
+            try {
+                Path corpusFr = Files.createDirectories(corpus.resolve("fr"));
+                for (int i = 0; i < documents.size(); i++) {
+                    Files.write(corpusFr.resolve(String.format("doc-%06d.txt", i)), documents.get(i));
+                }
+                // TermSuite writes its output after "OK". The response ends with a new line first, in case
+                // the last output line has none
+                respond(protocol, "OK");
+                extract(treeTagger, corpus, batch ? "--json" : "--tsv");
+                respond(protocol, "\n.");
+            } catch (Exception e) {
+                respond(protocol, "\nERROR " + String.valueOf(e.getMessage()).replace('\n', ' '));
+            } finally {
+                delete(corpus);
+            }
+        }
+    }
+
+    private static byte[] readDocument(DataInputStream in, String length) throws IOException {
+        byte[] text = new byte[Integer.parseInt(length.trim())];
+        in.readFully(text);
+        return text;
+    }
+
+    /**
+     * Runs the TermSuite command line extractor, writing its output to stdout
+     * @param format "--tsv" or "--json" (terms with their occurrences)
+     */
+    private static void extract(String treeTagger, Path corpus, String format) throws Exception {
+        String[] args = {"-t", treeTagger, "--tsv-properties", "pilot,lemma,spec,freq", "-l", "fr",
+                "-c", corpus.toString(), format, STDOUT.toString()};
+        try {
+            TerminologyExtractorCLI.main(args);
+        } catch (ExitTrappedException e) {
+            if (e.status != 0) {
+                throw new Exception("TermSuite exited with status " + e.status);
+            }
+        }
+    }
+
+    @SuppressWarnings("removal")
+    private static void trapExit() {
+        System.setSecurityManager(new SecurityManager() {
+            @Override
+            public void checkPermission(Permission perm) {
+            }
+
+            @Override
+            public void checkExit(int status) {
+                throw new ExitTrappedException(status);
+            }
+        });
+    }
+
+    private static void respond(PrintStream protocol, String line) {
+        protocol.println(line);
+        protocol.flush();
+    }
+
+    private static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int c;
+        while ((c = in.read()) != '\n') {
+            if (c == -1) {
+                return line.size() > 0 ? line.toString("UTF-8") : null;
+            }
+            line.write(c);
+        }
+        return line.toString("UTF-8");
+    }
+
+    private static void delete(Path dir) throws IOException {
+        try (Stream<Path> paths = Files.walk(dir)) {
+            paths.sorted(Comparator.reverseOrder()).forEach(path -> path.toFile().delete());
+        }
+    }
+}
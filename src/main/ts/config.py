@@ -6,3 +6,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TS_CMD = os.environ.get("TS_WRAPPER", "ts_wrapper.sh")
+# Long-lived TermSuite processes (see TermSuiteDaemon.java), used if TS_POOL_SIZE > 0.
+# By default, TS_CMD is forked on each request: only enable the pool once TermSuiteIntegrationTests
+# (src/unittest/python/termsuite_tests.py) pass with the installed TermSuite and JDK
+TS_DAEMON = os.environ.get("TS_DAEMON", "ts_daemon.sh")
+TS_POOL_SIZE = int(os.environ.get("TS_POOL_SIZE", 0))
+# a daemon which does not answer within TS_TIMEOUT seconds is killed and replaced
+TS_TIMEOUT = float(os.environ.get("TS_TIMEOUT", 600))
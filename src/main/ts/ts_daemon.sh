@@ -0,0 +1,21 @@
+#!/bin/bash
+# Starts a TermSuite daemon (see TermSuiteDaemon.java), compiled on first use
+TS_JAR=$HOME/.local/termsuite/termsuite-core-3.0.10.jar
+SOURCE=$(dirname "$0")/TermSuiteDaemon.java
+CLASSES=${TS_DAEMON_CLASSES:-$HOME/.local/termsuite/daemon}
+if [ ! -f "$CLASSES/TermSuiteDaemon.class" ] || [ "$SOURCE" -nt "$CLASSES/TermSuiteDaemon.class" ]; then
+    mkdir -p "$CLASSES"
+    javac -cp "$TS_JAR" -d "$CLASSES" "$SOURCE" >&2 || exit 1
+fi
+# System.exit() of TermSuite is trapped with a security manager, which shall be explicitly allowed since Java 12
+# and no longer exists since Java 24
+JAVA_VERSION=$(java -version 2>&1 | awk -F'"' '/version/ {split($2, v, "."); print (v[1] == "1") ? v[2] : v[1]}')
+if [ "$JAVA_VERSION" -ge 24 ]; then
+    echo "TermSuiteDaemon requires Java 11 to 23, found Java $JAVA_VERSION (set PATH or use Dockerfile-ts)" >&2
+    exit 1
+fi
+JAVA_OPTS=""
+if [ "$JAVA_VERSION" -ge 12 ]; then
+    JAVA_OPTS="-Djava.security.manager=allow"
+fi
+exec java $JAVA_OPTS -cp "$TS_JAR:$CLASSES" TermSuiteDaemon $HOME/.local/treetagger ${TS_WORK_DIR:-/dev/shm}
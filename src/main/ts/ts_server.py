@@ -1,48 +1,59 @@
 """
-Simple RESTful client that forks TermSuite and collects extracted terms.
-A Java version would be more efficient...
+Simple RESTful client that collects terms extracted by TermSuite.
+TermSuite is forked for each text, or texts are sent to a pool of long-lived TermSuite processes if TS_POOL_SIZE > 0.
 """
-import subprocess
-import tempfile
 from pathlib import Path
 
 from flask import Flask, jsonify, request
 
+from overton.termsuite import TermSuitePool, TermSuiteError, run_termsuite, parse_json, parse_tsv, terms_by_document
+
 app = Flask(__name__)
 app.config.from_object("config")
 
 
+def _command(name):
+    cmd = Path(app.config[name])
+    if not cmd.is_absolute():
+        cmd = Path(app.root_path) / cmd
+    return cmd
+
+
+POOL = TermSuitePool([str(_command("TS_DAEMON"))], size=app.config["TS_POOL_SIZE"],
+                     timeout=app.config["TS_TIMEOUT"]) if app.config["TS_POOL_SIZE"] else None
+
+
 @app.route('/extract', methods=['POST'])
 def extract():
     text = request.get_json().get("text")
-    ts_cmd = Path(app.config["TS_CMD"])
-    if not ts_cmd.is_absolute():
-        ts_cmd = Path(app.root_path) / ts_cmd
-    with tempfile.TemporaryDirectory(prefix="ts") as temp:
-        corpus = Path(temp)
-        corpus_fr = corpus / "fr"
-        corpus_fr.mkdir()
-        with open(corpus_fr / "all.txt", "w", encoding="utf8") as txt_out:
-            txt_out.write(text)
-        ts_output = corpus / "all.tsv"
-        ts = [str(ts_cmd), corpus.absolute().as_posix(), ts_output.absolute().as_posix()]
-        try:
-            subprocess.run(ts, capture_output=True, check=True)
-        except subprocess.CalledProcessError as ex:
-            app.logger.warning("TermSuite failed: command %s returned %s", ex.cmd, ex.stderr)
-            return jsonify({"err": ex.returncode, "stderr": str(ex.stderr)}), 500
-        terms = fields = []
-        if ts_output.exists():
-            with open(ts_output, "r", encoding="utf8") as ts:
-                for line in ts.readlines():
-                    line = line.strip()
-                    if line.startswith("#") and not fields:
-                        fields = line.split("\t")
-                    else:
-                        extracted = line.split("\t")
-                        data = {}
-                        for i, d in enumerate(extracted):
-                            if i > 0:
-                                data[fields[i]] = d
-                        terms.append(data)
-        return jsonify(terms)
+    try:
+        if POOL:
+            lines = POOL.extract_tsv(text)
+        else:
+            lines = run_termsuite(_command("TS_CMD"), [text])
+    except TermSuiteError as ex:
+        app.logger.warning("TermSuite failed: %s", ex)
+        return jsonify({"err": 1, "stderr": str(ex)}), 500
+    return jsonify(parse_tsv(lines))
+
+
+@app.route('/extract_batch', methods=['POST'])
+def extract_batch():
+    """
+    Extracts the terms of several texts with a single TermSuite run, on the corpus made of all texts.
+    Input message shall be {"texts": [text1, text2, ...]}
+    :return: for each text, the list of its terms with their TermSuite fields (spec... computed on the corpus)
+    and doc_freq, the number of occurrences of the term in the text
+    """
+    texts = request.get_json().get("texts", [])
+    if not texts:
+        return jsonify([])
+    try:
+        if POOL:
+            output = POOL.extract_batch_json(texts)
+        else:
+            output = run_termsuite(_command("TS_CMD"), texts, output="json")
+    except (TermSuiteError, ValueError) as ex:
+        app.logger.warning("TermSuite failed: %s", ex)
+        return jsonify({"err": 1, "stderr": str(ex)}), 500
+    return jsonify(terms_by_document(texts, *parse_json(output)))
@@ -1,3 +1,9 @@
 #!/bin/bash
+# Extracts the terms of the corpus $1 into $2: JSON (terms with their occurrences) if $2 ends with .json, else TSV
+if [[ "$2" == *.json ]]; then
+    OUTPUT=(--json "$2")
+else
+    OUTPUT=(--tsv-properties 'pilot,lemma,spec,freq' --tsv "$2")
+fi
 java -cp $HOME/.local/termsuite/termsuite-core-3.0.10.jar fr.univnantes.termsuite.tools.TerminologyExtractorCLI \
--t $HOME/.local/treetagger --tsv-properties 'pilot,lemma,spec,freq' -l fr -c $1 --tsv $2
+-t $HOME/.local/treetagger -l fr -c $1 "${OUTPUT[@]}"
@@ -4,7 +4,7 @@ import re
 import unittest
 from pathlib import Path
 
-from worker.aligner import align_sentences
+from worker.aligner import align_sentences, align_sentences_fuzzy
 
 
 class TimestampAlignerTests(unittest.TestCase):
@@ -24,6 +24,34 @@ class TimestampAlignerTests(unittest.TestCase):
             print(f"{speech}: {aligned} out of {total}")
             self.assertTrue(align_ok, "Couldn't align " + speech)  # timestamp shall be marked up to the last sentence
 
+    def test_short_alignment(self):
+        transcript = [{"text": "bonjour à tous nous", "start": 0.0, "duration": 2.0},
+                      {"text": "parlons du pouvoir", "start": 2.0, "duration": 2.0},
+                      {"text": "d'achat aujourd'hui", "start": 4.0, "duration": 2.0},
+                      {"text": "et demain", "start": 6.0, "duration": 1.0}]
+        sentences = [{"text": "Bonjour à tous."},
+                     {"text": "Nous parlons du pouvoir d'achat aujourd'hui."},
+                     {"text": "Et demain."}]
+        align_ok, total, aligned = align_sentences(transcript, sentences)
+        self.assertTrue(align_ok)
+        self.assertEqual(total, 3)
+        self.assertEqual(sentences[2]["start"], 4.0)
+
+    def test_fuzzy_alignment(self):
+        # 2nd chunk is lost and 3rd one is misrecognized: exact alignment gives up
+        transcript = [{"text": "bonjour à tous nous", "start": 0.0, "duration": 2.0},
+                      {"text": "d'achat aujourd'hui et", "start": 4.0, "duration": 2.0},
+                      {"text": "demain nous parlerons de l'église", "start": 6.0, "duration": 2.0},
+                      {"text": "publique dans nos régions", "start": 8.0, "duration": 2.0}]
+        sentences = [{"text": "Bonjour à tous."},
+                     {"text": "Nous parlons du pouvoir d'achat aujourd'hui et demain."},
+                     {"text": "Nous parlerons de l'école publique dans nos régions."}]
+        self.assertFalse(align_sentences(transcript, [dict(s) for s in sentences])[0])
+        align_ok, total, aligned = align_sentences_fuzzy(transcript, sentences)
+        self.assertTrue(align_ok)
+        self.assertEqual(sentences[2]["start"], 6.0)
+        self.assertEqual(sentences[2]["duration"], 4.0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,204 @@
+import json
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import app as api
+import tasks
+
+
+class FakeRedis:
+    """
+    Stands for the Redis client of TaskStatusStore and BatchProgress
+    """
+    def __init__(self, data=None, down=False):
+        self.data = data or {}
+        self.down = down
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class Pipeline(list):
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.append((getattr(redis, name), args, kwargs))
+
+            def execute(self):
+                return [method(*args, **kwargs) for method, args, kwargs in self]
+        return Pipeline()
+
+    def set(self, key, value, ex=None):
+        self.data[key] = str(value).encode()
+
+    def mget(self, keys):
+        if self.down:
+            raise ConnectionError("Redis is down")
+        return [self.data.get(key) for key in keys]
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({name: str(value).encode() for name, value in mapping.items()})
+
+    def hincrby(self, key, name, amount=1):
+        value = int(self.data.setdefault(key, {}).get(name, 0)) + amount
+        self.data[key][name] = str(value).encode()
+        return value
+
+    def hmget(self, key, *names):
+        return [self.data.get(key, {}).get(name) for name in names]
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class FakeBackendRedis:
+    """
+    Stands for the Redis client of the Celery backend: only pipelined GETRANGE is allowed
+    """
+    def __init__(self, data):
+        self.data = data
+        self.read = []
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class Pipeline(list):
+            def getrange(self, key, start, end):
+                self.append((key, start, end))
+
+            def execute(self):
+                redis.read.extend(key for key, _, _ in self)
+                return [redis.data.get(key, b"")[start:end + 1] for key, start, end in self]
+        return Pipeline()
+
+
+class FakeBackend:
+    def __init__(self, results):
+        self.client = FakeBackendRedis({self.get_key_for_task(task_id): result for task_id, result in results.items()})
+
+    @staticmethod
+    def get_key_for_task(task_id):
+        return b"celery-task-meta-" + task_id.encode()
+
+    def get(self, key):
+        raise AssertionError("whole result read for %s" % key)
+
+
+class TaskStatesTests(unittest.TestCase):
+
+    RESULTS = {"t2": b'{"status": "FAILURE", "result": {"exc_type": "ValueError"}}',
+               "t3": b"\x28\xb5\x2f\xfd" + b"\x00" * 100}
+
+    def setUp(self):
+        self.backend = FakeBackend(self.RESULTS)
+        mock.patch.object(api, "client", SimpleNamespace(backend=self.backend)).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def status_redis(self, **kwargs):
+        redis = FakeRedis(**kwargs)
+        mock.patch.object(api.TASK_STATUS, "redis", redis).start()
+        return redis
+
+    def test_stored_statuses_first(self):
+        self.status_redis(data={api.TASK_STATUS.PREFIX + "t1": b"SUCCESS"})
+        self.assertEqual(["SUCCESS", "FAILURE", "UNKNOWN", "PENDING"], api._task_states(["t1", "t2", "t3", "t4"]))
+        # results are only read for the tasks without status, in a single pipeline
+        self.assertEqual([self.backend.get_key_for_task(t) for t in ("t2", "t3", "t4")], self.backend.client.read)
+
+    def test_status_store_down(self):
+        self.status_redis(down=True)
+        self.assertEqual(["FAILURE", "PENDING"], api._task_states(["t2", "t4"]))
+
+    def test_backend_without_redis(self):
+        self.status_redis()
+
+        def async_result(task_id):
+            if task_id == "lost":
+                raise ConnectionError("backend is down")
+            return SimpleNamespace(state="STARTED")
+
+        mock.patch.object(api, "client", SimpleNamespace(backend=object(), AsyncResult=async_result)).start()
+        self.assertEqual(["STARTED", "ERROR"], api._task_states(["t1", "lost"]))
+
+
+def hot(speech):
+    if speech.get("fail"):
+        raise ValueError("cannot parse")
+    return dict(speech, enhanced=True)
+
+
+class BatchTests(unittest.TestCase):
+    """
+    Runs the chunk tasks of /batch eagerly, storing their results in memory
+    """
+    @classmethod
+    def setUpClass(cls):
+        for celery in (api.client, tasks.client):
+            celery.conf.update(task_always_eager=True, task_store_eager_result=True,
+                               result_backend="cache+memory://")
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        mock.patch.object(tasks.TASK_STATUS, "redis", self.redis).start()
+        mock.patch.object(tasks.BATCHES, "redis", self.redis).start()
+        mock.patch.dict(tasks.PIPELINES, {"hot": hot}).start()
+        mock.patch.object(tasks, "_lazy_load").start()
+        self.notify = mock.patch.object(tasks.notify_batch, "delay").start()
+        mock.patch.dict(api.app.config, {"BATCH_CHUNK_SIZE": 2, "BATCH_CALLBACK_HOSTS": "example.org"}).start()
+        self.addCleanup(mock.patch.stopall)
+        self.client = api.app.test_client()
+
+    def batch(self, data, query=""):
+        return self.client.post("/batch/hot" + query, data=data)
+
+    def results(self, response):
+        """
+        :return: the result of each speech of the batch, found by its position (see /batch)
+        """
+        batch = response.get_json()
+        chunks = [self.client.get("/result/" + task_id).get_json() for task_id in batch["ids"]]
+        return [chunks[i // batch["chunk_size"]][i % batch["chunk_size"]] for i in range(batch["count"])]
+
+    def test_json_array(self):
+        response = self.batch(json.dumps([{"n": i} for i in range(5)]), "?chunk_size=3")
+        self.assertEqual(200, response.status_code)
+        batch = response.get_json()
+        self.assertEqual((2, 3, 5), (len(batch["ids"]), batch["chunk_size"], batch["count"]))
+        self.assertEqual([{"n": i, "enhanced": True} for i in range(5)], self.results(response))
+
+    def test_ndjson(self):
+        response = self.batch("\n".join(json.dumps({"n": i}) for i in range(5)) + "\n\n")
+        self.assertEqual(3, len(response.get_json()["ids"]))
+        self.assertEqual(list(range(5)), [result["n"] for result in self.results(response)])
+
+    def test_failed_speech_keeps_its_position(self):
+        response = self.batch(json.dumps([{"n": 0}, {"n": 1, "fail": True}, {"n": 2}]))
+        self.assertEqual([{"n": 0, "enhanced": True}, {"error": "cannot parse"}, {"n": 2, "enhanced": True}],
+                         self.results(response))
+
+    def test_empty(self):
+        for data in ("", "[]", "\n\n"):
+            response = self.batch(data)
+            self.assertEqual(400, response.status_code)
+            self.assertEqual("Empty batch", response.get_json()["error"])
+
+    def test_invalid_json(self):
+        for data in ('[{"n": 0}', '{"n": 0}\n{"n": '):
+            response = self.batch(data)
+            self.assertEqual(400, response.status_code)
+            self.assertIn("Invalid JSON", response.get_json()["error"])
+        self.assertEqual(404, self.client.post("/batch/unknown", data="[{}]").status_code)
+
+    def test_callback(self):
+        response = self.batch(json.dumps([{"n": i} for i in range(5)]), "?callback=https://example.org/done")
+        batch_id = response.get_json()["batch"]
+        # sent once, by the last chunk
+        self.notify.assert_called_once_with("https://example.org/done", batch_id, "SUCCESS")
+        self.assertNotIn(tasks.BATCHES.PREFIX + batch_id, self.redis.data)
+        response = self.batch("[{}]", "?callback=https://elsewhere.org/done")
+        self.assertEqual(400, response.status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from overton.backends import ONNX_CACHE, inference_backend, onnx_cache_dir, onnx_model
+
+
+class BackendsTests(unittest.TestCase):
+
+    def test_onnx_cache_dir(self):
+        for name in ["mazancourt/politics-sentence-classifier", "/models/politics-sentence-classifier",
+                     "/models/politics-sentence-classifier/", "../../etc", "/"]:
+            export_dir = onnx_cache_dir(name)
+            self.assertEqual(ONNX_CACHE, export_dir.parent, name)
+            self.assertNotIn(export_dir.name, ("", ".", ".."))
+        self.assertTrue(onnx_cache_dir("/models/pso").name.startswith("pso-"))
+        # same basename, different models
+        self.assertNotEqual(onnx_cache_dir("/models/v1/pso"), onnx_cache_dir("/models/v2/pso"))
+
+    def test_backend_selection(self):
+        self.assertEqual("onnx", inference_backend("onnx"))
+        with self.assertRaises(ValueError):
+            inference_backend("tensorrt")
+
+    def test_onnx_task(self):
+        try:
+            import optimum.onnxruntime  # noqa: F401
+        except ImportError:
+            self.skipTest("optimum is not installed")
+        with self.assertRaises(ValueError):
+            onnx_model("CamembertModel", "camembert-base")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+import unittest
+
+from worker.batching import MicroBatcher, BatchedPso, SerializedTool, batched_pso, batched_sentence_builder
+
+
+class MicroBatcherTests(unittest.TestCase):
+
+    def test_concurrent_requests_are_batched(self):
+        calls = []
+
+        def batch_fn(items):
+            calls.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=100, max_wait=0.2)
+        results = {}
+
+        def submit(n):
+            results[n] = batcher.submit(list(range(n, n + 3)))
+
+        threads = [threading.Thread(target=submit, args=(10 * n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for n, result in results.items():
+            self.assertEqual([2 * i for i in range(n, n + 3)], result)
+        self.assertLess(len(calls), 4)
+        self.assertEqual(12, batcher.items)
+
+    def test_errors_reach_every_caller(self):
+        def batch_fn(items):
+            raise ValueError("boom")
+
+        batcher = MicroBatcher(batch_fn, max_wait=0)
+        with self.assertRaises(ValueError):
+            batcher.submit(["a"])
+        self.assertEqual([], batcher.submit([]))
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_usable_after_fork(self):
+        batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_wait=0)
+        self.assertEqual([2], batcher.submit([1]))
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if batcher.submit([41]) == [42] else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+
+    def test_pso_with_classify_batch(self):
+        class Pso:
+            def classify_batch(self, texts, batch_size=32):
+                return [("problem" if "pas" in text else "other", 1.0) for text in texts]
+
+        pso = batched_pso(Pso(), max_wait=0.01)
+        self.assertIsInstance(pso, BatchedPso)
+        self.assertEqual([("problem", 1.0), ("other", 1.0)], pso.classify_batch(["ça ne va pas", "bonjour"]))
+        self.assertEqual(("other", 1.0), pso.classify("bonjour"))
+
+    def test_tools_without_batch_method_are_serialized(self):
+        class OneByOne:
+            lang = "fr"
+
+            def __init__(self):
+                self.running = 0
+                self.overlaps = 0
+
+            def rebuild_sentences(self, text):
+                self.running += 1
+                time.sleep(0.01)
+                self.overlaps += self.running > 1
+                self.running -= 1
+                return [text]
+
+        tool = OneByOne()
+        builder = batched_sentence_builder(tool)
+        self.assertIsInstance(builder, SerializedTool)
+        self.assertIsInstance(batched_pso(tool), SerializedTool)
+        self.assertEqual("fr", builder.lang)
+        threads = [threading.Thread(target=builder.rebuild_sentences, args=("bonjour",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(0, tool.overlaps)
+        self.assertEqual(["bonjour"], builder.rebuild_sentences("bonjour"))
+
+
+if __name__ == '__main__':
+    unittest.main()
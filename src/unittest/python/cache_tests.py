@@ -0,0 +1,105 @@
+import multiprocessing
+import tempfile
+import unittest
+from pathlib import Path
+
+from overton.cache import LRUCache, PersistentCache
+from worker.cache import CachedExtractor
+
+
+def write_entries(path, start, count):
+    cache = PersistentCache(path, namespace="v1")
+    for i in range(start, start + count):
+        cache.put("term%d" % i, [["entry%d" % i, i / 100]])
+
+
+class CountingExtractor:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return {"terms": text.split()}
+
+    def classification_version(self):
+        return "v1"
+
+
+class PersistentCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp.name) / "cache.sqlite"
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_round_trip(self):
+        cache = PersistentCache(self.path, namespace="v1")
+        self.assertIsNone(cache.get("pouvoir d'achat"))
+        cache.put("pouvoir d'achat", [["Économie/Pouvoir d'achat", 0.05]])
+        cache.put_many({"smic": [["Économie/Salaires", 0.2]], "retraites": []})
+        # another connection reads the same file
+        cache = PersistentCache(self.path, namespace="v1")
+        self.assertEqual([["Économie/Pouvoir d'achat", 0.05]], cache.get("pouvoir d'achat"))
+        self.assertEqual({"smic": [["Économie/Salaires", 0.2]], "retraites": []},
+                         cache.get_many(["smic", "retraites", "chômage"]))
+
+    def test_version_change(self):
+        PersistentCache(self.path, namespace="v1").put("smic", [["Économie/Salaires", 0.2]])
+        cache = PersistentCache(self.path, namespace="v2")
+        self.assertIsNone(cache.get("smic"))
+        self.assertEqual({}, cache.get_many(["smic"]))
+        cache.put("smic", [])
+        self.assertEqual([["Économie/Salaires", 0.2]], PersistentCache(self.path, namespace="v1").get("smic"))
+
+    def test_processes(self):
+        cache = PersistentCache(self.path, namespace="v1")
+        cache.put("term0", [])
+        context = multiprocessing.get_context("spawn")
+        writers = [context.Process(target=write_entries, args=(self.path, start, 50)) for start in (1, 51)]
+        for writer in writers:
+            writer.start()
+        # reads while the other processes write (WAL)
+        while any(writer.is_alive() for writer in writers):
+            self.assertEqual([], cache.get("term0"))
+        for writer in writers:
+            writer.join()
+            self.assertEqual(0, writer.exitcode)
+        self.assertEqual(100, len(cache.get_many(["term%d" % i for i in range(1, 101)])))
+        self.assertEqual("wal", cache._connect().execute("PRAGMA journal_mode").fetchone()[0])
+
+
+class CachedExtractorTests(unittest.TestCase):
+
+    def test_cached_extraction(self):
+        with tempfile.TemporaryDirectory() as temp:
+            extractor = CountingExtractor()
+            cached = CachedExtractor(extractor, PersistentCache(Path(temp) / "terms.sqlite", namespace="v1/plain"))
+            self.assertEqual({"terms": ["pouvoir", "d'achat"]}, cached("pouvoir d'achat"))
+            self.assertEqual({"terms": ["pouvoir", "d'achat"]}, cached("pouvoir d'achat"))
+            self.assertEqual((1, 1, 1), (extractor.calls, cached.hits, cached.misses))
+            # other methods reach the extractor
+            self.assertEqual("v1", cached.classification_version())
+            # another classification: computed again
+            other = CachedExtractor(extractor, PersistentCache(Path(temp) / "terms.sqlite", namespace="v2/plain"))
+            other("pouvoir d'achat")
+            self.assertEqual(2, extractor.calls)
+
+
+class LRUCacheTests(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((1, 3), (cache.get("a"), cache.get("c")))
+        stats = cache.stats()
+        self.assertEqual((3, 1, 1), (stats["hits"], stats["misses"], stats["evictions"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import http.server
+import json
+import threading
+import unittest
+import urllib.error
+
+from worker.callbacks import allowed_hosts, check_callback, post_json
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    received = []
+
+    def do_POST(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "http://169.254.169.254/latest/meta-data")
+        else:
+            Handler.received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class CallbackTests(unittest.TestCase):
+
+    def test_check_callback(self):
+        hosts = allowed_hosts(" crm.example.org, *.example.com ,")
+        self.assertEqual(["crm.example.org", "*.example.com"], hosts)
+        check_callback("https://crm.example.org/batches?x=1", hosts)
+        check_callback("http://hooks.EXAMPLE.com:8080/done", hosts)
+        for url in ["file:///etc/passwd", "gopher://crm.example.org/", "http://localhost:6379/",
+                    "http://169.254.169.254/latest/meta-data", "http://evilexample.com/",
+                    "http://crm.example.org.evil.net/", "http://user@/"]:
+            with self.assertRaises(ValueError, msg=url):
+                check_callback(url, hosts)
+        with self.assertRaises(ValueError):
+            check_callback("https://crm.example.org/", [])
+
+    def test_post_json(self):
+        server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = "http://127.0.0.1:%d" % server.server_port
+        try:
+            post_json(base + "/done", {"batch": "b1", "status": "SUCCESS"}, timeout=5)
+            self.assertEqual([{"batch": "b1", "status": "SUCCESS"}], Handler.received)
+            # redirects are not followed
+            with self.assertRaises(urllib.error.HTTPError):
+                post_json(base + "/redirect", {}, timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,9 @@
 import os
+import tempfile
 import unittest
 
 from dotenv import load_dotenv
-from overton.category import Categorizer
+from overton.category import Categorizer, KillList
 
 load_dotenv()
 
@@ -32,6 +33,75 @@ class CategorizerTest(unittest.TestCase):
         categories = self.categorizer.categorize_sentence(s, ["smic", "smicard", "monde"])
         self.assertEqual(len(categories), 2)
 
+    def test_candidates_match_brute_force(self):
+        for term in ["pouvoir d'achat", "immigration clandestine", "réchauffement climatique"]:
+            self.categorizer.n_candidates = None
+            expected = self.categorizer._categorize_scores(term, 5)
+            self.categorizer.n_candidates = 50
+            found = self.categorizer._categorize_scores(term, 5)
+            self.assertEqual([str(e) for e, _ in expected], [str(e) for e, _ in found])
+
+    def test_categorize_many(self):
+        terms = ["smic", "smicard", "monde", "politique"]
+        batch = self.categorizer.categorize_many(terms, n_results=1)
+        self.assertEqual(batch["politique"], [])    # kill-listed
+        for t in terms:
+            self.assertEqual([str(e) for e, _ in batch[t]],
+                             [str(e) for e, _ in self.categorizer.categorize_scores(t, n_results=1)])
+
+    def test_cache(self):
+        self.categorizer.categorize_scores("pouvoir d'achat")
+        self.categorizer.categorize_scores("pouvoir d'achat")
+        stats = self.categorizer.cache_stats()["categorize_scores"]
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        # results of another version of the classification shall not be used
+        self.categorizer.classification.version = "reloaded"
+        self.categorizer.categorize_scores("pouvoir d'achat")
+        self.assertEqual(self.categorizer.cache_stats()["categorize_scores"]["misses"], 2)
+
+    def test_persistent_cache(self):
+        class NoIndex:
+            # closest entries shall be read from the persistent cache, not computed
+            def candidates_many(self, token_lists, k):
+                assert not token_lists, "closest entries computed again"
+                return []
+
+        terms = ["pouvoir d'achat", "immigration clandestine", "réchauffement climatique"]
+        with tempfile.TemporaryDirectory() as temp:
+            path = os.path.join(temp, "nearest.sqlite")
+            writer = Categorizer(model_file=os.environ.get("WORD_EMBEDDINGS"),
+                                 categories_file=os.environ.get("CATEGORIES_JSON"),
+                                 kill_list_file=os.environ.get("KILL_LIST"), persistent_cache=path)
+            tokenized = {term: term.replace("'", "' ").split() for term in terms}
+            expected = writer._nearest_many(tokenized)
+            reader = Categorizer(model_file=os.environ.get("WORD_EMBEDDINGS"),
+                                 categories_file=os.environ.get("CATEGORIES_JSON"),
+                                 kill_list_file=os.environ.get("KILL_LIST"), persistent_cache=path)
+            reader.index = NoIndex()
+            found = reader._nearest_many(tokenized)
+            for term in terms:
+                self.assertEqual([(str(e), d) for e, d in expected[term]], [(str(e), d) for e, d in found[term]])
+            # entries of another classification version are not used
+            reader.persistent_cache.namespace += "/reloaded"
+            with self.assertRaises(AssertionError):
+                reader._nearest_many(tokenized)
+
+
+class KillListTest(unittest.TestCase):
+
+    def test_exact_lines(self):
+        with tempfile.TemporaryDirectory() as temp:
+            path = os.path.join(temp, "kill-list.txt")
+            with open(path, "w", encoding="utf8") as f:
+                f.write("# comment\nétat\ncôté\n  passé  \n\n")
+            kill_list = KillList(path)
+        for term in ["état", "côté", "passé", "le chômage est élevé", "Ils SONT là"]:
+            self.assertIn(term, kill_list)
+        # case and accents matter
+        for term in ["État", "Etat", "cote", "côte", "passe", "# comment", ""]:
+            self.assertNotIn(term, kill_list)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,145 @@
+import threading
+import unittest
+
+from worker.aligner import split_transcript, unpunctuated_length
+from worker.live import LiveJobStore, OutOfOrder
+from worker.pipelines import transcript_live_pipeline
+from worker.utils import Tools
+
+
+class FakeSentenceBuilder:
+    """
+    Ends a sentence after each "fin"
+    """
+    def rebuild_sentences(self, text):
+        sentences = [[]]
+        for word in text.split():
+            sentences[-1].append(word)
+            if word == "fin":
+                sentences.append([])
+        return [" ".join(words) + ("." if words[-1] == "fin" else "") for words in sentences if words]
+
+
+class FakeTextTiler:
+    """
+    One paragraph per sentence
+    """
+    def tile_text(self, text):
+        return [[sentence] for sentence in text.split("\n\n") if sentence]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode("utf8")
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def lock(self, key, timeout=None):
+        return threading.Lock()
+
+
+def chunk(text, start):
+    return {"text": text, "start": float(start), "duration": 1.0}
+
+
+class LivePipelineTests(unittest.TestCase):
+
+    TOOLS = Tools(sentence_builder=FakeSentenceBuilder(), howler=None, pso=None, namer=None,
+                  text_tiler=FakeTextTiler())
+
+    def test_frozen_paragraphs_never_change(self):
+        state = {}
+        first = transcript_live_pipeline(state, [chunk("bonjour à tous fin nous parlons", 0),
+                                                 chunk("du pouvoir d'achat fin et", 1)], self.TOOLS)
+        self.assertEqual([(0, True), (1, True), (2, False)], [(p["chunk_id"], p["frozen"]) for p in first])
+        self.assertEqual(["bonjour à tous fin.", "nous parlons du pouvoir d'achat fin.", "et"],
+                         [p["text"] for p in first])
+        # only the unfinished paragraph is computed again
+        self.assertEqual(["et"], [c["text"] for c in state["tail"]])
+        second = transcript_live_pipeline(state, [chunk("demain fin puis", 2)], self.TOOLS)
+        self.assertEqual([(2, True, "et demain fin."), (3, False, "puis")],
+                         [(p["chunk_id"], p["frozen"], p["text"]) for p in second])
+        last = transcript_live_pipeline(state, [chunk("la suite", 3)], self.TOOLS, final=True)
+        self.assertEqual([(3, True, "puis la suite")], [(p["chunk_id"], p["frozen"], p["text"]) for p in last])
+        frozen = [p for p in first + second + last if p["frozen"]]
+        self.assertEqual(list(range(4)), [p["chunk_id"] for p in frozen])
+        self.assertEqual(1.0, frozen[2]["start"])
+
+    def test_word_split_across_chunks(self):
+        state = {}
+        para = transcript_live_pipeline(state, [chunk("nous parlons du pou", 0), chunk("voir d'achat fin et", 1),
+                                                chunk("ensuite", 2)], self.TOOLS)
+        self.assertEqual("nous parlons du pou voir d'achat fin.", para[0]["text"])
+        self.assertEqual(0.0, para[0]["start"])
+        # the end of the straddling chunk is carried over, with its timestamps
+        self.assertEqual([chunk("et", 1), chunk("ensuite", 2)], state["tail"])
+
+    def test_discarded_chunks(self):
+        state = {}
+        self.assertEqual([], transcript_live_pipeline(state, [chunk("[Musique]", 0)], self.TOOLS))
+        self.assertEqual(0, state["frozen"])
+
+
+class SplitTranscriptTests(unittest.TestCase):
+
+    def test_split_between_chunks(self):
+        transcript = [chunk("bonjour à tous", 0), chunk("nous parlons", 1)]
+        self.assertEqual(([transcript[0]], [transcript[1]]),
+                         split_transcript(transcript, unpunctuated_length("Bonjour à tous !")))
+
+    def test_split_inside_chunk(self):
+        transcript = [chunk("du pouvoir d'achat et demain", 4)]
+        before, after = split_transcript(transcript, unpunctuated_length("Du pouvoir d'achat."))
+        self.assertEqual([chunk("du pouvoir d'achat", 4)], before)
+        self.assertEqual([chunk("et demain", 4)], after)
+        # a limit inside a word never cuts it
+        before, after = split_transcript(transcript, unpunctuated_length("du pouv"))
+        self.assertEqual([chunk("du pouvoir", 4)], before)
+        self.assertEqual([chunk("d'achat et demain", 4)], after)
+
+    def test_unpunctuated_length(self):
+        self.assertEqual(unpunctuated_length("le pouvoir d'achat fin"), unpunctuated_length("Le pouvoir d'achat, fin."))
+
+
+class LiveJobStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = LiveJobStore("redis://localhost:6379")
+        self.store.redis = FakeRedis()
+        self.appended = []
+
+    def append(self, seq, final=False):
+        def update(state):
+            state.setdefault("seen", []).append(seq)
+            self.appended.append(seq)
+            return seq
+        return self.store.append("job", seq, update, final=final)
+
+    def test_appends_in_order(self):
+        with self.assertRaises(OutOfOrder):
+            self.append(1)
+        self.assertEqual(0, self.append(0))
+        # repeated append
+        self.assertIsNone(self.append(0))
+        self.assertEqual(1, self.append(1))
+        self.assertEqual([0, 1], self.store.load("job")["seen"])
+        self.assertEqual(2, self.append(2, final=True))
+        self.assertIsNone(self.append(2, final=True))
+        self.assertEqual([0, 1, 2], self.appended)
+        self.assertEqual({"seq": 3}, self.store.load("job"))
+
+    def test_appends_without_rank(self):
+        self.append(None)
+        self.append(None)
+        self.assertEqual([None, None], self.store.load("job")["seen"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+import re
+import unittest
+
+from worker.matcher import TermMatcher
+
+
+class TermMatcherTests(unittest.TestCase):
+
+    def test_same_as_regex(self):
+        terms = ["pouvoir d'achat", "achat", "Immigration", "école", "SMIC", "États-Unis", "unis"]
+        texts = ["Le pouvoir d'achat des Français baisse",
+                 "l'immigration et l'École publique",
+                 "les états-unis, réunis, achats",
+                 "smic-smicard"]
+        matcher = TermMatcher(terms)
+        for text in texts:
+            expected = [t for t in terms if re.search(r"\b" + re.escape(t) + r"\b", text, re.IGNORECASE)]
+            self.assertEqual(expected, matcher.find(text), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
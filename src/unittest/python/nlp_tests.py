@@ -1,8 +1,11 @@
+import json
+import os
 import unittest
+from pathlib import Path
 
 from icecream import ic
 
-from overton.nlp import Punct
+from overton.nlp import Punct, Pso, inference_backend
 
 
 class RebuildSentencesTest(unittest.TestCase):
@@ -14,3 +17,44 @@ class RebuildSentencesTest(unittest.TestCase):
         ic(sentences)
         self.assertEqual(len(sentences), 3)
 
+    def test_windowed_matches_sequential(self):
+        cwd = Path(os.path.dirname(os.path.realpath(__file__)))
+        with open(cwd / "paris.json", encoding="utf8") as paris:
+            transcript = json.load(paris)["transcript"]
+        text = " ".join(t["text"] for t in transcript)
+        sequential = self.punct.rebuild_sentences(text)
+        windowed = self.punct.rebuild_sentences(text, windowed=True)
+        self.assertEqual(sequential, windowed)
+
+    def test_batch_matches_windowed(self):
+        texts = ["l'immigration s'invite dans le débat tout le monde en parle",
+                 "",
+                 "sur toutes les chaînes dans tous les journaux voici notre invité bonjour"]
+        batched = self.punct.rebuild_sentences_batch(texts, batch_size=2)
+        self.assertEqual([self.punct.rebuild_sentences(text, windowed=True) for text in texts], batched)
+
+
+class PsoTest(unittest.TestCase):
+    pso = Pso()
+
+    def test_classify_batch_keeps_order(self):
+        texts = ["Il faut augmenter le SMIC.",
+                 "Le chômage des jeunes ne cesse d'augmenter dans nos quartiers, et personne ne fait rien.",
+                 "Bonjour à tous."]
+        batched = self.pso.classify_batch(texts, batch_size=2)
+        self.assertEqual(len(batched), len(texts))
+        for text, (label, score) in zip(texts, batched):
+            self.assertEqual(label, self.pso.classify(text)[0])
+
+    def test_int8_backend(self):
+        quantized = Pso("int8")
+        label, score = quantized.classify("Il faut augmenter le SMIC.")
+        self.assertEqual(label, self.pso.classify("Il faut augmenter le SMIC.")[0])
+
+
+class BackendTest(unittest.TestCase):
+
+    def test_backend_selection(self):
+        self.assertEqual("int8", inference_backend("int8"))
+        with self.assertRaises(ValueError):
+            inference_backend("tensorrt")
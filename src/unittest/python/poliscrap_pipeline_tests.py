@@ -0,0 +1,138 @@
+import datetime
+import unittest
+from unittest import mock
+
+from overton.elasticsearch import speech_id
+from poliscrap.pipelines import PoliscrapPipeline
+
+
+def speech_item(url, flags=()):
+    return {"url": url, "title": "Discours", "published": datetime.datetime(2022, 3, 1), "fulltext": "Bonjour",
+            "description": "", "category": "speech", "circumstance": "", "speaking": ["Emmanuel Macron"],
+            "keywords": [" retraites "], "persons": ["Emmanuel Macron", "Jean Castex"], "roles": ["Président"],
+            "index": "speeches", "flags": list(flags)}
+
+
+class Stats:
+    def __init__(self):
+        self.values = {}
+
+    def inc_value(self, name, count=1):
+        self.values[name] = self.values.get(name, 0) + count
+
+
+class FakeBulk:
+    """
+    Stands for helpers.streaming_bulk: answers each action with the status of its _id in `statuses` (201 by default),
+    optionally in reverse order (as when actions are retried) and raising after `fail_after` answers
+    """
+    def __init__(self, statuses=None, fail_after=None, reverse=False):
+        self.statuses = statuses or {}
+        self.fail_after = fail_after
+        self.reverse = reverse
+        self.calls = []
+
+    def __call__(self, client, actions, **kwargs):
+        actions = list(actions)
+        self.calls.append(actions)
+        for i, action in enumerate(reversed(actions) if self.reverse else actions):
+            if self.fail_after is not None and i == self.fail_after:
+                self.fail_after = None
+                raise ConnectionError("ElasticSearch is down")
+            status = self.statuses.get(action["_id"], 201)
+            yield status < 300, {action["_op_type"]: {"_id": action["_id"], "status": status}}
+
+
+class PoliscrapPipelineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = Stats()
+        self.pipeline = PoliscrapPipeline(bulk_size=2, stats=self.stats)
+        self.scan = mock.patch("poliscrap.pipelines.helpers.scan", return_value=[]).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def bulk(self, **kwargs):
+        bulk = FakeBulk(**kwargs)
+        mock.patch("poliscrap.pipelines.helpers.streaming_bulk", bulk).start()
+        return bulk
+
+    def test_bulk_action(self):
+        action = PoliscrapPipeline.bulk_action(speech_item("https://www.elysee.fr/1"))
+        self.assertEqual(("create", "speeches", speech_id("https://www.elysee.fr/1")),
+                         (action["_op_type"], action["_index"], action["_id"]))
+        self.assertEqual([{"kw": "retraites"}], action["_source"]["keywords"])
+        self.assertEqual([{"name": "Emmanuel Macron", "role": "Président"}, {"name": "Jean Castex", "role": ""}],
+                         action["_source"]["persons"])
+        update = PoliscrapPipeline.bulk_action(speech_item("https://www.elysee.fr/1", flags=["update"]))
+        self.assertEqual("index", update["_op_type"])
+        self.assertEqual(action["_id"], update["_id"])
+        self.assertEqual(action["_source"], update["_source"])
+
+    def test_flush_by_size(self):
+        bulk = self.bulk()
+        self.pipeline.process_item(speech_item("https://www.elysee.fr/1"), None)
+        self.assertEqual([], bulk.calls)
+        self.pipeline.process_item(speech_item("https://www.elysee.fr/2"), None)
+        self.pipeline.process_item(speech_item("https://www.elysee.fr/3"), None)
+        self.assertEqual([2], [len(actions) for actions in bulk.calls])
+        self.assertEqual(1, len(self.pipeline.actions))
+        self.pipeline.close_spider(None)
+        self.assertEqual([2, 1], [len(actions) for actions in bulk.calls])
+        self.assertEqual(3, self.stats.values["elasticsearch/saved"])
+
+    def test_already_indexed(self):
+        self.bulk(statuses={speech_id("https://www.elysee.fr/1"): 409})
+        self.pipeline.process_item(speech_item("https://www.elysee.fr/1"), None)
+        self.pipeline.process_item(speech_item("https://www.elysee.fr/2"), None)
+        self.assertEqual({"elasticsearch/saved": 1, "elasticsearch/existing": 1, "elasticsearch/failed": 0},
+                         self.stats.values)
+
+    def test_update(self):
+        bulk = self.bulk()
+        item = speech_item("https://www.elysee.fr/1", flags=["update"])
+        item.update({"keywords": [], "persons": [], "roles": []})
+        self.pipeline.index_item(item)
+        self.pipeline.flush()
+        action = bulk.calls[0][0]
+        # the whole document is replaced, not merged: fields now empty are cleared
+        self.assertEqual("index", action["_op_type"])
+        self.assertNotIn("doc", action)
+        self.assertFalse(action["_source"].get("keywords"))
+        self.assertEqual(1, self.stats.values["elasticsearch/saved"])
+
+    def test_failed_flush_is_retried(self):
+        bulk = self.bulk(fail_after=1)
+        self.pipeline.index_item(speech_item("https://www.elysee.fr/1"))
+        self.pipeline.index_item(speech_item("https://www.elysee.fr/2"))
+        # the action not sent is kept
+        self.assertEqual([speech_id("https://www.elysee.fr/2")], [action["_id"] for action in self.pipeline.actions])
+        self.pipeline.flush()
+        self.assertEqual([], self.pipeline.actions)
+        self.assertEqual(2, self.stats.values["elasticsearch/saved"])
+        self.assertEqual(2, len(bulk.calls))
+
+    def test_failed_flush_out_of_order(self):
+        bulk = self.bulk(fail_after=1, reverse=True)
+        self.pipeline.index_item(speech_item("https://www.elysee.fr/1"))
+        self.pipeline.index_item(speech_item("https://www.elysee.fr/2"))
+        # the second action was answered first: the first one is kept
+        self.assertEqual([speech_id("https://www.elysee.fr/1")], [action["_id"] for action in self.pipeline.actions])
+        self.pipeline.flush()
+        self.assertEqual(2, self.stats.values["elasticsearch/saved"])
+        self.assertEqual([speech_id("https://www.elysee.fr/1")], [action["_id"] for action in bulk.calls[1]])
+
+    def test_legacy_ids(self):
+        bulk = self.bulk()
+        self.scan.return_value = [{"_id": "random1", "_source": {"url": "https://www.elysee.fr/1"}},
+                                  {"_id": "random2", "_source": {"url": "https://www.elysee.fr/2"}}]
+        self.pipeline.index_item(speech_item("https://www.elysee.fr/1"))
+        self.pipeline.index_item(speech_item("https://www.elysee.fr/2", flags=["update"]))
+        # already indexed with a random id: not created again. Updated: the old document is replaced
+        self.assertEqual([("delete", "random2"), ("index", speech_id("https://www.elysee.fr/2"))],
+                         [(action["_op_type"], action["_id"]) for action in bulk.calls[0]])
+        self.assertEqual(1, self.stats.values["elasticsearch/existing"])
+        self.assertEqual(1, self.stats.values["elasticsearch/saved"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import threading
+import unittest
+
+from worker.cache import CachedPso
+
+
+class CountingPso:
+    def __init__(self):
+        self.classified = []
+
+    def classify(self, text):
+        self.classified.append(text)
+        return ("problem" if "chômage" in text else "other"), 0.9
+
+
+class CachedPsoTests(unittest.TestCase):
+
+    def test_sentences_classified_once(self):
+        pso = CountingPso()
+        cached = CachedPso(pso, "test/torch", maxsize=10)
+        texts = ["Le chômage augmente.", "Bonjour à tous.", "Le  chômage augmente. "]
+        self.assertEqual([("problem", 0.9), ("other", 0.9), ("problem", 0.9)], cached.classify_batch(texts))
+        self.assertEqual(("other", 0.9), cached.classify("Bonjour à tous."))
+        self.assertEqual(2, len(pso.classified))
+        stats = cached.stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(3, stats["misses"])
+        self.assertEqual(0.25, stats["hit_rate"])
+
+    def test_lru_eviction(self):
+        pso = CountingPso()
+        cached = CachedPso(pso, "test/torch", maxsize=2)
+        for text in ["a", "b", "a", "c", "a", "b"]:
+            cached.classify(text)
+        # "b" was evicted by "c", "a" was kept as recently used
+        self.assertEqual(["a", "b", "c", "b"], pso.classified)
+        self.assertEqual(2, cached.stats()["size"])
+
+    def test_concurrent_lookups(self):
+        cached = CachedPso(CountingPso(), "test/torch", maxsize=5, log_every=0)
+        texts = ["phrase %d" % (i % 8) for i in range(40)]
+
+        def classify():
+            for text in texts:
+                cached.classify(text)
+
+        threads = [threading.Thread(target=classify) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cached.stats()
+        self.assertEqual(8 * len(texts), stats["hits"] + stats["misses"])
+        self.assertLessEqual(stats["size"], 5)
+
+    def test_versions_do_not_mix(self):
+        cached = CachedPso(CountingPso(), "test/torch")
+        self.assertNotEqual(cached.key("Bonjour"), CachedPso(CountingPso(), "test/int8").key("Bonjour"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from worker.pso import PipelinePso, batch_pso, warm_up_pso
+
+
+class FakePipeline:
+    """
+    Text classification pipeline: "problem" for texts with "pas", records the size of each call
+    """
+    task = "sentiment-analysis"
+
+    def __init__(self):
+        self.calls = []
+        self.tokenizer = lambda texts, truncation=True: {"input_ids": [text.split() for text in texts]}
+
+    def __call__(self, texts, batch_size=1, truncation=True):
+        texts = [texts] if isinstance(texts, str) else texts
+        self.calls.append(len(texts))
+        return [{"label": "problem" if "pas" in text else "other", "score": 0.5 + len(text) / 1000}
+                for text in texts]
+
+
+class HowlerLikePso:
+    def __init__(self, nlp):
+        self.nlp = nlp
+
+    def classify(self, text):
+        outputs = self.nlp(text)
+        return outputs[0]["label"], outputs[0]["score"]
+
+
+class PipelinePsoTests(unittest.TestCase):
+
+    def test_batches_match_one_by_one(self):
+        pso = HowlerLikePso(FakePipeline())
+        texts = ["ça ne va pas du tout", "bonjour", "il ne faut pas", "le chômage baisse enfin cette année"]
+        expected = [pso.classify(text) for text in texts]
+        pso.nlp.calls.clear()
+        batched = batch_pso(pso)
+        self.assertIsInstance(batched, PipelinePso)
+        # no inference until warm-up
+        self.assertEqual([], pso.nlp.calls)
+        self.assertEqual(expected, batched.classify_batch(texts, batch_size=3))
+        # 2 batches
+        self.assertEqual([3, 1], pso.nlp.calls)
+
+    def test_warm_up_checks_batches(self):
+        class Wrapper:
+            # as CachedPso, delegates unknown attributes
+            def __init__(self, pso):
+                self.pso = pso
+
+            def __getattr__(self, name):
+                return getattr(self.pso, name)
+
+        batched = batch_pso(HowlerLikePso(FakePipeline()))
+        warm_up_pso(Wrapper(batched), "ça ne va pas")
+        self.assertTrue(batched.batched)
+
+        class Relabelling(HowlerLikePso):
+            def classify(self, text):
+                return "other", 1.0
+
+        batched = batch_pso(Relabelling(FakePipeline()))
+        warm_up_pso(Wrapper(batched), "ça ne va pas")
+        self.assertFalse(batched.batched)
+        self.assertEqual([("other", 1.0)], batched.classify_batch(["ça ne va pas"]))
+
+    def test_left_as_is(self):
+        class WithoutPipeline:
+            def classify(self, text):
+                return "other", 1.0
+
+        pso = WithoutPipeline()
+        self.assertIs(pso, batch_pso(pso))
+
+        class OtherTask(FakePipeline):
+            task = "ner"
+
+        pso = HowlerLikePso(OtherTask())
+        self.assertIs(pso, batch_pso(pso))
+
+
+if __name__ == '__main__':
+    unittest.main()
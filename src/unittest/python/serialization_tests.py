@@ -0,0 +1,54 @@
+import json
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from kombu.serialization import dumps, loads
+
+from worker.serialization import COMPRESSORS, register_serializers, serializer_name, decode_stored, stored_as_json
+
+
+class SerializationTests(unittest.TestCase):
+
+    def test_compressed_round_trip(self):
+        data = {"sentences": [{"text": "Le pouvoir d'achat des Français", "type": "problem"}] * 100, "id": None}
+        names = register_serializers()
+        self.assertIn("json-gzip", names)
+        for name in names:
+            content_type, content_encoding, payload = dumps(data, serializer=name)
+            self.assertEqual(data, loads(payload, content_type, content_encoding, accept=[content_type]), name)
+        self.assertLess(len(dumps(data, serializer="json-gzip")[2]), len(dumps(data, serializer="json")[2]))
+
+    def test_stored_results(self):
+        # results stored by workers whatever their serializer are recognized
+        meta = {"status": "SUCCESS", "result": [{"text": "Le pouvoir d'achat", "score": 0.5}], "traceback": None}
+        for name in register_serializers():
+            payload = dumps(meta, serializer=name)[2]
+            payload = payload.encode("utf8") if isinstance(payload, str) else payload
+            self.assertEqual(meta, decode_stored(payload), name)
+            self.assertEqual(meta, json.loads(stored_as_json(payload)), name)
+        payload = dumps(meta, serializer="json")[2].encode("utf8")
+        self.assertIs(payload, stored_as_json(payload))
+
+    def test_threads(self):
+        # compressors must not be shared between threads (worker --pool=threads, Flask threads)
+        payloads = [os.urandom(100000) + bytes([i]) * 1000000 for i in range(8)]
+        for name, (compress, decompress) in COMPRESSORS.items():
+            def round_trip(i):
+                payload = payloads[i % len(payloads)]
+                return decompress(compress(payload)) == payload
+
+            with ThreadPoolExecutor(8) as executor:
+                self.assertTrue(all(executor.map(round_trip, range(32))), name)
+
+    def test_serializer_name(self):
+        self.assertEqual("json", serializer_name("json"))
+        self.assertEqual("msgpack-gzip", serializer_name("msgpack", "gzip"))
+        with self.assertRaises(ValueError):
+            serializer_name("pickle")
+        with self.assertRaises(ValueError):
+            serializer_name("json", "lz4")
+
+
+if __name__ == '__main__':
+    unittest.main()
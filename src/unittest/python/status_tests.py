@@ -0,0 +1,94 @@
+import unittest
+
+from worker.status import BatchProgress, TaskStatusStore
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = str(value).encode()
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({name: str(value).encode() for name, value in mapping.items()})
+
+    def hincrby(self, key, name, amount=1):
+        value = int(self.data.setdefault(key, {}).get(name, 0)) + amount
+        self.data[key][name] = str(value).encode()
+        return value
+
+    def hmget(self, key, *names):
+        return [self.data.get(key, {}).get(name) for name in names]
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TaskStatusStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.statuses = TaskStatusStore("redis://localhost:6379")
+        self.statuses.redis = FakeRedis()
+
+    def test_get_many(self):
+        self.statuses.set("t1", "STARTED")
+        self.statuses.set("t3", "SUCCESS")
+        self.statuses.set("t1", "FAILURE")
+        self.assertEqual(["FAILURE", None, "SUCCESS"], self.statuses.get_many(["t1", "t2", "t3"]))
+        self.assertEqual(["overton:status:t1", "overton:status:t3"], sorted(self.statuses.redis.data))
+
+    def test_no_tasks(self):
+        self.statuses.redis = None
+        self.assertEqual([], self.statuses.get_many([]))
+
+
+class BatchProgressTests(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = BatchProgress("redis://localhost:6379")
+        self.batches.redis = FakeRedis()
+
+    def test_last_chunk_notifies(self):
+        self.batches.start("b1", 3, "https://example.org/done")
+        self.assertIsNone(self.batches.chunk_done("b1"))
+        self.assertIsNone(self.batches.chunk_done("b1"))
+        self.assertEqual(("https://example.org/done", "SUCCESS"), self.batches.chunk_done("b1"))
+        self.assertEqual({}, self.batches.redis.data)
+
+    def test_failed_chunk(self):
+        self.batches.start("b2", 2, "https://example.org/done")
+        self.assertIsNone(self.batches.chunk_done("b2", failed=True))
+        self.assertEqual(("https://example.org/done", "FAILURE"), self.batches.chunk_done("b2"))
+
+    def test_unknown_batch(self):
+        self.assertIsNone(self.batches.chunk_done("expired"))
+        self.assertEqual({}, self.batches.redis.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from howler import helper_get_subsequences
+from nltk import word_tokenize
+
+from worker.categorizer import build_subterm_index
+from worker.matcher import TermMatcher
+
+
+def linear_scan(sentence_terms):
+    # sub-terms as computed for each sentence before build_subterm_index
+    all_subsequences = []
+    for term in sentence_terms:
+        all_subsequences.extend(helper_get_subsequences(term))
+        if " " in term:
+            all_subsequences.extend(word_tokenize(term))
+    return all_subsequences
+
+
+class SubtermIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        # a small classification: extracted terms, their category and how they were matched
+        self.terms = {
+            "pouvoir d'achat": {"category": "économie", "match": "direct"},
+            "pouvoir": {"category": None, "match": "embedding"},
+            "achat": {"category": "économie", "match": "direct"},
+            "immigration clandestine": {"category": "immigration", "match": "embedding"},
+            "immigration": {"category": "immigration", "match": "direct"},
+            "clandestine": {"category": None, "match": "embedding"},
+            "réchauffement climatique": {"category": "environnement", "match": "direct"},
+            "climatique": {"category": "environnement", "match": "embedding"},
+            "smic": {"category": "économie", "match": "direct"},
+        }
+        self.sentences = ["Le pouvoir d'achat des Français baisse, le pouvoir aussi",
+                          "L'immigration clandestine et l'immigration légale",
+                          "Le réchauffement climatique, une urgence climatique",
+                          "Augmenter le SMIC",
+                          "Rien à signaler"]
+
+    def test_same_as_linear_scan(self):
+        index = build_subterm_index(self.terms)
+        matcher = TermMatcher(self.terms)
+        for text in self.sentences:
+            sentence_terms = matcher.find(text)
+            subsequences = linear_scan(sentence_terms)
+            indexed = set().union(*(index[term] for term in sentence_terms))
+            for term in self.terms:
+                self.assertEqual(term in subsequences, term in indexed, (text, term))
+            expected = [t for t in sentence_terms if t not in subsequences or self.terms[t]["match"] == "direct"]
+            kept = [t for t in sentence_terms if t not in indexed or self.terms[t]["match"] == "direct"]
+            self.assertEqual(expected, kept, text)
+
+    def test_only_extracted_terms(self):
+        index = build_subterm_index(self.terms)
+        self.assertEqual(set(self.terms), set(index))
+        self.assertIn("immigration", index["immigration clandestine"])
+        self.assertIn("clandestine", index["immigration clandestine"])
+        for contained in index.values():
+            self.assertLessEqual(contained, set(self.terms))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import shutil
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+from overton.termsuite import TermSuitePool, TermSuiteError, parse_json, parse_tsv, run_termsuite, terms_by_document
+
+TS_DIR = Path(__file__).resolve().parents[2] / "main" / "ts"
+# as in ts_wrapper.sh and ts_daemon.sh
+TS_JAR = Path.home() / ".local" / "termsuite" / "termsuite-core-3.0.10.jar"
+TREETAGGER = Path.home() / ".local" / "treetagger"
+
+# speaks the protocol of TermSuiteDaemon.java: one term per word of the text, "crash" kills the daemon, "hang"
+# never answers, "fail" and "fail late" report an error before or after some TSV lines. Batches are answered in JSON,
+# with a term per lowercase word without final "s" (as lemmas) and its occurrences
+FAKE_DAEMON = r"""
+import json
+import sys
+import time
+out = sys.stdout.buffer
+out.write(b"READY\n"); out.flush()
+for command in sys.stdin.buffer:
+    if command.startswith(b"EXTRACT_BATCH"):
+        texts = [sys.stdin.buffer.read(int(sys.stdin.buffer.readline())).decode("utf8")
+                 for _ in range(int(command.split()[1]))]
+        occurrences = [{"tid": "n: " + word.lower().rstrip("s"), "file": i + 1, "text": word}
+                       for i, text in enumerate(texts) for word in text.split()]
+        keys = sorted(set(occurrence["tid"] for occurrence in occurrences))
+        output = {"terms": [{"key": key, "props": {"pilot": key[3:], "specificity": 2.0}} for key in keys],
+                  "occurrences": occurrences,
+                  "input_sources": {str(i + 1): "/dev/shm/ts/fr/doc-%06d.txt" % i for i in range(len(texts))}}
+        out.write(b"OK\n" + json.dumps(output, indent=2).encode("utf8") + b"\n.\n"); out.flush()
+        continue
+    else:
+        text = sys.stdin.buffer.read(int(command.split()[1])).decode("utf8")
+    if text == "crash":
+        sys.exit(1)
+    if text == "hang":
+        time.sleep(60)
+    if text == "fail":
+        out.write(b"ERROR no corpus\n"); out.flush()
+        continue
+    out.write(b"OK\n#\ttype\tpilot\tlemma\tspec\tfreq\n")
+    # as TermSuite, the last TSV line may have no new line
+    out.write("\n".join("%d\tT\t%s\t%s\t2.0\t1" % (i + 1, word, word.lower())
+                        for i, word in enumerate(text.split())).encode("utf8"))
+    if text == "fail late":
+        out.write(b"\nERROR cannot export\n"); out.flush()
+        continue
+    out.write(b"\n.\n"); out.flush()
+"""
+
+
+class TermSuitePoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = TermSuitePool([sys.executable, "-c", FAKE_DAEMON], size=2, timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_extract(self):
+        terms = self.pool.extract("Pouvoir d'achat été")
+        self.assertEqual(["Pouvoir", "d'achat", "été"], [t["pilot"] for t in terms])
+        self.assertEqual("2.0", terms[0]["spec"])
+
+    def test_concurrent_extractions(self):
+        results = {}
+
+        def extract(n):
+            results[n] = self.pool.extract(" ".join(["mot%d" % n] * n))
+
+        threads = [threading.Thread(target=extract, args=(n,)) for n in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for n, terms in results.items():
+            self.assertEqual(["mot%d" % n] * n, [t["pilot"] for t in terms])
+        self.assertLessEqual(len(self.pool._daemons), 2)
+
+    def test_errors(self):
+        with self.assertRaises(TermSuiteError):
+            self.pool.extract("fail")
+        daemon = self.pool._daemons[0]
+        with self.assertRaisesRegex(TermSuiteError, "cannot export"):
+            self.pool.extract("fail late")
+        # errors reported by the daemon do not kill it
+        self.assertEqual([daemon], self.pool._daemons)
+        self.assertTrue(daemon.alive())
+        with self.assertRaises(TermSuiteError):
+            self.pool.extract("crash")
+        # daemons are restarted when needed
+        self.assertEqual(["encore"], [t["pilot"] for t in self.pool.extract("encore")])
+
+    def test_timeout(self):
+        pool = TermSuitePool([sys.executable, "-c", FAKE_DAEMON], size=1, timeout=0.5)
+        try:
+            with self.assertRaises(TermSuiteError):
+                pool.extract("hang")
+            # the hung daemon is killed, its slot is given to a new one
+            self.assertEqual(["encore"], [t["pilot"] for t in pool.extract("encore")])
+            self.assertEqual(1, len(pool._daemons))
+        finally:
+            pool.close()
+
+    def test_large_text(self):
+        # larger than pipe buffers
+        text = " ".join("mot%d" % i for i in range(50000))
+        self.assertEqual(50000, len(self.pool.extract(text)))
+
+    def test_extract_batch(self):
+        terms = self.pool.extract_batch(["Le pouvoir", "pouvoirs et achat pouvoir", ""])
+        self.assertEqual([{"le", "pouvoir"}, {"pouvoir", "et", "achat"}, set()],
+                         [set(t["pilot"] for t in doc) for doc in terms])
+        # occurrences of both forms are counted
+        self.assertEqual(2, [t for t in terms[1] if t["pilot"] == "pouvoir"][0]["doc_freq"])
+        self.assertEqual(2.0, terms[0][0]["spec"])
+
+    def test_parse_json(self):
+        output = {"terms": [{"key": "na: pouvoir achat", "props": {"pilot": "pouvoir d'achat", "freq": 3}},
+                            {"key": "n: achat", "props": {"pilot": "achat", "freq": 2}}],
+                  "occurrences": [{"tid": "na: pouvoir achat", "file": 1}, {"tid": "na: pouvoir achat", "file": 2},
+                                  {"tid": "na: pouvoir achat", "file": 2}, {"tid": "n: achat", "file": 3},
+                                  {"tid": "n: achat", "file": 3}],
+                  "input_sources": {"1": "fr/doc-000000.txt", "2": "fr/doc-000001.txt", "3": "fr/doc-000002.txt"}}
+        texts = ["Le pouvoir d'achat", "les pouvoirs d'achat et le pouvoir d'achat", "des achats, l'achat"]
+        by_document = terms_by_document(texts, *parse_json(output))
+        self.assertEqual([[("pouvoir d'achat", 1)], [("pouvoir d'achat", 2)], [("achat", 2)]],
+                         [[(t["pilot"], t["doc_freq"]) for t in doc] for doc in by_document])
+        # without occurrences, terms are found by their pilot form, inside larger terms too
+        terms, occurrences = parse_json({"terms": output["terms"]})
+        self.assertIsNone(occurrences)
+        self.assertEqual([["pouvoir d'achat", "achat"], ["pouvoir d'achat", "achat"], ["achat"]],
+                         [[t["pilot"] for t in doc] for doc in terms_by_document(texts, terms, occurrences)])
+
+    def test_terms_by_document(self):
+        terms = [{"pilot": "pouvoir d'achat", "spec": "3.1"}, {"pilot": "États-Unis", "spec": "2.5"},
+                 {"pilot": "achat", "spec": "1.2"}]
+        texts = ["Le pouvoir d'achat et l'achat", "les états-unis", "achats"]
+        by_document = terms_by_document(texts, terms)
+        self.assertEqual([["pouvoir d'achat", "achat"], ["États-Unis"], []],
+                         [[t["pilot"] for t in doc] for doc in by_document])
+        self.assertEqual(2, by_document[0][1]["doc_freq"])
+
+    def test_parse_tsv(self):
+        self.assertEqual([{"type": "T", "pilot": "école"}], parse_tsv(["#\ttype\tpilot", "1\tT\técole", ""]))
+
+
+@unittest.skipUnless(TS_JAR.exists() and TREETAGGER.exists() and shutil.which("javac"),
+                     "requires TermSuite 3.0.10, TreeTagger and a JDK (11 to 23)")
+class TermSuiteIntegrationTests(unittest.TestCase):
+    """
+    Builds and runs TermSuiteDaemon.java against the installed TermSuite: its output shall be the output
+    of the forked command line extractor (ts_wrapper.sh)
+    """
+    TEXTS = ["Le pouvoir d'achat des Français baisse. Le gouvernement promet une hausse du pouvoir d'achat.",
+             "Les réformes des retraites et la réforme de l'assurance chômage sont contestées.",
+             "Les énergies renouvelables et le réchauffement climatique."]
+
+    @staticmethod
+    def terms(terms):
+        return sorted((t["pilot"], t["freq"]) for t in terms)
+
+    def test_same_as_command_line(self):
+        pool = TermSuitePool([str(TS_DIR / "ts_daemon.sh")], size=1, stderr=sys.stderr)
+        try:
+            for text in self.TEXTS:
+                expected = parse_tsv(run_termsuite(TS_DIR / "ts_wrapper.sh", [text]))
+                self.assertTrue(expected)
+                self.assertEqual(self.terms(expected), self.terms(pool.extract(text)))
+            expected = parse_json(run_termsuite(TS_DIR / "ts_wrapper.sh", self.TEXTS, output="json"))
+            found = parse_json(pool.extract_batch_json(self.TEXTS))
+            self.assertEqual(expected, found)
+            # the output has occurrences: inflected forms are found in each document
+            by_document = terms_by_document(self.TEXTS, *found)
+            self.assertIn("réforme", [t["pilot"].lower() for t in by_document[1]])
+            # the same daemon served all requests
+            self.assertEqual(1, len(pool._daemons))
+        finally:
+            pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
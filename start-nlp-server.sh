@@ -1,6 +1,8 @@
 #!/bin/bash
 # Starts flask server for content annotation
 export FLASK_APP=src/main/flask/app.py
+# the worker tasks use some modules of the overton package (see Dockerfile)
+export PYTHONPATH=src/main/python${PYTHONPATH:+:$PYTHONPATH}
 export FLASK_ENV=production
 export FLASK_DEBUG=0
 flask run --host=0.0.0.0 --port=5000
@@ -6,10 +6,17 @@ docker-compose -f docker-compose-redis-only.yml up -d
 
 echo "Starting Celery worker"
 cd src/main/flask
+# the worker uses some modules of the overton package (see Dockerfile)
+export PYTHONPATH=../python${PYTHONPATH:+:$PYTHONPATH}
 # use --pool=solo for transformers (https://github.com/huggingface/transformers/issues/7516)
 celery -A tasks.client worker --concurrency=1 --pool=solo &
 ## Enable multi-threading if all ENABLE_DEEP_* are set to False
 #celery -A tasks.client worker --concurrency=4 &
+## With MICRO_BATCHING=yes, deep models with a batch method are called from a single thread, which batches the inputs
+## of all tasks
+#MICRO_BATCHING=yes celery -A tasks.client worker --concurrency=8 --pool=threads &
+## Multi-core: models are loaded once before forking and shared by the worker processes, each using 1 torch thread
+#WORKER_PRELOAD_MODELS=yes TORCH_THREADS_PER_CHILD=1 celery -A tasks.client worker --concurrency=16 --pool=prefork &
 # use `cd src/main/python/worker; celery -A tasks.client control shutdown` to stop workers
 # You may also
 # `use celery -A tasks.client flower`